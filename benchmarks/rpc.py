@@ -0,0 +1,403 @@
+#!/usr/bin/python3
+# rpc.py
+# Benchmark of the client/daemon RPC layer
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+""" Benchmark of the RPC layer between blivet-gui and blivet-gui-daemon
+
+    :class:`~blivetgui.communication.server.BlivetUtilsServer` is started in a
+    thread on a temporary Unix socket with a fake BlivetUtils working with a
+    synthetic devicetree (N disks with M partitions each and a VG with K LVs),
+    :class:`~blivetgui.communication.client.BlivetGUIClient` connects to it the
+    same way blivet-gui does. No root privileges or real disks are needed.
+
+    Measured are round trips and bytes on the wire for one refresh of the views
+    (requests done by the device list, partition list and parents list) and
+    latency percentiles of single remote_call and remote_param requests.
+
+    Usage: PYTHONPATH=. python3 benchmarks/rpc.py [-d DISKS] [-p PARTITIONS] [-l LVS] [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from blivet.size import Size  # pylint: disable=wrong-import-position
+
+from blivetgui.blivet_utils import BlivetUtils  # pylint: disable=wrong-import-position
+from blivetgui.communication import protocol  # pylint: disable=wrong-import-position
+from blivetgui.communication.client import BlivetGUIClient  # pylint: disable=wrong-import-position
+from blivetgui.communication.proxy_utils import ProxyDataContainer  # pylint: disable=wrong-import-position
+from blivetgui.communication.server import BlivetUtilsServer  # pylint: disable=wrong-import-position
+from blivetgui.logs import set_logging  # pylint: disable=wrong-import-position
+
+# ---------------------------------------------------------------------------- #
+
+# attributes prefetched by the views (ListPartitions.store_attrs and ListParents.child_attrs,
+# the modules can't be imported without Gtk)
+PARTITION_ATTRS = ("id", "name", "type", "size", "format.type", "format.name", "format.label",
+                   "format.mountable", "format.mountpoint", "format.system_mountpoint")
+PARENT_ATTRS = ("id", "name", "type")
+
+# ---------------------------------------------------------------------------- #
+
+
+class FakeFormat:
+    """ Format with the attributes blivet-gui reads """
+
+    def __init__(self, fmt_type=None, name="Unknown", mountpoint=None, label=None):
+        self.type = fmt_type
+        self.name = name
+        self.label = label
+        self.mountpoint = mountpoint
+        self.mountable = mountpoint is not None
+        self.system_mountpoint = None
+        self.uuid = None
+        self.exists = True
+        self.hidden = False
+        self.resizable = False
+
+    def __str__(self):
+        return "%s format" % self.name
+
+
+class FakeDevice:
+    """ Device with the attributes blivet-gui reads """
+
+    _ids = iter(range(1, 2 ** 31))
+
+    def __init__(self, name, dev_type, size, fmt=None, parents=None, is_disk=False):
+        self.id = next(self._ids)
+        self.name = name
+        self.path = "/dev/%s" % name
+        self.type = dev_type
+        self.size = size
+        self.format = fmt or FakeFormat()
+        self.parents = parents or []
+        self.children = []
+        self.is_disk = is_disk
+        self.exists = True
+        self.protected = False
+        self.removable = False
+        self.model = "Benchmark disk" if is_disk else None
+        self.free_space = Size(0)
+
+        if dev_type == "partition":
+            self.disk = self.parents[0]
+
+        for parent in self.parents:
+            parent.children.append(self)
+
+    @property
+    def pvs(self):
+        return self.parents
+
+    @property
+    def disks(self):
+        if self.is_disk:
+            return [self]
+        return list({disk.id: disk for parent in self.parents for disk in parent.disks}.values())
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.type, self.name, self.id)
+
+
+class FakeDevicetree:
+
+    def __init__(self, devices):
+        self.devices = devices
+        self._by_id = {device.id: device for device in devices}
+        self.actions = []
+
+    def get_device_by_id(self, device_id):
+        return self._by_id.get(device_id)
+
+
+class FakeStorage:
+    """ Synthetic devicetree: disks with partitions, last partition of every disk is a PV of one VG """
+
+    def __init__(self, disks, partitions, lvs):
+        devices = []
+        self.disks = []
+        pvs = []
+
+        for i in range(disks):
+            disk = FakeDevice("bd%d" % i, "disk", Size("1 TiB"), FakeFormat("disklabel", "partition table"),
+                              is_disk=True)
+            self.disks.append(disk)
+            devices.append(disk)
+
+            for j in range(partitions):
+                if lvs and j == partitions - 1:
+                    fmt = FakeFormat("lvmpv", "physical volume (LVM)")
+                else:
+                    fmt = FakeFormat("ext4", "ext4", mountpoint="/mnt/bd%dp%d" % (i, j + 1), label="part%d" % j)
+                part = FakeDevice("bd%dp%d" % (i, j + 1), "partition", Size("10 GiB"), fmt, parents=[disk])
+                devices.append(part)
+                if fmt.type == "lvmpv":
+                    pvs.append(part)
+
+        self.vgs = []
+        if lvs and pvs:
+            vg = FakeDevice("benchvg", "lvmvg", Size("10 GiB") * len(pvs), parents=pvs)
+            self.vgs.append(vg)
+            devices.append(vg)
+            for k in range(lvs):
+                devices.append(FakeDevice("benchvg-lv%d" % k, "lvmlv", Size("1 GiB"),
+                                          FakeFormat("xfs", "xfs", mountpoint="/mnt/lv%d" % k), parents=[vg]))
+
+        self.mdarrays = []
+        self.btrfs_volumes = []
+        self.stratis_pools = []
+
+        self.devices = devices
+        self.devicetree = FakeDevicetree(devices)
+
+    @property
+    def next_id(self):
+        return next(FakeDevice._ids)
+
+
+class FakeBlivetUtils(BlivetUtils):
+    """ BlivetUtils working with :class:`FakeStorage` instead of blivet.Blivet """
+
+    def __init__(self, storage):
+        # pylint: disable=super-init-not-called
+
+        self._resizable_filesystems = None
+        self._init_change_tracking()
+
+        self.storage = storage
+        _log_file, self.log = set_logging(component="blivet-gui-utils")
+
+    def get_disk_children(self, blivet_device):
+        # fake disks don't have parted partitions -- no free space or logical partitions
+        return ProxyDataContainer(partitions=list(blivet_device.children), extended=None, logicals=None)
+
+    def change(self):
+        """ Simulate a devicetree change, all values cached by the client are dropped """
+
+        self._generation += 1
+
+
+class BenchmarkServer(socketserver.UnixStreamServer):
+    """ Server serving one client with the prepared (fake) BlivetUtils """
+
+    quit = False
+    other_running = False
+
+    def __init__(self, sock_file, blivet_utils):
+        super().__init__(sock_file, BenchmarkHandler)
+        self.blivet_utils = blivet_utils
+
+
+class BenchmarkHandler(BlivetUtilsServer):
+
+    def setup(self):
+        super().setup()
+        # skip the "init" request, BlivetUtils is already created
+        self.blivet_utils = self.server.blivet_utils
+
+
+class WireCounter:
+    """ Count messages and bytes sent by the client and the server """
+
+    def __init__(self, client_sock):
+        self.client_sock = client_sock
+        self.reset()
+        self._send_message = protocol.send_message
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def _counting_send(self, sock, request_id, encoded, generation=0):
+        length = protocol.HEADER.size + len(encoded[1])
+        if sock is self.client_sock:
+            self.requests += 1
+            self.bytes_sent += length
+        else:
+            self.bytes_received += length
+        return self._send_message(sock, request_id, encoded, generation)
+
+    def __enter__(self):
+        protocol.send_message = self._counting_send
+        return self
+
+    def __exit__(self, *args):
+        protocol.send_message = self._send_message
+
+# ---------------------------------------------------------------------------- #
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+
+    def _at(pct):
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+
+    return {"count": len(samples), "p50_ms": _at(50), "p90_ms": _at(90), "p99_ms": _at(99),
+            "max_ms": samples[-1] * 1000}
+
+
+def refresh_views(client):
+    """ Requests done by the views after a devicetree change
+
+        Mirrors ListDevices.load_devices, ListPartitions.update_partitions_list (for
+        the first disk and the VG) and ListParents.update_parents_list (for the VG)
+        without the Gtk parts.
+    """
+
+    client.remote_call("get_device_changes", None)
+
+    # list of devices
+    snapshot = client.remote_call("get_device_snapshot")
+    device_ids = snapshot.disks + snapshot.lvm + snapshot.raid + snapshot.btrfs + snapshot.stratis
+    devices = dict(zip(device_ids, client.remote_call("get_devices_by_id", device_ids)))
+    for device in devices.values():
+        device.cache()
+
+    selected = devices[snapshot.disks[0]]
+
+    # partitions of the selected disk and of the VG
+    for children in (client.remote_call("get_disk_children", selected).partitions,
+                     *(client.remote_call("get_children", devices[vg_id]) for vg_id in snapshot.lvm)):
+        for child in children:
+            child.prefetch(*PARTITION_ATTRS)
+            child.cache()
+            for attr in PARTITION_ATTRS:
+                obj = child
+                for part in attr.split("."):
+                    obj = getattr(obj, part)
+
+    # parents of the VG
+    for vg_id in snapshot.lvm:
+        for root in client.remote_call("get_roots", devices[vg_id]):
+            for child in client.remote_call("get_disk_children", root).partitions:
+                child.prefetch(*PARENT_ATTRS)
+                child.cache()
+
+    return devices
+
+
+def run(args):
+    storage = FakeStorage(args.disks, args.partitions, args.lvs)
+    utils = FakeBlivetUtils(storage)
+
+    tempdir = tempfile.mkdtemp()
+    sock_file = os.path.join(tempdir, "blivet-gui.sock")
+    server = BenchmarkServer(sock_file, utils)
+    server_thread = threading.Thread(target=server.handle_request, daemon=True)
+    server_thread.start()
+
+    client = BlivetGUIClient(sock_file)
+    results = {"config": {"disks": args.disks, "partitions": args.partitions, "lvs": args.lvs,
+                          "devices": len(storage.devices), "rounds": args.rounds},
+               "system": {"python": platform.python_version(), "machine": platform.machine()}}
+
+    try:
+        with WireCounter(client.sock) as counter:
+            # view refresh, the devicetree changes before every refresh
+            durations = []
+            stats = []
+            for _i in range(args.refreshes):
+                utils.change()
+                counter.reset()
+                start = time.perf_counter()
+                devices = refresh_views(client)
+                durations.append(time.perf_counter() - start)
+                stats.append((counter.requests, counter.bytes_sent, counter.bytes_received))
+                del devices
+
+            results["refresh"] = dict(_percentiles(durations),
+                                      round_trips=stats[-1][0],
+                                      bytes_sent=stats[-1][1],
+                                      bytes_received=stats[-1][2])
+
+            # single requests
+            disk_id = storage.disks[0].id
+            disk = client.remote_call("get_devices_by_id", [disk_id])[0]
+
+            for name, request in (("remote_call", lambda: client.remote_call("get_devices_by_id", [disk_id])),
+                                  ("remote_param", lambda: client.remote_param(disk.proxy_id, "name")),
+                                  ("remote_params", lambda: client.remote_params(disk.proxy_id, PARTITION_ATTRS)),
+                                  ("get_device_snapshot", lambda: client.remote_call("get_device_snapshot"))):
+                rounds = args.rounds if name != "get_device_snapshot" else max(args.rounds // 100, 10)
+                counter.reset()
+                samples = []
+                for _i in range(rounds):
+                    start = time.perf_counter()
+                    request()
+                    samples.append(time.perf_counter() - start)
+
+                results[name] = dict(_percentiles(samples),
+                                     bytes_sent=counter.bytes_sent // rounds,
+                                     bytes_received=counter.bytes_received // rounds)
+
+            stats = client.proxy_stats()
+            results["proxies"] = {key: stats[key] for key in stats}
+    finally:
+        client.quit()
+        server_thread.join()
+        server.server_close()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="blivet-gui RPC benchmark")
+    parser.add_argument("-d", "--disks", type=int, default=10, help="number of disks")
+    parser.add_argument("-p", "--partitions", type=int, default=8, help="number of partitions on every disk")
+    parser.add_argument("-l", "--lvs", type=int, default=50, help="number of LVs")
+    parser.add_argument("-r", "--refreshes", type=int, default=20, help="number of view refreshes")
+    parser.add_argument("-n", "--rounds", type=int, default=2000, help="number of single requests")
+    parser.add_argument("-o", "--output", help="save the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    refresh = results["refresh"]
+    print("%d devices" % results["config"]["devices"])
+    print("view refresh: %d round trips, %d B sent, %d B received, p50 %.2f ms, p99 %.2f ms" %
+          (refresh["round_trips"], refresh["bytes_sent"], refresh["bytes_received"],
+           refresh["p50_ms"], refresh["p99_ms"]))
+
+    print("%-20s %10s %10s %10s %12s %12s" % ("request", "p50 ms", "p90 ms", "p99 ms", "B sent", "B received"))
+    for name in ("remote_call", "remote_param", "remote_params", "get_device_snapshot"):
+        res = results[name]
+        print("%-20s %10.3f %10.3f %10.3f %12d %12d" %
+              (name, res["p50_ms"], res["p90_ms"], res["p99_ms"], res["bytes_sent"], res["bytes_received"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
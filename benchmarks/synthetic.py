@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+# synthetic.py
+# Generator of large synthetic devicetrees
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+""" Generator of synthetic devicetrees for scale testing
+
+    Builds a :class:`blivet.Blivet` instance with a devicetree described by a
+    compact spec without any real hardware or root privileges. Disks are
+    :class:`blivet.devices.DiskFile` instances backed by sparse files in a
+    temporary directory (so parted can work with their disklabels), everything
+    else (partitions, VGs, LVs, MD arrays, btrfs volumes and subvolumes, LUKS)
+    are blivet's non-existent devices scheduled for creation the same way
+    blivet-gui schedules them. Nothing is ever written to the backing files.
+
+    Use it with :class:`~blivetgui.blivet_utils.BlivetUtils` using its
+    `storage` argument::
+
+        with SyntheticDevicetree(spec) as storage:
+            utils = BlivetUtils(storage=storage)
+
+    Spec is a dict (or a JSON file) with "disks", "vgs", "mdarrays" and "btrfs"
+    lists, every entry can have "count" to repeat it and "%d" in names and
+    mountpoints is replaced by the index of the repetition::
+
+        {"disks": [{"count": 100, "size": "100 GiB", "label": "gpt",
+                    "partitions": [{"size": "1 GiB", "format": "ext4", "mountpoint": "/data%d"},
+                                   {"size": "20 GiB", "format": "lvmpv", "encrypted": true}]},
+                   {"count": 4, "size": "10 GiB", "label": null, "format": "mdmember"},
+                   {"count": 2, "size": "10 GiB", "label": null, "format": "btrfs"}],
+         "vgs": [{"name": "data", "pvs": "all",
+                  "lvs": [{"count": 500, "name": "lv%d", "size": "1 GiB", "format": "xfs"}]}],
+         "mdarrays": [{"name": "md%d", "count": 2, "level": "raid1", "members": 2, "format": "ext4"}],
+         "btrfs": [{"name": "pool", "members": 2, "data_level": "raid1", "subvolumes": 10}]}
+
+    "pvs" and "members" are either "all" or number of devices taken from the not
+    yet used devices with the right format ("lvmpv", "mdmember" or "btrfs") in
+    the order they were created.
+
+    Usage: PYTHONPATH=. python3 benchmarks/synthetic.py [-d DISKS] [-p PARTITIONS] [-l LVS] [-s SPEC]
+"""
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import blivet  # pylint: disable=wrong-import-position
+from blivet.devices import DiskFile, LUKSDevice  # pylint: disable=wrong-import-position
+from blivet.formats import get_format  # pylint: disable=wrong-import-position
+from blivet.partitioning import do_partitioning  # pylint: disable=wrong-import-position
+from blivet.size import Size  # pylint: disable=wrong-import-position
+
+# ---------------------------------------------------------------------------- #
+
+PASSPHRASE = "synthetic"
+
+MEMBER_FORMATS = ("lvmpv", "mdmember", "btrfs")
+
+
+def simple_spec(disks=10, partitions=8, lvs=50):
+    """ Spec similar to the one used by the RPC benchmark
+
+        N disks with M partitions each, last partition of every disk is a PV
+        in one VG with K LVs.
+    """
+
+    parts = [{"count": partitions - 1, "size": "1 GiB", "format": "ext4"}] if partitions > 1 else []
+    parts.append({"size": "%d GiB" % (lvs + 1), "format": "lvmpv"})
+
+    return {"disks": [{"count": disks, "size": "%d GiB" % (partitions + lvs + 2), "label": "gpt",
+                       "partitions": parts}],
+            "vgs": [{"name": "benchvg", "pvs": "all",
+                     "lvs": [{"count": lvs, "name": "lv%d", "size": "1 GiB", "format": "xfs"}]}]}
+
+
+def _expand(entries):
+    """ Yield (index, entry) for every entry repeated "count" times """
+
+    for entry in entries or []:
+        for index in range(entry.get("count", 1)):
+            yield index, entry
+
+
+def _name(entry, index, key="name"):
+    value = entry.get(key)
+    if value and "%d" in value:
+        return value % index
+    return value
+
+
+class SyntheticDevicetree:
+    """ Build a :class:`blivet.Blivet` instance with a synthetic devicetree """
+
+    def __init__(self, spec, directory=None):
+        """
+            :param spec: devicetree spec (see module docstring)
+            :type spec: dict
+            :param directory: directory for the disk backing files, a temporary
+                              directory is created (and removed) if not specified
+            :type directory: str
+
+        """
+
+        self.spec = spec
+
+        self._own_directory = directory is None
+        self.directory = directory
+
+        self.storage = None
+
+        # unused devices that can be used as PVs or MD/btrfs members
+        self._members = collections.defaultdict(list)
+
+    def __enter__(self):
+        return self.build()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def build(self):
+        """ Build the devicetree
+
+            :returns: storage with the synthetic devicetree
+            :rtype: :class:`blivet.Blivet`
+
+        """
+
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="blivet-gui-synthetic-")
+
+        self.storage = blivet.Blivet()
+
+        partitions = []
+        for num, (_index, entry) in enumerate(_expand(self.spec.get("disks"))):
+            disk = self._add_disk("disk%d" % num, Size(entry["size"]))
+
+            label = entry.get("label", "gpt")
+            if label:
+                self.storage.format_device(disk, get_format("disklabel", device=disk.path, label_type=label))
+                for index, part_entry in _expand(entry.get("partitions")):
+                    fmt = self._get_format(part_entry, index)
+                    part = self.storage.new_partition(size=Size(part_entry["size"]), parents=[disk], fmt=fmt)
+                    self.storage.create_device(part)
+                    partitions.append((part, part_entry, index))
+            elif entry.get("format"):
+                self.storage.format_device(disk, self._get_format(entry, num))
+                self._add_top(disk, entry, num)
+
+        # allocate all partitions at once, there is no "real" free space to choose
+        if partitions:
+            do_partitioning(self.storage)
+            for part, part_entry, index in partitions:
+                self._add_top(part, part_entry, index)
+
+        for index, entry in _expand(self.spec.get("vgs")):
+            vg = self.storage.new_vg(name=_name(entry, index), parents=self._take("lvmpv", entry.get("pvs", "all")))
+            self.storage.create_device(vg)
+
+            for lv_index, lv_entry in _expand(entry.get("lvs")):
+                lv = self.storage.new_lv(name=_name(lv_entry, lv_index), parents=[vg], size=Size(lv_entry["size"]),
+                                         fmt=self._get_format(lv_entry, lv_index))
+                self.storage.create_device(lv)
+                self._add_top(lv, lv_entry, lv_index)
+
+        for index, entry in _expand(self.spec.get("mdarrays")):
+            members = self._take("mdmember", entry.get("members", 2))
+            array = self.storage.new_mdarray(name=_name(entry, index), level=entry.get("level", "raid1"),
+                                             parents=members, total_devices=len(members),
+                                             member_devices=len(members), fmt=self._get_format(entry, index))
+            self.storage.create_device(array)
+            self._add_top(array, entry, index)
+
+        for index, entry in _expand(self.spec.get("btrfs")):
+            volume = self.storage.new_btrfs(name=_name(entry, index), parents=self._take("btrfs", entry.get("members", 1)),
+                                            data_level=entry.get("data_level"),
+                                            metadata_level=entry.get("metadata_level"))
+            self.storage.create_device(volume)
+
+            for subvol_index in range(entry.get("subvolumes", 0)):
+                subvol = self.storage.new_btrfs_sub_volume(name="subvol%d" % subvol_index, parents=[volume])
+                self.storage.create_device(subvol)
+
+        return self.storage
+
+    def cleanup(self):
+        """ Remove the disk backing files """
+
+        if self.directory is None:
+            return
+
+        if self._own_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+        else:
+            for disk in self.storage.disks if self.storage else []:
+                if os.path.exists(disk.path):
+                    os.unlink(disk.path)
+
+    def _add_disk(self, name, size):
+        path = os.path.join(self.directory, name)
+
+        # sparse file, parted needs the file to exist and have the right size
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+        disk = DiskFile(path, size=size)
+        self.storage.devicetree._add_device(disk)  # pylint: disable=protected-access
+
+        return disk
+
+    def _get_format(self, entry, index):
+        """ Format for a new device, LUKS if the entry is encrypted """
+
+        if entry.get("encrypted"):
+            return get_format("luks", passphrase=PASSPHRASE)
+
+        if entry.get("format"):
+            return get_format(entry["format"], mountpoint=_name(entry, index, "mountpoint"),
+                              label=_name(entry, index, "label"))
+
+        return None
+
+    def _add_top(self, device, entry, index):
+        """ Add LUKS device on top of an encrypted device and remember the top
+            device as a member for VGs, MD arrays and btrfs volumes
+        """
+
+        if entry.get("encrypted"):
+            luks = LUKSDevice("luks-%s" % device.name, size=device.size, parents=[device])
+            self.storage.create_device(luks)
+            if entry.get("format"):
+                self.storage.format_device(luks, get_format(entry["format"], device=luks.path,
+                                                            mountpoint=_name(entry, index, "mountpoint"),
+                                                            label=_name(entry, index, "label")))
+            device = luks
+
+        if entry.get("format") in MEMBER_FORMATS:
+            self._members[entry["format"]].append(device)
+
+        return device
+
+    def _take(self, fmt_type, count):
+        members = self._members[fmt_type]
+
+        if count == "all":
+            count = len(members)
+        if count > len(members) or count == 0:
+            raise ValueError("Not enough unused devices with '%s' format: %d requested, %d available" %
+                             (fmt_type, count, len(members)))
+
+        taken, self._members[fmt_type] = members[:count], members[count:]
+        return taken
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic devicetree generator")
+    parser.add_argument("-d", "--disks", type=int, default=10, help="number of disks")
+    parser.add_argument("-p", "--partitions", type=int, default=8, help="number of partitions on every disk")
+    parser.add_argument("-l", "--lvs", type=int, default=50, help="number of LVs")
+    parser.add_argument("-s", "--spec", help="JSON file with the devicetree spec (overrides -d, -p and -l)")
+    args = parser.parse_args()
+
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    else:
+        spec = simple_spec(args.disks, args.partitions, args.lvs)
+
+    start = time.perf_counter()
+    with SyntheticDevicetree(spec) as storage:
+        duration = time.perf_counter() - start
+
+        types = collections.Counter(device.type for device in storage.devices)
+        print("%d devices, %d actions, built in %.2f s" % (len(storage.devices), len(storage.devicetree.actions),
+                                                           duration))
+        for device_type, count in sorted(types.items()):
+            print("%-20s %8d" % (device_type, count))
+
+
+if __name__ == "__main__":
+    main()
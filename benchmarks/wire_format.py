@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+# wire_format.py
+# Compare the client/daemon wire format with the old pickle-only framing
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+""" Microbenchmark of the wire format used between blivet-gui and blivet-gui-daemon
+
+    Every scenario sends a request over a socketpair to an "echo" thread which
+    answers it with a prepared answer, the result is the number of round trips
+    (messages) per second for the old format (length + pickle, receive by
+    joining packets) and the current one (:mod:`blivetgui.communication.protocol`).
+
+    Usage: PYTHONPATH=. python3 benchmarks/wire_format.py [-n ROUNDS]
+"""
+
+import argparse
+import os
+import pickle
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from blivetgui.communication import protocol  # pylint: disable=wrong-import-position
+from blivetgui.communication.proxy_utils import ProxyID, ProxyDataContainer  # pylint: disable=wrong-import-position
+
+# ---------------------------------------------------------------------------- #
+
+
+class LegacyFormat:
+    """ Framing used before the protocol module: 4 bytes length + pickle """
+
+    @staticmethod
+    def send(sock, message):
+        data = pickle.dumps(message)
+        sock.sendall(struct.pack(">I", len(data)) + data)
+
+    @staticmethod
+    def _recv_data(sock, length):
+        data = b""
+        while len(data) < length:
+            packet = sock.recv(length - len(data))
+            if not packet:
+                return None
+            data += packet
+        return data
+
+    @classmethod
+    def recv(cls, sock):
+        raw_msglen = cls._recv_data(sock, 4)
+        if not raw_msglen:
+            return None
+        return pickle.loads(cls._recv_data(sock, struct.unpack(">I", raw_msglen)[0]))
+
+
+class CurrentFormat:
+    """ blivetgui.communication.protocol """
+
+    buffers = {}
+
+    @staticmethod
+    def send(sock, message):
+        protocol.send_message(sock, 1, protocol.encode(message))
+
+    @classmethod
+    def recv(cls, sock):
+        # both client and server use a reusable receive buffer
+        if sock.fileno() not in cls.buffers:
+            cls.buffers[sock.fileno()] = protocol.ReceiveBuffer()
+
+        message = protocol.recv_message(sock, cls.buffers[sock.fileno()])
+        if message is None:
+            return None
+        _request_id, encoding, data, _generation = message
+        return protocol.decode(encoding, data)
+
+
+def _scenarios():
+    proxy_id = ProxyID()
+    return [("param -> str", ("param", proxy_id, "name"), "sda1"),
+            ("param -> ProxyID", ("param", proxy_id, "format"), ProxyID()),
+            ("key -> str", ("key", proxy_id, 0), "sda1"),
+            ("next -> ProxyID", ("next", proxy_id), ProxyID()),
+            ("call -> list of str", ("call", "get_mountpoints", []), ["/", "/home", "/boot", "/var"]),
+            ("call -> container", ("call", "get_device_snapshot", []),
+             ProxyDataContainer(success=True, answer=ProxyDataContainer(disks=[1, 2], size=2 ** 33))),
+            ("call -> large list", ("call", "get_actions", []),
+             ["action %d: create format ext4 on /dev/sda%d" % (i, i) for i in range(50000)])]
+
+
+def _run(fmt, request, answer, rounds):
+    client, server = socket.socketpair()
+
+    def _echo():
+        while fmt.recv(server) is not None:
+            fmt.send(server, answer)
+
+    thread = threading.Thread(target=_echo, daemon=True)
+    thread.start()
+
+    start = time.perf_counter()
+    for _i in range(rounds):
+        fmt.send(client, request)
+        fmt.recv(client)
+    elapsed = time.perf_counter() - start
+
+    client.close()
+    thread.join()
+    server.close()
+
+    return rounds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="blivet-gui wire format microbenchmark")
+    parser.add_argument("-n", "--rounds", type=int, default=20000,
+                        help="number of round trips per scenario (large answers use 1/1000)")
+    args = parser.parse_args()
+
+    print("%-22s %14s %14s %8s" % ("scenario", "old msg/s", "new msg/s", "speedup"))
+    for name, request, answer in _scenarios():
+        rounds = args.rounds if "large" not in name else max(args.rounds // 1000, 5)
+        old = _run(LegacyFormat, request, answer, rounds)
+        new = _run(CurrentFormat, request, answer, rounds)
+        print("%-22s %14.0f %14.0f %7.2fx" % (name, old, new, new / old))
+
+
+if __name__ == "__main__":
+    main()
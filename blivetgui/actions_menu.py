@@ -51,7 +51,8 @@ class ActionsMenu:
                  ("add_parent", self.blivet_gui.add_lvmvg_parent),
                  ("remove_parent", self.blivet_gui.remove_lvmvg_parent),
                  ("mountpoint", self.blivet_gui.set_mountpoint),
-                 ("partitiontable", self.blivet_gui.set_partition_table)]
+                 ("partitiontable", self.blivet_gui.set_partition_table),
+                 ("reload_disk", self.blivet_gui.reload_disk)]
 
         for item in items:
             menu_item = self.blivet_gui.builder.get_object("menuitem_" + item[0])
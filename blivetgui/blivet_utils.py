@@ -29,14 +29,23 @@ from blivet.formats import DeviceFormat
 from blivet.size import Size
 
 from blivet.devicelibs.crypto import LUKS_METADATA_SIZE
+from blivet.devicelibs import lvm
+from blivet.populator.populator import parted_exn_handler
 
 from .communication.proxy_utils import ProxyDataContainer
 
+import concurrent.futures
+import copy
+import functools
+import logging
+import threading
+import time
 import traceback
 import parted
 import subprocess
 
-from .logs import set_logging, log_utils_call
+from .config import config
+from .logs import set_logging, log_utils_call, ProgramTimer
 from .i18n import _
 from . import __version__
 
@@ -46,9 +55,76 @@ PARTITION_TYPE = {"primary": parted.PARTITION_NORMAL,
                   "logical": parted.PARTITION_LOGICAL,
                   "extended": parted.PARTITION_EXTENDED}
 
+# number of devicetree changes remembered for get_device_changes
+CHANGES_HISTORY = 50
+
 # ---------------------------------------------------------------------------- #
 
 
+class ActionsCancelled(Exception):
+    """ Processing of the scheduled actions was stopped by the user
+    """
+
+
+class DeferredTask:
+    """ Stand-in for a filesystem task (mkfs, writing label or UUID) of a blivet
+        format remembering the calls so they can be run later
+    """
+
+    def __init__(self, task, calls):
+        """
+            :param task: the real task
+            :type task: blivet.tasks.task.Task
+            :param calls: list to append (task, args, kwargs) of every call to
+            :type calls: list
+
+        """
+
+        self.task = task
+        self.calls = calls
+
+    def __getattr__(self, name):
+        # don't delegate special methods (copying of the format) and our own attributes
+        if name.startswith("__") or name in ("task", "calls"):
+            raise AttributeError(name)
+        return getattr(self.task, name)
+
+    def do_task(self, *args, **kwargs):
+        self.calls.append((self.task, args, kwargs))
+
+# ---------------------------------------------------------------------------- #
+
+
+def devicetree_change(full=False, partitions=False):
+    """ Decorator for BlivetUtils methods changing the devicetree
+
+        :param full: the change invalidates the whole devicetree (e.g. reset)
+        :type full: bool
+        :param partitions: the change can change partition tables (free regions)
+        :type partitions: bool
+
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._generation += 1
+                if full:
+                    self._full_change_pending = True
+                if full or partitions:
+                    self._partition_changes += 1
+                    self._free_regions.clear()
+                if full:
+                    self._size_info_updated.clear()
+                    self._size_info_failed.clear()
+        return wrapper
+
+    return decorator
+
+
 def lsblk():
     p = subprocess.run(["lsblk", "-a", "-o", "+FSTYPE,LABEL,UUID,MOUNTPOINT"],
                        stdout=subprocess.PIPE, check=False)
@@ -139,20 +215,39 @@ class BlivetUtils:
 
     installer_mode = False
 
-    def __init__(self, ignored_disks=None, exclusive_disks=None, flags=None):
+    def __init__(self, ignored_disks=None, exclusive_disks=None, flags=None, size_info_mode="startup",
+                 progress_report_hook=None, storage=None):
+        """
+            :param storage: already populated storage to use instead of scanning
+                            the system (e.g. a synthetic devicetree for testing),
+                            note that :meth:`blivet_reset` will replace it with
+                            the real storage configuration
+            :type storage: :class:`blivet.Blivet`
+
+        """
 
         self.ignored_disks = ignored_disks
         self.exclusive_disks = exclusive_disks
 
+        # when to get minimal size of the resizable devices -- "startup", "lazy"
+        # (only when needed) or "background" (like "lazy" but the client asks
+        # for it device by device using update_next_size_info)
+        self.size_info_mode = size_info_mode
+
         self._resizable_filesystems = None
 
+        self._init_change_tracking()
+
         # create our log now, creating blivet.Blivet instance may fail
         # and log some basic information -- version and lsblk output
         _log_file, self.log = set_logging(component="blivet-gui-utils")
         self.log.info("BlivetUtils, version: %s", __version__)
         self.log.info("lsblk output:\n%s", lsblk())
 
-        self.storage = blivet.Blivet()
+        if storage is not None:
+            self.storage = storage
+        else:
+            self.storage = blivet.Blivet()
 
         # logging
         set_logging(component="blivet")
@@ -167,8 +262,14 @@ class BlivetUtils:
 
         blivet.flags.flags.allow_online_fs_resize = True
 
-        self.blivet_reset()
-        self._update_min_sizes_info()
+        if storage is None:
+            if progress_report_hook:
+                progress_report_hook(_("Scanning storage configuration..."))
+
+            self.blivet_reset()
+
+        if self.size_info_mode == "startup":
+            self._update_min_sizes_info(progress_report_hook)
 
     def _set_blivet_flags(self, flags):
         for flag, value in flags.items():
@@ -216,6 +317,194 @@ class BlivetUtils:
 
         return devices
 
+    def _get_device_record(self, blivet_device):
+        """ Get a picklable record with basic information about the device
+        """
+
+        fmt = blivet_device.format
+
+        return ProxyDataContainer(id=blivet_device.id,
+                                  name=blivet_device.name,
+                                  path=blivet_device.path,
+                                  type=blivet_device.type,
+                                  size=blivet_device.size,
+                                  model=getattr(blivet_device, "model", None),
+                                  is_disk=blivet_device.is_disk,
+                                  exists=blivet_device.exists,
+                                  protected=blivet_device.protected,
+                                  removable=getattr(blivet_device, "removable", False),
+                                  format_type=fmt.type,
+                                  format_name=fmt.name,
+                                  format_label=getattr(fmt, "label", None),
+                                  format_mountpoint=getattr(fmt, "mountpoint", None),
+                                  format_uuid=fmt.uuid,
+                                  format_exists=fmt.exists,
+                                  format_hidden=fmt.hidden,
+                                  parents=[parent.id for parent in blivet_device.parents],
+                                  children=[child.id for child in blivet_device.children])
+
+    def get_device_snapshot(self):
+        """ Get the whole device tree as a list of picklable records
+
+            :returns: records of all devices (by id) and ids of disks and group devices
+            :rtype: :class:`~.communication.proxy_utils.ProxyDataContainer`
+
+        """
+
+        devices = {device.id: self._get_device_record(device) for device in self.storage.devices}
+
+        return ProxyDataContainer(devices=devices,
+                                  disks=[disk.id for disk in self.storage.disks],
+                                  lvm=[vg.id for vg in self.storage.vgs],
+                                  raid=[md.id for md in self.storage.mdarrays],
+                                  btrfs=[vol.id for vol in self.storage.btrfs_volumes],
+                                  stratis=[pool.id for pool in self.storage.stratis_pools])
+
+    def get_devices_by_id(self, device_ids):
+        """ Get list of devices with given ids
+
+            :param device_ids: list of device ids (e.g. from :meth:`get_device_snapshot`)
+            :type device_ids: list of int
+            :returns: list of devices (None for ids not present in the devicetree)
+            :rtype: list
+
+        """
+
+        return [self.storage.devicetree.get_device_by_id(device_id) for device_id in device_ids]
+
+    @property
+    def generation(self):
+        """ Devicetree generation, incremented with every change done using BlivetUtils
+        """
+
+        return self._generation
+
+    def _init_change_tracking(self):
+        # devicetree generation, incremented with every change
+        self._generation = 0
+        # device records from the last get_device_changes call and their generation
+        self._device_records = None
+        self._records_generation = 0
+        self._full_change_pending = False
+        # list of (base generation, generation, changes) tuples
+        self._changes = []
+
+        # partition table change counter and free regions on disks computed
+        # since the last change -- (disk id, counter) -> regions
+        self._partition_changes = 0
+        self._free_regions = {}
+
+        # ids of formats with up-to-date size information (minimal size)
+        self._size_info_updated = set()
+
+        # ids of formats update_next_size_info failed to get the information for
+        # (skipped by it, but device_resizable tries again)
+        self._size_info_failed = set()
+
+    def _get_free_regions(self, disk):
+        """ Get (aligned) free regions on the disk, cached until partitions change
+        """
+
+        key = (disk.id, self._partition_changes)
+        if key not in self._free_regions:
+            self._free_regions[key] = blivet.partitioning.get_free_regions([disk], align=True)
+
+        return self._free_regions[key]
+
+    def _record_device_changes(self):
+        """ Compare current devicetree with the last saved state and remember the differences
+        """
+
+        records = {device.id: self._get_device_record(device) for device in self.storage.devices}
+
+        if self._device_records is None:
+            full = True
+            added, removed, changed = [], [], {}
+        else:
+            full = self._full_change_pending
+            added = [dev_id for dev_id in records if dev_id not in self._device_records]
+            removed = [dev_id for dev_id in self._device_records if dev_id not in records]
+            changed = {}
+            for dev_id, record in records.items():
+                old_record = self._device_records.get(dev_id)
+                if old_record is not None:
+                    fields = [key for key in record if record[key] != old_record[key]]
+                    if fields:
+                        changed[dev_id] = fields
+
+        if not (full or added or removed or changed):
+            if self._generation != self._records_generation:
+                # changed and reverted since the last check
+                self._changes.append((self._records_generation, self._generation, None))
+                self._records_generation = self._generation
+            return
+
+        if self._generation == self._records_generation:
+            # devicetree was changed without BlivetUtils knowing about it
+            self._generation += 1
+
+        self._changes.append((self._records_generation, self._generation,
+                              ProxyDataContainer(full=full, added=added, removed=removed, changed=changed)))
+        self._changes = self._changes[-CHANGES_HISTORY:]
+
+        self._device_records = records
+        self._records_generation = self._generation
+        self._full_change_pending = False
+
+    def get_device_changes(self, since_generation):
+        """ Get devices added, removed or modified since given devicetree generation
+
+            :param since_generation: generation returned by a previous call (None to get
+                                     only the current generation)
+            :type since_generation: int or None
+            :returns: current generation, whether the devicetree changed completely (full),
+                      records of added and modified devices, ids of removed devices and names
+                      of changed record fields for modified devices
+            :rtype: :class:`~.communication.proxy_utils.ProxyDataContainer`
+
+        """
+
+        self._record_device_changes()
+
+        full = since_generation is None
+        added, removed, changed = set(), set(), {}
+
+        if not full and since_generation != self._generation:
+            entries = [entry for entry in self._changes if entry[1] > since_generation]
+            if not entries or entries[0][0] > since_generation:
+                # we don't remember all the changes since this generation
+                full = True
+
+            for _base, _generation, entry in entries:
+                if full:
+                    break
+                if entry is None:
+                    continue
+                if entry.full:
+                    full = True
+                    break
+
+                added.update(entry.added)
+                for dev_id in entry.removed:
+                    if dev_id in added:
+                        added.remove(dev_id)
+                    else:
+                        removed.add(dev_id)
+                    changed.pop(dev_id, None)
+                for dev_id, fields in entry.changed.items():
+                    if dev_id not in added:
+                        changed[dev_id] = sorted(set(changed.get(dev_id, [])) | set(fields))
+
+        if full:
+            return ProxyDataContainer(generation=self._generation, full=True,
+                                      added=[], removed=[], modified=[], changed={})
+
+        return ProxyDataContainer(generation=self._generation, full=False,
+                                  added=[self._device_records[dev_id] for dev_id in sorted(added)],
+                                  removed=sorted(removed),
+                                  modified=[self._device_records[dev_id] for dev_id in sorted(changed)],
+                                  changed=changed)
+
     def get_free_info(self):
         """ Get list of free 'devices' (PVs and disk regions) that can be used
             as parents for newly added devices
@@ -233,7 +522,7 @@ class BlivetUtils:
             if disk.format.type not in ("disklabel",):
                 continue
 
-            free_space = blivet.partitioning.get_free_regions([disk], align=True)
+            free_space = self._get_free_regions(disk)
 
             for free in free_space:
                 free_size = blivet.size.Size(free.length * free.device.sectorSize)
@@ -415,7 +704,7 @@ class BlivetUtils:
 
         free_logical = []
 
-        free_regions = blivet.partitioning.get_free_regions([blivet_device], align=True)
+        free_regions = self._get_free_regions(blivet_device)
         for region in free_regions:
             region_size = blivet.size.Size(region.length * region.device.sectorSize)
             if region_size < blivet.size.Size("4 MiB"):
@@ -433,7 +722,7 @@ class BlivetUtils:
 
         free_primary = []
         extended = blivet_device.format.extended_partition
-        free_regions = blivet.partitioning.get_free_regions([blivet_device], align=True)
+        free_regions = self._get_free_regions(blivet_device)
 
         for region in free_regions:
             region_size = blivet.size.Size(region.length * region.device.sectorSize)
@@ -601,6 +890,7 @@ class BlivetUtils:
         return ProxyDataContainer(success=True, actions=actions, message=None, exception=None,
                                   traceback=None)
 
+    @devicetree_change(partitions=True)
     def delete_device(self, blivet_device, delete_parents):
         """ Delete device
 
@@ -672,20 +962,152 @@ class BlivetUtils:
 
         return False
 
-    def _update_min_sizes_info(self):
+    def _needs_size_info(self, device):
+        if device.type not in ("partition", "lvmlv", "lvmpv", "luks/dm-crypt"):
+            return False
+
+        # skip mounted devices
+        if hasattr(device.format, "system_mountpoint") and device.format.system_mountpoint:
+            return False
+
+        return bool(device.format.type and hasattr(device.format, "update_size_info"))
+
+    def _update_size_info(self, fmt, unlocked=False):
+        """ Update size information of the format, if not already done
+
+            :param unlocked: don't hold the blivet lock while getting the information
+            :type unlocked: bool
+
+            ..note.: blivet runs all methods of the formats under its global lock (see
+                     blivet.threads.SynchronizedMeta) so the tools getting the size
+                     would run one at a time, with unlocked the original (not wrapped)
+                     method is called and the lock is only taken for short accesses to
+                     properties of the format
+        """
+
+        if fmt.id in self._size_info_updated:
+            return
+
+        update = fmt.update_size_info
+        original = getattr(getattr(update, "__func__", None), "__wrapped__", None)
+        if unlocked and original is not None:
+            original(fmt)
+        else:
+            update()
+        self._size_info_updated.add(fmt.id)
+
+    def update_next_size_info(self):
+        """ Update size information of one device without it
+
+            ..note.: used by the client in "background" size info mode to get the
+                     information device by device when it's idle
+
+            :returns: whether there are more devices without size information
+            :rtype: bool
+
+        """
+
+        devices = [device for device in self.storage.devices
+                   if self._needs_size_info(device) and device.format.id not in self._size_info_updated and
+                   device.format.id not in self._size_info_failed]
+        if not devices:
+            return False
+
+        device = devices[0]
+        start = time.monotonic()
+        try:
+            self._update_size_info(device.format)
+        except blivet.errors.FSError as e:
+            self.log.info("Failed to get size information for %s: %s", device.name, str(e))
+            # don't try again, device_resizable will
+            self._size_info_failed.add(device.format.id)
+        self.log.info("Size information for %s (%s) updated in %.2f s", device.name,
+                      device.format.type, time.monotonic() - start)
+
+        return len(devices) > 1
+
+    def _update_min_sizes_info(self, progress_report_hook=None):
         """ Update information of minimal size for resizable devices
+
+            :param progress_report_hook: function called with a message after every finished device
+            :type progress_report_hook: callable
+
+            ..note.: getting the information means running tools like resize2fs
+                     or ntfsresize, this is done in parallel (config.size_info_workers
+                     devices at once) and we don't wait longer than config.size_info_timeout
+                     seconds for a single device
         """
 
-        for device in self.storage.devices:
-            if device.type in ("partition", "lvmlv", "lvmpv", "luks/dm-crypt"):
-                # skip mounted devices
-                if hasattr(device.format, "system_mountpoint") and device.format.system_mountpoint:
-                    continue
-                if device.format.type and hasattr(device.format, "update_size_info"):
-                    try:
-                        device.format.update_size_info()
-                    except blivet.errors.FSError:
-                        pass
+        devices = [device for device in self.storage.devices if self._needs_size_info(device)]
+        devices = [device for device in devices if device.format.id not in self._size_info_updated]
+        if not devices:
+            return
+
+        pending = list(reversed(devices))
+        started = {}  # device id -> start time
+        finished = set()
+        errors = []
+        condition = threading.Condition()
+        waiting = [True]  # devices finished after we stopped waiting are not reported
+
+        def _update_size_info():
+            while True:
+                with condition:
+                    if not pending:
+                        return
+                    device = pending.pop()
+                    started[device.id] = time.monotonic()
+
+                try:
+                    # without the blivet lock, otherwise the devices would be processed
+                    # one by one and a stuck tool would block everything else
+                    self._update_size_info(device.format, unlocked=True)
+                except blivet.errors.FSError as e:
+                    self.log.info("Failed to get size information for %s: %s", device.name, str(e))
+                except Exception as e:  # pylint: disable=broad-except
+                    errors.append(e)
+
+                self.log.info("Size information for %s (%s) updated in %.2f s", device.name,
+                              device.format.type, time.monotonic() - started[device.id])
+
+                with condition:
+                    finished.add(device.id)
+                    if progress_report_hook and waiting[0]:
+                        msg = _("Getting size information for devices ({done}/{total})...")
+                        progress_report_hook(msg.format(done=len(finished), total=len(devices)))
+                    condition.notify()
+
+        workers = max(1, min(config.size_info_workers, len(devices)))
+        for _i in range(workers):
+            threading.Thread(target=_update_size_info, daemon=True).start()
+
+        timeout = config.size_info_timeout
+        with condition:
+            while True:
+                now = time.monotonic()
+                running = [dev_id for dev_id in started if dev_id not in finished]
+                timed_out = [dev_id for dev_id in running if now - started[dev_id] >= timeout]
+
+                # done or all workers are stuck
+                if len(finished) == len(devices) or len(timed_out) == workers:
+                    break
+                # only devices we are not waiting for are running
+                if not pending and len(running) == len(timed_out):
+                    break
+
+                remaining = [started[dev_id] + timeout - now for dev_id in running if dev_id not in timed_out]
+                condition.wait(min(remaining) if remaining else timeout)
+
+            # don't start any new work after we stop waiting
+            pending.clear()
+            waiting[0] = False
+
+        if len(finished) != len(devices):
+            skipped = [device.name for device in devices if device.id not in finished]
+            self.log.info("Not waiting for size information for %s", ", ".join(skipped))
+
+        if errors:
+            raise errors[0]
 
     def device_resizable(self, blivet_device):
         """ Is given device resizable
@@ -771,10 +1193,10 @@ class BlivetUtils:
 
         if not self.installer_mode:
             try:
-                blivet_device.format.update_size_info()
+                self._update_size_info(blivet_device.format)
 
                 if blivet_device.type == "luks/dm-crypt":
-                    blivet_device.raw_device.format.update_size_info()
+                    self._update_size_info(blivet_device.raw_device.format)
 
             except blivet.errors.FSError as e:
                 msg = _("Failed to update filesystem size info: {error}").format(error=str(e))
@@ -802,6 +1224,7 @@ class BlivetUtils:
             return ProxyDataContainer(resizable=False, error=msg, min_size=blivet.size.Size("1 MiB"),
                                       max_size=blivet_device.size)
 
+    @devicetree_change()
     def format_device(self, user_input):
         log_msg = "Formatting device '%s'\n" % user_input.edit_device.name
         log_utils_call(log=self.log, message=log_msg,
@@ -823,6 +1246,7 @@ class BlivetUtils:
             return ProxyDataContainer(success=False, actions=None, message=None, exception=e,
                                       traceback=traceback.format_exc())
 
+    @devicetree_change(partitions=True)
     def resize_device(self, user_input):
         device = user_input.edit_device
 
@@ -869,6 +1293,7 @@ class BlivetUtils:
             return ProxyDataContainer(success=False, actions=None, message=None, exception=e,
                                       traceback=traceback.format_exc())
 
+    @devicetree_change()
     def relabel_format(self, user_input):
         log_msg = "Setting format label for '%s'\n" % user_input.edit_device.name
         log_utils_call(log=self.log, message=log_msg,
@@ -886,6 +1311,7 @@ class BlivetUtils:
             return ProxyDataContainer(success=True, actions=[label_ac], message=None,
                                       exception=None, traceback=None)
 
+    @devicetree_change()
     def rename_device(self, user_input):
         rename_ac = blivet.deviceaction.ActionConfigureDevice(device=user_input.edit_device,
                                                               attr="name",
@@ -900,6 +1326,7 @@ class BlivetUtils:
             return ProxyDataContainer(success=True, actions=[rename_ac], message=None,
                                       exception=None, traceback=None)
 
+    @devicetree_change(partitions=True)
     def edit_lvmvg_device(self, user_input):
         """ Edit LVM Volume group
         """
@@ -1426,6 +1853,7 @@ class BlivetUtils:
                 "stratis pool": _create_stratis_pool,
                 "stratis filesystem": _create_stratis_filesystem}
 
+    @devicetree_change(partitions=True)
     def add_device(self, user_input):
         """ Create new device
 
@@ -1593,6 +2021,7 @@ class BlivetUtils:
 
         return False
 
+    @devicetree_change(partitions=True)
     def create_disk_label(self, blivet_device, label_type):
         """ Create disklabel
 
@@ -1625,10 +2054,38 @@ class BlivetUtils:
 
         return ProxyDataContainer(success=True, actions=actions, message=None, exception=None, traceback=None)
 
+    @devicetree_change()
     def unlock_device(self, blivet_device, passphrase):
         """ Unlock/open this LUKS/dm-crypt encrypted device
         """
 
+        if self._unlock(blivet_device, passphrase):
+            self._populate_new_devices()
+            return True
+        else:
+            return False
+
+    @devicetree_change()
+    def unlock_devices(self, devices):
+        """ Unlock/open multiple LUKS/dm-crypt encrypted devices
+
+            ..note.: the devicetree is updated only once, after all devices are unlocked
+
+            :param devices: devices to unlock and their passphrases
+            :type devices: list of (blivet.Device, str)
+            :returns: whether the devices were unlocked (in the same order)
+            :rtype: list of bool
+
+        """
+
+        results = [self._unlock(blivet_device, passphrase) for blivet_device, passphrase in devices]
+
+        if any(results):
+            self._populate_new_devices()
+
+        return results
+
+    def _unlock(self, blivet_device, passphrase):
         if blivet_device.format.type == "luks":
             return self._luks_unlock(blivet_device, passphrase)
         elif blivet_device.format.type == "stratis":
@@ -1664,7 +2121,6 @@ class BlivetUtils:
             # save passphrase for future use (in Anaconda only)
             blivet_device.original_format.passphrase = passphrase
             self.storage.save_passphrase(blivet_device)
-            self.storage.devicetree.populate()
             return True
 
     def _stratis_unlock(self, blivet_device, passphrase):
@@ -1688,9 +2144,131 @@ class BlivetUtils:
         except blivet.errors.StratisError:
             return False
         else:
-            self.storage.devicetree.populate()
             return True
 
+    @devicetree_change(partitions=True)
+    def rescan_devices(self, names):
+        """ Scan selected disks again without resetting the whole devicetree
+
+            ..note.: scheduled actions on the disks and devices on them are cancelled,
+                     actions on other devices are kept; disks that are not in the
+                     devicetree yet (e.g. newly plugged ones) are added
+
+            :param names: names of the disks to scan
+            :type names: list of str
+            :returns: cancelled actions
+            :rtype: list of blivet.deviceaction.DeviceAction
+
+        """
+
+        log_msg = "Scanning disks again:\n"
+        log_utils_call(log=self.log, message=log_msg,
+                       user_input={"names": names})
+
+        return self._rescan_disks(names)
+
+    @devicetree_change(partitions=True)
+    def apply_device_events(self, events):
+        """ Update the devicetree after block devices were added, removed or changed
+
+            ..note.: nothing is done when there are scheduled actions, the devicetree
+                     with the scheduled changes can't be updated
+
+            :param events: udev events -- (action, device name)
+            :type events: list of tuple
+            :returns: whether the devicetree was updated
+            :rtype: bool
+
+        """
+
+        devicetree = self.storage.devicetree
+
+        if devicetree.actions.find():
+            self.log.info("Ignoring udev events, there are scheduled actions: %s", events)
+            return False
+
+        self.log.debug("Updating devicetree after udev events: %s", events)
+
+        # devices we know are removed or changed -- scan their disks again,
+        # new devices are found when scanning the disks too
+        disks = set()
+        for _action, name in events:
+            device = devicetree.get_device_by_name(name)
+            if device is not None:
+                disks.update(disk.name for disk in device.disks)
+
+        if disks:
+            self._rescan_disks(disks)
+        else:
+            self._populate_new_devices()
+
+        return True
+
+    def _rescan_disks(self, names):
+        devicetree = self.storage.devicetree
+        disks = [disk for disk in self.storage.disks if disk.name in names]
+
+        cancelled = [action for action in devicetree.actions.find()
+                     if any(action.device == disk or action.device.depends_on(disk) for disk in disks)]
+        for action in reversed(cancelled):
+            devicetree.actions.remove(action)
+
+        # remove the disks with everything on them, they will be added again as they are now
+        for disk in disks:
+            devicetree.recursive_remove(disk, actions=False)
+            devicetree._remove_device(disk)  # pylint: disable=protected-access
+
+        self._populate_new_devices()
+
+        return cancelled
+
+    def _populate_new_devices(self):
+        """ Add block devices that are not in the devicetree to it
+
+            ..note.: this is used after unlocking devices instead of scanning all devices
+                     again with devicetree.populate(), blivet adds children of the new
+                     devices (e.g. LVs in a VG on an unlocked LUKS device) together
+                     with them; the steps devicetree.populate() does before and after
+                     adding the devices are done here too, so ignored (or not exclusive)
+                     disks are hidden
+        """
+
+        devicetree = self.storage.devicetree
+
+        blivet.udev.settle()
+        devicetree.drop_device_info_cache()
+
+        # force LVM DBusD to refresh its internal state
+        lvm.lvm_dbusd_refresh()
+
+        # hidden (ignored) devices and devices removed by scheduled actions still
+        # exist, we don't want to add them again
+        known = set(device.name for device in devicetree.devices)
+        known.update(device.name for device in devicetree._hidden)  # pylint: disable=protected-access
+        removed = devicetree.actions.find(action_type="destroy", object_type="device")
+        known.update(action.device.name for action in removed)
+
+        parted.register_exn_handler(parted_exn_handler)
+        try:
+            # repeat until no new devices appear, same as devicetree.populate does
+            while True:
+                new_devices = [info for info in blivet.udev.get_devices()
+                               if blivet.udev.device_get_name(info) not in known]
+                if not new_devices:
+                    break
+
+                self.log.debug("devices to scan after unlock: %s",
+                               [blivet.udev.device_get_name(info) for info in new_devices])
+                for info in new_devices:
+                    known.add(blivet.udev.device_get_name(info))
+                    devicetree.handle_device(info)
+
+            devicetree._handle_inconsistencies()  # pylint: disable=protected-access
+        finally:
+            parted.clear_exn_handler()
+            devicetree._hide_ignored_disks()  # pylint: disable=protected-access
+
+    @devicetree_change(partitions=True)
     def blivet_cancel_actions(self, actions):
         """ Cancel scheduled actions
         """
@@ -1705,6 +2283,7 @@ class BlivetUtils:
                 # actions.prune() without telling me) already removed this action
                 self.storage.devicetree.actions.remove(action)
 
+    @devicetree_change(full=True)
     def blivet_reset(self):
         """ Blivet.reset()
         """
@@ -1720,23 +2299,292 @@ class BlivetUtils:
 
         self.storage.reset()
 
-    def blivet_do_it(self, progress_report_hook):
+    def _parallel_format_actions(self):
+        """ Find scheduled actions creating filesystems that can run in parallel
+
+            Filesystem can be created later (after all other actions) if it's the last
+            thing done with the device, actions on devices sharing a disk are in the same
+            group and must run one by one, different groups are independent.
+
+            :returns: groups of actions
+            :rtype: list of lists of blivet.deviceaction.DeviceAction
+
+        """
+
+        actions = list(self.storage.devicetree.actions)
+
+        candidates = []
+        for action in actions:
+            if not (action.is_create and action.is_format) or not isinstance(action.format, blivet.formats.fs.FS):
+                continue
+            # btrfs is created together with the volume, not by the format
+            if action.format.type == "btrfs" or not action.format.formattable:
+                continue
+
+            others = (a for a in actions if a is not action and a.device.id == action.device.id)
+            if all((a.is_create and a.is_device) or (a.is_destroy and a.is_format) for a in others):
+                candidates.append(action)
+
+        groups = []  # (disk ids, actions)
+        for action in candidates:
+            disks = set(disk.id for disk in action.device.disks)
+            group_actions = []
+            for group in [g for g in groups if g[0] & disks]:
+                groups.remove(group)
+                disks |= group[0]
+                group_actions.extend(group[1])
+            groups.append((disks, group_actions + [action]))
+
+        return [group_actions for _disks, group_actions in groups]
+
+    def _create_deferred_format(self, action, calls):
+        """ Run filesystem tasks deferred when the action was executed and update
+            information blivet gets right after creating the format
+
+            :param action: executed format create action
+            :type action: blivet.deviceaction.ActionCreateFormat
+            :param calls: deferred calls -- (task, args, kwargs)
+            :type calls: list of tuples
+
+        """
+
+        device = action.device
+        fmt = action.format
+
+        for task, args, kwargs in calls:
+            try:
+                task.do_task(*args, **kwargs)
+            except (blivet.errors.FSWriteLabelError, blivet.errors.FSWriteUUIDError) as e:
+                self.log.warning("Failed to write label or UUID of %s during mkfs: %s", device.name, str(e))
+            except blivet.errors.FSError as e:
+                if task is fmt._mkfs:
+                    raise blivet.errors.FormatCreateError(e)
+                elif task is fmt._writelabel:
+                    self.log.warning("Failed to write label of %s: %s", device.name, str(e))
+                else:
+                    raise
+
+        blivet.udev.settle()
+        device.update_sysfs_path()
+        info = blivet.udev.get_device(device.sysfs_path)
+        if info:
+            fmt.uuid = blivet.udev.device_get_uuid(info)
+            device.device_links = blivet.udev.device_get_symlinks(info)
+
+        device.original_format = copy.deepcopy(fmt)
+
+    @devicetree_change(full=True)
+    def blivet_do_it(self, progress_report_hook, cancel_check=None, parallel=False):
         """ Blivet.do_it()
+
+            :param progress_report_hook: function called with progress events -- ProxyDataContainer
+                                         with type of the event ("action_started", "action_message",
+                                         "action_finished" or "group_started"), index and id of the action,
+                                         number of actions, message and time of the event and duration of
+                                         the action (for "action_finished" only)
+            :type progress_report_hook: callable
+            :param cancel_check: function called before executing every action, if it returns
+                                 True, remaining actions are not executed
+            :type cancel_check: callable
+            :param parallel: create filesystems on independent disks in parallel
+            :type parallel: bool
+
+            ..note.: blivet doesn't report progress of the actions themselves so the
+                     "bytes_done" and "bytes_total" values are always None
+
+            ..note.: the result contains "timings" -- list of ProxyDataContainers with id,
+                     description, start and duration of every executed action and list of
+                     external programs (command, start and duration) it ran
+
+            ..note.: blivet runs all its methods under one lock, so with parallel the actions
+                     found by :meth:`_parallel_format_actions` are executed as usual, but their
+                     filesystem tasks (mkfs, writing label and UUID) are only recorded and run
+                     after all other actions -- groups of them at once (config.parallel_format_workers),
+                     "group_started" event is reported when a group starts, if the processing is
+                     cancelled or fails, the file systems are still created for the actions blivet
+                     already executed
+
         """
 
         log_msg = "Running do_it\n"
         log_utils_call(log=self.log, message=log_msg,
-                       user_input=None)
-
-        progress_clbk = lambda clbk_data: progress_report_hook(clbk_data.msg)
-
-        callbacks_reg = blivet.callbacks.create_new_callbacks_register(report_progress=progress_clbk)
+                       user_input={"parallel": parallel})
+
+        actions = self.storage.devicetree.actions
+        progress = {"index": -1, "total": 0, "action": None, "start": None}
+        timings = []
+        report_lock = threading.Lock()
+
+        # action id -> deferred filesystem tasks and what we know from executing the action
+        groups = self._parallel_format_actions() if parallel else []
+        deferred = {action.id: {"calls": [], "index": None, "start": None, "duration": 0, "programs": []}
+                    for group in groups for action in group}
+
+        def _report(event, action, message, duration=None, index=None, **kwargs):
+            with report_lock:
+                progress_report_hook(ProxyDataContainer(event=event, index=progress["index"] if index is None else index,
+                                                        total=progress["total"], action_id=action.id, message=message,
+                                                        time=time.time(), duration=duration, bytes_done=None,
+                                                        bytes_total=None, **kwargs))
+
+        def _finish(action, index, start, duration, programs):
+            timings.append(ProxyDataContainer(action_id=action.id, action=str(action), start=start,
+                                              duration=duration, programs=programs))
+            self.log.debug("Action '%s' finished in %.2f s", str(action), duration)
+            _report("action_finished", action, str(action), duration, index)
+
+        def _action_started(clbk_data):
+            # blivet reports progress when it starts executing an action -- the first
+            # one in the queue (actions are sorted and pruned before executing them)
+            remaining = list(actions)
+            done = progress["index"] + 1
+
+            if cancel_check and cancel_check():
+                msg = _("Processing of the actions was cancelled after {done} of {total} actions.")
+                raise ActionsCancelled(msg.format(done=done, total=done + len(remaining)))
+
+            program_timer.take()  # programs run between the actions
+            progress.update(index=done, total=done + len(remaining), action=remaining[0], start=time.time())
+            _report("action_started", remaining[0], clbk_data.msg)
+
+        def _action_message(clbk_data):
+            # formats created later, don't report they were created now
+            if progress["action"].id not in deferred:
+                _report("action_message", progress["action"], clbk_data.msg)
+
+        def _action_finished(action):
+            duration = time.time() - progress["start"]
+            if action.id in deferred:
+                deferred[action.id].update(index=progress["index"], start=progress["start"], duration=duration,
+                                           programs=program_timer.take())
+            else:
+                _finish(action, progress["index"], progress["start"], duration, program_timer.take())
+
+        def _create_group(number, group):
+            disks = sorted(set(disk.name for action in group for disk in action.device.disks))
+            msg = _("Creating file systems on {disks}").format(disks=", ".join(disks))
+            _report("group_started", group[0], msg, group=number, groups=len(groups))
+
+            for action in group:
+                if stop.is_set():
+                    return
+
+                info = deferred[action.id]
+                attempted.add(action.id)
+                start = time.time()
+                self._create_deferred_format(action, info["calls"])
+                _finish(action, info["index"], info["start"], info["duration"] + time.time() - start,
+                        info["programs"] + program_timer.take(threading.get_ident()))
+
+        def _restore_tasks():
+            for group in groups:
+                for action in group:
+                    for name in ("_mkfs", "_writelabel", "_writeuuid"):
+                        task = getattr(action.format, name)
+                        if isinstance(task, DeferredTask):
+                            setattr(action.format, name, task.task)
+
+        def _create_remaining():
+            # blivet already marked the executed actions as done, so their file systems
+            # must be created even if processing of the other actions was stopped
+            _restore_tasks()
+
+            for group in groups:
+                for action in group:
+                    info = deferred[action.id]
+                    if info["index"] is None or action.id in attempted:
+                        continue
+
+                    attempted.add(action.id)
+                    start = time.time()
+                    self._create_deferred_format(action, info["calls"])
+                    _finish(action, info["index"], info["start"], info["duration"] + time.time() - start,
+                            info["programs"] + program_timer.take())
+
+        for group in groups:
+            for action in group:
+                for name in ("_mkfs", "_writelabel", "_writeuuid"):
+                    setattr(action.format, name, DeferredTask(getattr(action.format, name), deferred[action.id]["calls"]))
+
+        callbacks_reg = blivet.callbacks.create_new_callbacks_register(report_progress=_action_started,
+                                                                       create_format_pre=_action_message,
+                                                                       create_format_post=_action_message,
+                                                                       resize_format_pre=_action_message,
+                                                                       resize_format_post=_action_message)
+        blivet.callbacks.callbacks.action_executed.add(_action_finished)
+
+        program_timer = ProgramTimer()
+        program_log = logging.getLogger("program")
+        program_log.addHandler(program_timer)
+
+        stop = threading.Event()
+
+        # ids of the actions we tried to create the file system for
+        attempted = set()
 
         try:
             self.storage.do_it(callbacks=callbacks_reg)
+            _restore_tasks()
+
+            if groups:
+                self.log.info("Creating %d file systems in %d groups", len(deferred), len(groups))
+
+                cancelled = False
+                workers = max(1, min(config.parallel_format_workers, len(groups)))
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(_create_group, number, group) for number, group in enumerate(groups)]
+                    while True:
+                        done, running = concurrent.futures.wait(futures, timeout=0.5)
+                        if not running:
+                            break
+
+                        # running mkfs can't be stopped, just don't start the next one
+                        if any(future.exception() for future in done):
+                            stop.set()
+                        elif not stop.is_set() and cancel_check and cancel_check():
+                            cancelled = True
+                            stop.set()
+
+                errors = [future.exception() for future in futures if future.exception()]
+                if errors:
+                    raise errors[0]
+
+                if cancelled:
+                    msg = _("Processing of the actions was cancelled after {done} of {total} actions.")
+                    raise ActionsCancelled(msg.format(done=len(timings), total=progress["total"]))
+
+        except ActionsCancelled as e:
+            tb = traceback.format_exc()
+
+            try:
+                _create_remaining()
+            except Exception as create_e:  # pylint: disable=broad-except
+                return (True, ProxyDataContainer(success=False, cancelled=False, exception=create_e,
+                                                 traceback=traceback.format_exc(), timings=timings))
+
+            # file systems created now are done too
+            msg = _("Processing of the actions was cancelled after {done} of {total} actions.")
+            e = ActionsCancelled(msg.format(done=len(timings), total=progress["total"]))
+            self.log.info("%s", str(e))
+            return (True, ProxyDataContainer(success=False, cancelled=True, exception=e, traceback=tb,
+                                             timings=timings))
 
         except Exception as e:  # pylint: disable=broad-except
-            return (True, ProxyDataContainer(success=False, exception=e, traceback=traceback.format_exc()))
+            tb = traceback.format_exc()
+
+            try:
+                _create_remaining()
+            except Exception as create_e:  # pylint: disable=broad-except
+                # the original error is reported, actions without file system are not in the timings
+                self.log.error("Failed to create file systems of the executed actions: %s", str(create_e))
+
+            return (True, ProxyDataContainer(success=False, cancelled=False, exception=e, traceback=tb,
+                                             timings=timings))
 
         else:
-            return (True, ProxyDataContainer(success=True))
+            return (True, ProxyDataContainer(success=True, cancelled=False, timings=timings))
+
+        finally:
+            _restore_tasks()
+            blivet.callbacks.callbacks.action_executed.remove(_action_finished)
+            program_log.removeHandler(program_timer)
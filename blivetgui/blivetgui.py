@@ -49,12 +49,19 @@ from .processing_window import ProcessingActions
 from .loading_window import LoadingWindow
 from .exception_handler import BlivetGUIExceptionHandler
 from .communication.constants import ServerInitResponse
+from .communication.jobs import JOB_FINISHED, JOB_CANCELLED
+from .communication.proxy_utils import ProxyDataContainer
 from .config import config
 
-import threading
 import sys
 import atexit
 import os
+import traceback
+
+# ---------------------------------------------------------------------------- #
+
+# how often to check whether a job running in the daemon finished (in milliseconds)
+JOB_POLL_INTERVAL = 100
 
 # ---------------------------------------------------------------------------- #
 
@@ -70,10 +77,6 @@ class BlivetGUI:
 
         self.client = client
 
-        self.builder = Gtk.Builder()
-        self.builder.set_translation_domain("blivet-gui")
-        self.builder.add_from_file(locate_ui_file("blivet-gui.ui"))
-
         self.ignored_disks = []
 
         # blivet needs only names not paths, e.g. "sda" not "/dev/sda"
@@ -82,6 +85,17 @@ class BlivetGUI:
         else:
             self.exclusive_disks = []
 
+        self.flags = dict()
+        if auto_dev_updates:
+            self.flags["auto_dev_updates"] = True
+
+        # let the daemon scan storage while we are building the UI
+        self.client.remote_init_start(*self._init_args(), scan_cache=self._scan_cache)
+
+        self.builder = Gtk.Builder()
+        self.builder.set_translation_domain("blivet-gui")
+        self.builder.add_from_file(locate_ui_file("blivet-gui.ui"))
+
         # allow creating ntfs filesystem
         # XXX: This shouldn't be necessary, NTFS is already "_formattable",
         # I don't have idea what "_supported" is for, the "supported" property
@@ -92,9 +106,8 @@ class BlivetGUI:
         # supported filesystems
         self._supported_filesystems = []
 
-        self.flags = dict()
-        if auto_dev_updates:
-            self.flags["auto_dev_updates"] = True
+        # devicetree generation the views were last updated for
+        self.devicetree_generation = None
 
         # CSS styles
         css_provider = Gtk.CssProvider()
@@ -167,6 +180,47 @@ class BlivetGUI:
 
         self.initialize()
 
+        # not needed until the user adds or formats a device
+        self.prefetch_supported_filesystems()
+
+        if config.size_info_mode == "background":
+            self.update_size_info_background()
+
+        if config.device_monitor and not self.installer_mode:
+            self.client.watch_devices(self._devices_changed)
+
+    def _devices_changed(self, notification):
+        """ Update the views after the daemon updated the devicetree because
+            block devices were added, removed or changed
+        """
+
+        if notification.exception:
+            message = _("Failed to update the list of devices after a change of block devices.")
+            self._reraise_exception(notification.exception, notification.traceback, message)
+        elif notification.applied:
+            self.update_views()
+
+    def prefetch_supported_filesystems(self):
+        """ Ask for the supported filesystems in background
+        """
+
+        def _save_filesystems(filesystems):
+            if not isinstance(filesystems, BaseException) and not self._supported_filesystems:
+                self._supported_filesystems = filesystems
+
+        self.client.remote_call_async("get_supported_filesystems", callback=_save_filesystems)
+
+    def update_size_info_background(self):
+        """ Ask for minimal size of the resizable devices in background, one
+            device at a time so other requests don't need to wait for all of them
+        """
+
+        def _next_device(more):
+            if more is True:
+                self.client.remote_call_async("update_next_size_info", callback=_next_device)
+
+        self.client.remote_call_async("update_next_size_info", callback=_next_device)
+
     @property
     def supported_filesystems(self):
         if self._supported_filesystems:
@@ -176,6 +230,7 @@ class BlivetGUI:
         return self._supported_filesystems
 
     def initialize(self):
+        self.devicetree_generation = self.client.remote_call("get_device_changes", None).generation
         self.list_devices.load_devices()
         self.list_actions.initialize()
 
@@ -197,6 +252,29 @@ class BlivetGUI:
         self.list_partitions.update_partitions_list(self.list_devices.selected_device)
         self.logical_view.visualize_devices(self.list_partitions.partitions_list)
 
+    def update_views(self):
+        """ Update the views after the devicetree changed
+
+            Only the parts affected by the changes since the last update are reloaded.
+        """
+
+        changes = self.client.remote_call("get_device_changes", self.devicetree_generation)
+        self.devicetree_generation = changes.generation
+        self.list_devices.apply_changes(changes)
+
+        if self.list_devices.affected_by(changes) or self.list_devices.selected_device is None:
+            self.list_devices.update_devices_view()
+            self.update_partitions_view()
+            return
+
+        if self.list_partitions.apply_changes(changes):
+            self.logical_view.visualize_devices(self.list_partitions.partitions_list)
+        else:
+            self.update_partitions_view()
+
+        if self.list_devices.selected_device is not None and self.list_parents.affected_by(changes):
+            self.update_physical_view()
+
     def update_physical_view(self):
         self.list_parents.update_parents_list(self.list_devices.selected_device)
         self.physical_view.visualize_parents(self.list_parents.parents_list)
@@ -297,8 +375,10 @@ class BlivetGUI:
     def resize_device(self, _widget=None):
         device = self.list_partitions.selected_partition[0]
 
-        dialog = edit_dialog.ResizeDialog(self.main_window, device,
-                                          self.client.remote_call("device_resizable", device))
+        # getting minimal size of the device can take some time
+        resizable = self._run_job("device_resizable", device, message=_("Getting information about the device..."))
+
+        dialog = edit_dialog.ResizeDialog(self.main_window, device, resizable)
         message = _("Failed to resize the device:")
         user_input = self.run_dialog(dialog)
         if user_input.resize:
@@ -315,7 +395,7 @@ class BlivetGUI:
                     self.list_actions.append("edit", action_str, result.actions)
 
                 self._handle_user_change()
-                self.update_partitions_view()
+                self.update_views()
 
     def rename_device(self, _widget=None):
         device = self.list_partitions.selected_partition[0]
@@ -339,7 +419,7 @@ class BlivetGUI:
                     self.list_actions.append("edit", action_str, result.actions)
 
                 self._handle_user_change()
-                self.update_partitions_view()
+                self.update_views()
 
     def format_device(self, _widget=None):
         device = self.list_partitions.selected_partition[0]
@@ -372,7 +452,7 @@ class BlivetGUI:
                     self.list_actions.append("edit", action_str, result.actions)
 
                 self._handle_user_change()
-                self.update_partitions_view()
+                self.update_views()
 
     def add_lvmvg_parent(self, _widget=None):
         """ Add a parent (PV) to the selected VG
@@ -400,7 +480,7 @@ class BlivetGUI:
                     self.list_actions.append("edit", action_str, result.actions)
 
             self._handle_user_change()
-            self.update_partitions_view()
+            self.update_views()
 
         dialog.destroy()
         return
@@ -430,7 +510,7 @@ class BlivetGUI:
                     self.list_actions.append("edit", action_str, result.actions)
 
             self._handle_user_change()
-            self.update_partitions_view()
+            self.update_views()
 
         dialog.destroy()
         return
@@ -462,7 +542,7 @@ class BlivetGUI:
                 if result.actions:
                     action_str = _("change filesystem label of {name} {type}").format(name=device.name, type=device.type)
                     self.list_actions.append("edit", action_str, result.actions)
-                self.update_partitions_view()
+                self.update_views()
 
     def _allow_add_device(self, selected_device):
         """ Allow add device?
@@ -514,7 +594,7 @@ class BlivetGUI:
                     self.list_actions.append("add", action_str, result.actions)
 
             self._handle_user_change()
-            self.update_partitions_view()
+            self.update_views()
 
     def add_device(self, _widget=None):
         """ Show dialog for adding new device and create the device based on
@@ -583,8 +663,7 @@ class BlivetGUI:
                     self.list_actions.append("add", action_str, result.actions)
 
             self._handle_user_change()
-            self.list_devices.update_devices_view()
-            self.update_partitions_view()
+            self.update_views()
 
         dialog.destroy()
 
@@ -640,8 +719,7 @@ class BlivetGUI:
                 self.list_actions.append("delete", action_str, result.actions)
 
             self._handle_user_change()
-            self.update_partitions_view()
-            self.list_devices.update_devices_view()
+            self.update_views()
 
     def set_mountpoint(self, _widget=None):
         device = self.list_partitions.selected_partition[0]
@@ -667,50 +745,87 @@ class BlivetGUI:
             self.client.remote_call("log_debug", msg, user_input)
             device.format.mountpoint = user_input.mountpoint
             self._handle_user_change()
-            self.update_partitions_view()
+            self.update_views()
 
     def perform_actions(self, dialog):
         """ Perform queued actions
         """
 
-        def end(success, error, traceback):
-            if success:
-                dialog.stop()
+        def end(success, error, error_traceback, cancelled=False, timings=None, message=None):
+            if success or cancelled:
+                dialog.stop(cancelled, timings)
             else:
-                message = _("Failed to perform the actions:")
+                message = message or _("Failed to perform the actions:")
                 dialog.destroy()
                 self.main_window.set_sensitive(False)
-                self._reraise_exception(error, traceback, message, dialog_window=dialog)  # pylint: disable=raising-bad-type
+                self._reraise_exception(error, error_traceback, message, dialog_window=dialog)  # pylint: disable=raising-bad-type
 
-        def show_progress(message):
-            GLib.idle_add(dialog.progress_msg, message)
+        # blivet_do_it and (if it doesn't succeed) blivet_reset jobs and their results
+        jobs = []
+        results = []
 
-        def do_it():
-            """ Run blivet.doIt()
-            """
+        def job_result(job_id):
+            # job_result raises if the job failed or was cancelled before it started,
+            # we want to report it using the dialog
+            try:
+                return self.client.job_result(job_id)
+            except Exception as e:  # pylint: disable=broad-except
+                return ProxyDataContainer(success=False, cancelled=False, exception=e,
+                                          traceback=traceback.format_exc())
+
+        def check_jobs():
+            try:
+                status = self.client.job_status(jobs[-1])
+                for event in status.progress:  # pylint: disable=maybe-no-member
+                    dialog.progress_msg(event)
 
-            result = self.client.remote_do_it(show_progress)
-            if result.success:
-                GLib.idle_add(end, True, None, None)
+                if status.state not in (JOB_FINISHED, JOB_CANCELLED):  # pylint: disable=maybe-no-member
+                    return True
 
+                if status.state == JOB_CANCELLED and not results:  # pylint: disable=maybe-no-member
+                    # cancelled before it started, no action was executed
+                    job_result(jobs[-1])
+                    results.append(ProxyDataContainer(success=False, cancelled=True, timings=[]))
+                else:
+                    results.append(job_result(jobs[-1]))
+
+                if not results[0].success and len(jobs) == 1:
+                    # actions not executed are still scheduled in blivet, drop them
+                    jobs.append(self.client.start_job("blivet_reset"))
+                    return True
+            except Exception as e:  # pylint: disable=broad-except
+                end(False, e, traceback.format_exc())
+                return False
+
+            result = results[0]
+            reset = results[1] if len(results) > 1 else None
+
+            if reset is not None and not reset.success:
+                message = _("Failed to reload storage information after processing of the actions stopped:")
+                if not result.cancelled:
+                    message = _("Failed to perform the actions:") + "\n" + str(result.exception) + "\n\n" + message
+                end(False, reset.exception, reset.traceback, message=message)
+            elif result.success:
+                end(True, None, None, False, result.timings)
+            elif result.cancelled:
+                end(False, None, None, True, result.timings)
             else:
-                self.client.remote_call("blivet_reset")
-                GLib.idle_add(end, False, result.exception, result.traceback)
+                end(False, result.exception, result.traceback)
 
-            return
+            return False
 
         # don't allow to ignore exceptions raised during do_it
         self.exc.allow_ignore = False
 
-        thread = threading.Thread(target=do_it)
-        thread.start()
+        jobs.append(self.client.start_job("blivet_do_it", config.parallel_format))
+        dialog.job_id = jobs[0]
+
+        GLib.timeout_add(JOB_POLL_INTERVAL, check_jobs)
         dialog.start()
-        thread.join()
 
         self.list_actions.clear()
 
-        self.list_devices.update_devices_view()
-        self.update_partitions_view()
+        self.update_views()
 
         # allow ignoring exceptions now
         self.exc.allow_ignore = True
@@ -782,7 +897,8 @@ class BlivetGUI:
         response = self.run_dialog(dialog)
 
         if response:
-            ret = self.client.remote_call("unlock_device", self.list_partitions.selected_partition[0], response)
+            ret = self._run_job("unlock_device", self.list_partitions.selected_partition[0], response,
+                                message=_("Unlocking the device..."))
 
             if not ret:
                 msg = _("Unlocking failed. Are you sure provided password is correct?")
@@ -790,8 +906,7 @@ class BlivetGUI:
                 return
 
         self._handle_user_change()
-        self.list_devices.update_devices_view()
-        self.update_partitions_view()
+        self.update_views()
 
     def actions_undo(self, _widget=None):
         """ Undo last action
@@ -805,8 +920,7 @@ class BlivetGUI:
         self.client.remote_call("blivet_cancel_actions", removed_actions)
 
         self._handle_user_change()
-        self.list_devices.update_devices_view()
-        self.update_partitions_view()
+        self.update_views()
 
     def clear_actions(self, _widget=None):
         """ Clear all scheduled actions
@@ -821,8 +935,7 @@ class BlivetGUI:
         self.list_actions.clear()
 
         self._handle_user_change()
-        self.list_devices.update_devices_view()
-        self.update_partitions_view()
+        self.update_views()
 
     def show_actions(self, _widget=None, _uri=None):
         """ Show scheduled actions
@@ -851,9 +964,24 @@ class BlivetGUI:
         self.client.quit()
         sys.exit(1)
 
+    def _init_args(self):
+        return (self.ignored_disks, self.exclusive_disks, self.flags, config.size_info_mode)
+
+    @property
+    def _scan_cache(self):
+        # the cached configuration doesn't respect ignored and exclusive disks
+        return config.scan_cache and not (self.installer_mode or self.exclusive_disks or self.ignored_disks)
+
     def blivet_init(self):
+        if not self.client.init_pending:
+            self.client.remote_init_start(*self._init_args(), scan_cache=self._scan_cache)
+
         loading_window = LoadingWindow(self.main_window)
-        ret = self._run_thread(loading_window, self.client.remote_control, ("init", self.ignored_disks, self.exclusive_disks, self.flags))
+
+        def check_init():
+            return self.client.remote_init_wait(loading_window.progress_msg, loading_window.show_cached, block=False)
+
+        ret = self._wait_dialog(loading_window, check_init)
 
         if not ret.success:  # pylint: disable=maybe-no-member
             # blivet-gui is already running --> quit
@@ -876,6 +1004,25 @@ class BlivetGUI:
                 message = _("Failed to init blivet:")
                 self._reraise_exception(ret.exception, ret.traceback, message,
                                         dialog_window=loading_window)
+        elif ret.cache_mismatch:  # pylint: disable=maybe-no-member
+            self._blivet_init_cache_mismatch(ret.cache_mismatch)  # pylint: disable=maybe-no-member
+
+    def _blivet_init_cache_mismatch(self, mismatch):
+        """ Warn that the storage configuration shown while scanning was not up to date
+        """
+
+        if not (mismatch.added or mismatch.removed or mismatch.changed):
+            return
+
+        msg = _("Storage configuration changed since the last run of blivet-gui, the configuration "
+                "shown while scanning was not up to date.")
+        for names, description in ((mismatch.added, _("New devices: {names}")),
+                                   (mismatch.removed, _("Removed devices: {names}")),
+                                   (mismatch.changed, _("Changed devices: {names}"))):
+            if names:
+                msg += "\n\n" + description.format(names=", ".join(names))
+
+        self.show_warning_dialog(msg)
 
     def _blivet_init_ignore(self, exception, device_name):
 
@@ -895,24 +1042,74 @@ class BlivetGUI:
 
         return response == Gtk.ResponseType.ACCEPT
 
-    def _run_thread(self, dialog, method, args):
+    def _wait_dialog(self, dialog, check):
+        """ Run the dialog until the check function (called periodically from
+            the main loop) returns something else than None
+
+            :param dialog: dialog to run, it is stopped using its stop method
+            :param check: function returning None if we should keep waiting
+            :type check: callable
+            :returns: the value returned by the check function
+
+        """
 
         ret = []
 
-        def end():
+        def end(value):
+            ret.append(value)
             dialog.stop()
+            return False
+
+        def do_check():
+            try:
+                value = check()
+            except Exception as e:  # pylint: disable=broad-except
+                # re-raise the exception after the dialog is closed
+                return end(e)
+
+            if value is None:
+                return True
 
-        def do_it(ret):
-            ret.append(method(*args))
-            GLib.idle_add(end)
+            return end(value)
 
-        thread = threading.Thread(target=do_it, args=(ret,))
-        thread.start()
+        source = GLib.timeout_add(JOB_POLL_INTERVAL, do_check)
         dialog.start()
-        thread.join()
+
+        if not ret:
+            # the dialog went away before the check finished, stop checking
+            GLib.source_remove(source)
+            raise RuntimeError("Dialog was closed before the operation finished")
+
+        if isinstance(ret[0], Exception):
+            raise ret[0]
 
         return ret[0]
 
+    def _run_job(self, method, *args, message=None):
+        """ Run BlivetUtils method as a job in the daemon and show loading window until it finishes
+
+            :param message: message to show in the loading window instead of the default one
+            :type message: str
+            :returns: result of the method (same as :meth:`~.communication.client.BlivetGUIClient.remote_call`)
+
+        """
+
+        job_id = self.client.start_job(method, *args)
+
+        dialog = LoadingWindow(self.main_window)
+        if message:
+            dialog.progress_msg(message)
+
+        def check_job():
+            status = self.client.job_status(job_id)
+            if status.state in (JOB_FINISHED, JOB_CANCELLED):  # pylint: disable=maybe-no-member
+                return status.state  # pylint: disable=maybe-no-member
+            return None
+
+        self._wait_dialog(dialog, check_job)
+
+        return self.client.job_result(job_id)
+
     def reload(self, _widget=None):
         """ Reload storage information
 
@@ -933,14 +1130,51 @@ class BlivetGUI:
         # don't allow to ignore exceptions raised during reset
         self.exc.allow_ignore = False
 
-        loading_window = LoadingWindow(self.main_window)
-        self._run_thread(loading_window, self.client.remote_call, ("blivet_reset",))
+        self._run_job("blivet_reset")
 
         self.list_actions.clear()
 
         self._handle_user_change()
-        self.list_devices.update_devices_view()
-        self.update_partitions_view()
+
+        if config.size_info_mode == "background":
+            self.update_size_info_background()
+        self.update_views()
+
+        # allow ignoring exceptions now
+        self.exc.allow_ignore = True
+
+    def reload_disk(self, _widget=None):
+        """ Reload storage information of the selected disk only
+
+            :param widget: widget calling this function (only for calls via signal.connect)
+            :type widget: Gtk.Widget()
+
+        """
+
+        disk = self.list_devices.selected_device
+
+        if self.list_actions.actions:
+            title = _("Confirm reload disk")
+            msg = _("Pending operations on disk {name} and devices on it will be lost. "
+                    "Are you sure you want to continue?").format(name=disk.name)
+
+            response = self.show_confirmation_dialog(title, msg)
+
+            if not response:
+                return
+
+        # don't allow to ignore exceptions raised during the scan
+        self.exc.allow_ignore = False
+
+        cancelled = self._run_job("rescan_devices", [disk.name])
+
+        # blivet-gui actions can consist of actions on multiple devices, cancel the rest too
+        remaining = self.list_actions.remove(cancelled)
+        if remaining:
+            self.client.remote_call("blivet_cancel_actions", remaining)
+
+        self._handle_user_change()
+        self.update_views()
 
         # allow ignoring exceptions now
         self.exc.allow_ignore = True
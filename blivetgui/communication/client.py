@@ -21,34 +21,117 @@
 #
 # ---------------------------------------------------------------------------- #
 
-import pickle
+import collections
+import itertools
+import queue
 
 import socket
-import struct
+import traceback
+import weakref
 
-from threading import Lock
+from threading import Lock, RLock, Thread
 
+import gi
+gi.require_version("GLib", "2.0")
+
+from gi.repository import GLib
+
+from . import protocol
 from .proxy_utils import ProxyID, ProxyDataContainer
-from .errors import ServerConnectionError
+from .errors import CommunicationError, ServerConnectionError, ProtocolError
 
 from ..i18n import _
 
 # ---------------------------------------------------------------------------- #
 
 
+# attributes that don't change (or change only with a devicetree change) and are
+# worth caching, see :meth:`ClientProxyObject.cache`
+CACHED_ATTRS = ("name", "type", "is_disk", "path", "model", "sector_size")
+
+
 class ClientProxyObject:
 
-    attrs = ("client", "proxy_id")
+    attrs = ("client", "proxy_id", "_prefetched", "_cached_attrs", "_generation")
 
     def __init__(self, client, proxy_id):
         self.client = client
         self.proxy_id = proxy_id
 
+        # prefetched and cached values, valid only for the devicetree generation
+        # they were fetched with
+        self._prefetched = {}
+        self._generation = None
+        self._cached_attrs = ()
+
+    def _valid_values(self):
+        """ Prefetched and cached values, dropped when the devicetree changes
+        """
+
+        generation = self.client.generation
+        if self._generation != generation:
+            self._prefetched.clear()
+            self._generation = generation
+
+        return self._prefetched
+
+    def cache(self, *attr_names):
+        """ Remember values of the given attributes (:data:`CACHED_ATTRS` by default)
+            after reading them
+
+            ..note.: all remembered (and prefetched) values are dropped when the server
+                     reports a devicetree change
+        """
+
+        self._cached_attrs = attr_names or CACHED_ATTRS
+
+    def prefetch(self, *attr_names):
+        """ Fetch multiple attributes in one request and serve subsequent reads
+            of these attributes from the fetched values
+
+            Dotted names (e.g. "format.type") prefetch attributes of the sub-object,
+            the sub-object itself is prefetched automatically.
+
+            ..note.: values are dropped when the server reports a devicetree change,
+                     other changes of the remote object (e.g. a method call on it
+                     done by the server) are not detected
+        """
+
+        names = []
+        for attr_name in attr_names:
+            parts = attr_name.split(".")
+            for i in range(1, len(parts) + 1):
+                name = ".".join(parts[:i])
+                if name not in names:
+                    names.append(name)
+
+        answers = self.client.remote_params(self.proxy_id, names)
+
+        fetched = {}
+        for name, value in zip(names, answers):
+            fetched[name] = value
+
+            if "." in name:
+                owner_name, attr_name = name.rsplit(".", 1)
+                owner = fetched[owner_name]
+                if isinstance(owner, ClientProxyObject):
+                    owner._valid_values()[attr_name] = value
+            else:
+                self._valid_values()[name] = value
+
     def __len__(self):
         remote_ret = self.client.remote_method(self.proxy_id, "__len__", (), {})
         return remote_ret
 
     def __iter__(self):
+        # get all members in one request if possible
+        remote_items = self.client.remote_materialize(self.proxy_id)
+
+        if isinstance(remote_items, BaseException):
+            raise remote_items
+        elif remote_items is not None:
+            return iter(remote_items)
+
         remote_iter = self.client.remote_method(self.proxy_id, "__iter__", (), {})
         return remote_iter
 
@@ -81,7 +164,13 @@ class ClientProxyObject:
         return remote_str
 
     def __getattr__(self, attr_name):
-        remote_attr = self.client.remote_param(self.proxy_id, attr_name)
+        values = self._valid_values()
+        if attr_name in values:
+            remote_attr = values[attr_name]
+        else:
+            remote_attr = self.client.remote_param(self.proxy_id, attr_name)
+            if attr_name in self._cached_attrs and not isinstance(remote_attr, BaseException):
+                self._valid_values()[attr_name] = remote_attr
 
         if isinstance(remote_attr, BaseException) and attr_name not in ("exception",):
             raise remote_attr
@@ -93,6 +182,7 @@ class ClientProxyObject:
         if attr_name in self.attrs + tuple(object.__dict__):
             super().__setattr__(attr_name, value)
         else:
+            self._prefetched.pop(attr_name, None)
             remote_res = self.client.remote_method(self.proxy_id, "__setattr__", (attr_name, value), {})
 
             if isinstance(remote_res, BaseException):
@@ -102,8 +192,25 @@ class ClientProxyObject:
 
 
 class BlivetGUIClient:
+    """ Client for the blivet-gui-daemon
+
+        Every request is tagged with a request ID and answers are dispatched
+        to the waiting requests by a reader thread, so multiple requests can
+        be sent to the server without waiting for the previous answers.
+
+        Proxy objects are tracked only while they are used, when a proxy object
+        is garbage collected, its ID is released and the server drops the
+        object too. Released IDs are sent to the server in batches.
+    """
 
-    id_dict = {}
+    # number of released IDs to collect before sending them to the server
+    release_batch = 64
+
+    # devicetree generation from the last answer
+    generation = 0
+
+    # ID of the "init" request and queue with its answers, see remote_init_start
+    _init_request = None
 
     def __init__(self, server_socket):
         self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -114,17 +221,159 @@ class BlivetGUIClient:
             raise
         self.mutex = Lock()
 
+        self._init_proxy_tracking()
+        self._start_reader()
+
+    def _init_proxy_tracking(self):
+        """ Initialize bookkeeping of the proxy objects received from the server
+        """
+
+        # proxy ID -> proxy object, server always sends the same ID for the same object
+        # so (as long as it's alive) the same proxy object is returned for it
+        self.id_dict = weakref.WeakValueDictionary()
+
+        # every proxy object gets its own key, an ID can be received again for a new
+        # proxy object before the old one is finalized, proxy ID -> key of the live one
+        self._proxy_keys = {}
+        self._next_proxy_key = itertools.count()
+
+        # number of times we received the proxy ID for every proxy object (by its key)
+        self.received_ids = collections.Counter()
+
+        # IDs (with their receive counts) waiting to be released on the server
+        self.released_ids = collections.deque()
+
+        # reentrant, the garbage collector can finalize proxies while it's held
+        self._proxy_lock = RLock()
+
+    def _start_reader(self):
+        """ Start the thread reading answers from the server
+        """
+
+        self._request_ids = itertools.count(1)
+        self._requests = {}  # request ID -> (handler for the answers, expects multiple answers)
+        self._requests_lock = Lock()
+        self._closed = False
+
+        # answers are received to this buffer and decoded by the reader thread
+        # before receiving the next one
+        self._recv_buffer = protocol.ReceiveBuffer()
+
+        self._reader = Thread(target=self._read_answers, daemon=True)
+        self._reader.start()
+
+    def _read_answers(self):
+        """ Read answers from the server and pass them to handlers of the requests
+        """
+
+        while True:
+            try:
+                request_id, data = self._recv_msg()
+            except CommunicationError as e:
+                error = e
+                break
+
+            with self._requests_lock:
+                handler, multiple = self._requests.get(request_id, (None, False))
+                if handler and not multiple:
+                    del self._requests[request_id]
+
+            if handler:
+                try:
+                    handler(data)
+                except Exception:  # pylint: disable=broad-except
+                    # the reader must survive, other requests are still waiting for answers
+                    traceback.print_exc()
+
+        # connection is closed -- let everybody waiting for an answer know
+        with self._requests_lock:
+            self._closed = True
+            handlers = [handler for handler, _multiple in self._requests.values()]
+            self._requests.clear()
+
+        for handler in handlers:
+            try:
+                handler(error)
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+
+    def _send_request(self, data, handler, multiple=False):
+        """ Send a request to the server
+
+            :param data: encoded request
+            :type data: bytes
+            :param handler: function called (from the reader thread) with every
+                            answer for this request
+            :type handler: callable
+            :param multiple: whether the server sends more than one answer to this
+                             request, the request must be dropped by the caller then
+            :type multiple: bool
+            :returns: ID of the request
+            :rtype: int
+
+        """
+
+        request_id = next(self._request_ids)
+
+        with self._requests_lock:
+            if self._closed:
+                msg = _("Failed to connect to blivet-gui-daemon")
+                raise ServerConnectionError(msg)
+            self._requests[request_id] = (handler, multiple)
+
+        try:
+            with self.mutex:
+                if len(self.released_ids) >= self.release_batch:
+                    self._send_released()
+                self._send(data, request_id)
+        except ServerConnectionError:
+            self._drop_request(request_id)
+            raise
+
+        return request_id
+
+    def _drop_request(self, request_id):
+        with self._requests_lock:
+            self._requests.pop(request_id, None)
+
+    def _wait_answer(self, answers):
+        """ Wait for next answer from the server
+
+            :param answers: queue the answers for a request are put to
+            :type answers: queue.Queue
+
+        """
+
+        data = answers.get()
+
+        if isinstance(data, CommunicationError):
+            raise data
+
+        return data
+
+    def _request(self, data):
+        """ Send a request to the server and wait for the answer
+        """
+
+        answers = queue.Queue()
+        self._send_request(data, answers.put)
+
+        return self._wait_answer(answers)
+
     def _answer_convert_to_object(self, answer):
         """ All data sent from server to BlivetGUI must be either built-in types (int, str...) or
             ClientProxyObject, never ProxyID
         """
 
         if isinstance(answer, ProxyID):
-            if answer.id in self.id_dict:  # we already received this id before and have our proxy object for it
-                return self.id_dict[answer.id]
-            else:
-                self.id_dict[answer.id] = ClientProxyObject(client=self, proxy_id=answer)  # new id, create new proxy object
-                return self.id_dict[answer.id]  # and return it
+            with self._proxy_lock:
+                proxy = self.id_dict.get(answer.id)
+                if proxy is None:  # new id (or we already dropped our proxy for it), create new proxy object
+                    proxy = ClientProxyObject(client=self, proxy_id=answer)
+                    self.id_dict[answer.id] = proxy
+                    self._track_proxy(proxy)
+                self._proxy_received(answer.id)
+            return proxy
         elif isinstance(answer, (list, tuple)):
             new_answer = []
             for item in answer:
@@ -132,9 +381,81 @@ class BlivetGUIClient:
             if isinstance(answer, tuple):
                 return tuple(new_answer)
             return new_answer
+        elif isinstance(answer, ProxyDataContainer):
+            new_answer = ProxyDataContainer()
+            for item in answer:
+                new_answer[item] = self._answer_convert_to_object(answer[item])
+            return new_answer
+        elif isinstance(answer, dict):
+            return {key: self._answer_convert_to_object(value) for key, value in answer.items()}
         else:
             return answer
 
+    def _track_proxy(self, proxy):
+        """ Release the proxy ID when the proxy object is garbage collected
+        """
+
+        key = next(self._next_proxy_key)
+        self._proxy_keys[proxy.proxy_id.id] = key
+
+        finalizer = weakref.finalize(proxy, self._proxy_released, proxy.proxy_id.id, key)
+        finalizer.atexit = False
+
+    def _proxy_received(self, obj_id):
+        self.received_ids[self._proxy_keys[obj_id]] += 1
+
+    def _proxy_released(self, obj_id, key):
+        # called by the garbage collector (from any thread), so just remember the
+        # ID here, server needs to know how many times we received it for this
+        # proxy object because the same ID could have been sent to us again for
+        # a new one in the meantime
+        with self._proxy_lock:
+            self.released_ids.append((obj_id, self.received_ids.pop(key, 0)))
+            if self._proxy_keys.get(obj_id) == key:
+                del self._proxy_keys[obj_id]
+
+    def _send_released(self):
+        """ Send released proxy IDs to the server
+
+            ..note.: must be called with the mutex held, server doesn't answer this message
+        """
+
+        with self._proxy_lock:
+            released = list(self.released_ids)
+            self.released_ids.clear()
+
+        if released:
+            self._send(protocol.encode(("release", released)), 0)
+
+    def proxy_stats(self):
+        """ Get number of live proxy objects on both sides of the connection
+
+            :returns: number of proxy objects on the server ("server_live"), total number
+                      of objects released on the server ("server_released"), number of
+                      live proxy objects here ("client_live") and IDs waiting to be
+                      released ("client_pending")
+            :rtype: :class:`~.proxy_utils.ProxyDataContainer`
+
+        """
+
+        stats = self.remote_control("proxy_stats")
+        stats["client_live"] = len(self.id_dict)
+        stats["client_pending"] = len(self.released_ids)
+
+        return stats
+
+    def request_stats(self):
+        """ Get timing of the requests processed by the server
+
+            :returns: request type and method -> count, total, p50, p99, max, encode,
+                      received and sent (see :class:`~.stats.RequestStats`) or None
+                      if the server wasn't started with profiling enabled
+            :rtype: dict of :class:`~.proxy_utils.ProxyDataContainer`
+
+        """
+
+        return self.remote_control("stats")
+
     def _args_convert_to_id(self, args):
         """ All args sent from client to server must be either built-in types (int, str...) or
             ProxyID (or ProxyDataContainer), never ClientProxyObject
@@ -152,6 +473,8 @@ class BlivetGUIClient:
                         arg_id[item] = arg[item].proxy_id
                     elif isinstance(arg[item], (list, tuple)):
                         arg_id[item] = self._args_convert_to_id(arg[item])
+                    elif isinstance(arg[item], dict):
+                        arg_id[item] = self._args_convert_to_id([arg[item]])[0]
                     else:
                         arg_id[item] = arg[item]
                 args_id.append(arg_id)
@@ -159,6 +482,8 @@ class BlivetGUIClient:
                 args_id.append(arg.proxy_id)
             elif isinstance(arg, (list, tuple)):
                 args_id.append(self._args_convert_to_id(arg))
+            elif isinstance(arg, dict):
+                args_id.append({key: self._args_convert_to_id([value])[0] for key, value in arg.items()})
             else:
                 args_id.append(arg)
 
@@ -168,12 +493,126 @@ class BlivetGUIClient:
         """ Call a method on server
         """
 
-        pickled_data = pickle.dumps(("call", method, self._args_convert_to_id(args)))
+        encoded_data = protocol.encode(("call", method, self._args_convert_to_id(args)))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
+
+        return self._call_result(answer)
+
+    def remote_call_async(self, method, *args, callback):
+        """ Call a method on server without waiting for the answer
+
+            :param callback: function called (from the main loop) with the result
+                             of the call or with the exception raised by the call
+            :type callback: callable
+
+        """
+
+        encoded_data = protocol.encode(("call", method, self._args_convert_to_id(args)))
+
+        def _answer(data):
+            GLib.idle_add(self._async_answer, data, callback)
+
+        self._send_request(encoded_data, _answer)
+
+    def _async_answer(self, data, callback):
+        if isinstance(data, CommunicationError):
+            result = data
+        else:
+            try:
+                result = self._call_result(data)
+            except Exception as e:  # pylint: disable=broad-except
+                result = e
+
+        callback(result)
+
+        return False
+
+    def start_job(self, method, *args):
+        """ Start a BlivetUtils method in background on the server
+
+            ..note.: other requests are processed by the server while the job runs
+                     (with the exception of jobs changing the whole devicetree, the
+                     requests are processed after they finish then), use
+                     :meth:`job_status` to check the state of the job and
+                     :meth:`job_result` to get its result
 
+            :returns: ID of the job
+            :rtype: int
+
+        """
+
+        encoded_data = protocol.encode(("job_start", method, self._args_convert_to_id(args)))
+
+        return self._answer_convert_to_object(self._request(encoded_data))
+
+    def job_status(self, job_id):
+        """ Get state of the job
+
+            :returns: state of the job ("state", see :mod:`~.jobs`) and progress messages
+                      reported by the job since the last check ("progress")
+            :rtype: :class:`~.proxy_utils.ProxyDataContainer`
+
+        """
+
+        encoded_data = protocol.encode(("job_status", job_id))
+        answer = self._answer_convert_to_object(self._request(encoded_data))
+
+        if isinstance(answer, BaseException):
+            raise answer
+
+        return answer
+
+    def job_result(self, job_id):
+        """ Wait for the job to finish and get its result, same as :meth:`remote_call`
+        """
+
+        encoded_data = protocol.encode(("job_result", job_id))
+
+        return self._call_result(self._request(encoded_data))
+
+    def job_cancel(self, job_id):
+        """ Cancel the job
+
+            ..note.: only jobs that didn't start yet and running blivet_do_it can be
+                     cancelled, blivet_do_it stops before the next action
+
+            :returns: whether the job will be cancelled
+            :rtype: bool
+
+        """
+
+        encoded_data = protocol.encode(("job_cancel", job_id))
+
+        return self._answer_convert_to_object(self._request(encoded_data))
+
+    def watch_devices(self, callback):
+        """ Ask the server to monitor block devices and update the devicetree when
+            devices are added, removed or changed
+
+            :param callback: function called (from the main loop) every time the server
+                             received udev events with :class:`~.proxy_utils.ProxyDataContainer`
+                             with the events ("events"), whether the devicetree was updated
+                             ("applied") and exception ("exception" and "traceback") if the
+                             update failed
+            :type callback: callable
+
+        """
+
+        encoded_data = protocol.encode(("watch",))
+
+        def _notification(data):
+            if not isinstance(data, CommunicationError):
+                GLib.idle_add(self._watch_notification, data, callback)
+
+        self._send_request(encoded_data, _notification, multiple=True)
+
+    def _watch_notification(self, data, callback):
+        callback(self._answer_convert_to_object(data))
+
+        return False
+
+    def _call_result(self, answer):
         ret = self._answer_convert_to_object(answer)
 
         if not ret.success:  # pylint: disable=maybe-no-member
@@ -186,11 +625,19 @@ class BlivetGUIClient:
         """ Get a param of proxy_id object
         """
 
-        pickled_data = pickle.dumps(("param", proxy_id, param_name))
+        encoded_data = protocol.encode(("param", proxy_id, param_name))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
+
+        return self._answer_convert_to_object(answer)
+
+    def remote_params(self, proxy_id, param_names):
+        """ Get multiple params of proxy_id object in one request
+        """
+
+        encoded_data = protocol.encode(("params", proxy_id, list(param_names)))
+
+        answer = self._request(encoded_data)
 
         return self._answer_convert_to_object(answer)
 
@@ -198,11 +645,9 @@ class BlivetGUIClient:
         """ Call remotely a method on proxy_id object
         """
 
-        pickled_data = pickle.dumps(("method", proxy_id, method_name, args, kwargs))
+        encoded_data = protocol.encode(("method", proxy_id, method_name, args, kwargs))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
 
         return self._answer_convert_to_object(answer)
 
@@ -210,11 +655,20 @@ class BlivetGUIClient:
         """ Ask for a next member of iterable proxy_id object
         """
 
-        pickled_data = pickle.dumps(("next", proxy_id))
+        encoded_data = protocol.encode(("next", proxy_id))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
+
+        return self._answer_convert_to_object(answer)
+
+    def remote_materialize(self, proxy_id):
+        """ Ask for all members of iterable proxy_id object, returns None if the
+            object must be iterated using :meth:`remote_next`
+        """
+
+        encoded_data = protocol.encode(("materialize", proxy_id))
+
+        answer = self._request(encoded_data)
 
         return self._answer_convert_to_object(answer)
 
@@ -222,11 +676,9 @@ class BlivetGUIClient:
         """ Ask for a member of iterable proxy_id object
         """
 
-        pickled_data = pickle.dumps(("key", proxy_id, key))
+        encoded_data = protocol.encode(("key", proxy_id, key))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
 
         return self._answer_convert_to_object(answer)
 
@@ -234,97 +686,174 @@ class BlivetGUIClient:
         """ Send a control command to server
         """
 
-        pickled_data = pickle.dumps((command, args))
+        encoded_data = protocol.encode((command, args))
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+        answer = self._request(encoded_data)
 
         return self._answer_convert_to_object(answer)
 
-    def remote_do_it(self, show_progress_clbk):
+    def remote_init_start(self, *args, scan_cache=False):
+        """ Ask the server to start scanning storage without waiting for the result
 
-        pickled_data = pickle.dumps(("call", "blivet_do_it", ()))
+            :param scan_cache: send the storage configuration saved after the last
+                               scan before scanning (and save the new one)
+            :type scan_cache: bool
 
-        with self.mutex:
-            self._send(pickled_data)
-            answer = pickle.loads(self._recv_msg())
+            ..note.: scanning runs while the client is starting, the result (and progress
+                     messages) are collected using :meth:`remote_init_wait`
+        """
 
-            ret = self._answer_convert_to_object(answer)
+        if scan_cache:
+            encoded_data = protocol.encode(("init", args, True))
+        else:
+            encoded_data = protocol.encode(("init", args))
+
+        answers = queue.Queue()
+        request_id = self._send_request(encoded_data, answers.put, multiple=True)
+        self._init_request = (request_id, answers)
 
+    @property
+    def init_pending(self):
+        """ Whether the server is scanning storage and :meth:`remote_init_wait` wasn't called yet
+        """
+
+        return self._init_request is not None
+
+    def remote_init_wait(self, show_progress_clbk, show_cached_clbk=None, block=True):
+        """ Wait for the result of the "init" request started using :meth:`remote_init_start`
+
+            :param show_progress_clbk: function called with progress messages from the server
+            :type show_progress_clbk: callable
+            :param show_cached_clbk: function called with the cached storage configuration
+                                     (see :meth:`~..scan_cache.ScanCache.load`)
+            :type show_cached_clbk: callable
+            :param block: wait for the result, if False only the already received answers
+                          are processed and None is returned if the result wasn't received yet
+            :type block: bool
+
+        """
+
+        request_id, answers = self._init_request
+
+        try:
             while True:
+                if not block and answers.empty():
+                    return None
+
+                ret = self._answer_convert_to_object(self._wait_answer(answers))
                 if ret[0]:  # pylint: disable=maybe-no-member
                     break
 
-                show_progress_clbk(ret[1])
+                if isinstance(ret[1], ProxyDataContainer):
+                    if show_cached_clbk is not None:
+                        show_cached_clbk(ret[1])
+                else:
+                    show_progress_clbk(ret[1])
+        except BaseException:
+            self._drop_request(request_id)
+            self._init_request = None
+            raise
 
-                answer = pickle.loads(self._recv_msg())
-                ret = self._answer_convert_to_object(answer)
+        self._drop_request(request_id)
+        self._init_request = None
 
         return ret[1]
 
-    def quit(self):
-        """ Quit the client
-        """
+    def remote_do_it(self, show_progress_clbk, parallel=False):
+        """ Run blivet_do_it on the server
 
-        pickled_data = pickle.dumps(("quit",))
+            :param show_progress_clbk: function called with progress events from the server
+            :type show_progress_clbk: callable
+            :param parallel: create filesystems on independent disks in parallel
+            :type parallel: bool
 
-        with self.mutex:
-            self._send(pickled_data)
-            self.sock.close()
+        """
 
-    def _recv_msg(self):
-        """ Receive a message from server
+        encoded_data = protocol.encode(("call", "blivet_do_it", (parallel,)))
 
-            ..note.: first four bytes represents message length
-        """
-        raw_msglen = self._recv_data(4)
+        # progress messages and the result are all sent as answers to this request
+        answers = queue.Queue()
+        request_id = self._send_request(encoded_data, answers.put, multiple=True)
 
-        if not raw_msglen:
-            msg = _("Failed to connect to blivet-gui-daemon")
-            raise ServerConnectionError(msg)
+        try:
+            while True:
+                ret = self._answer_convert_to_object(self._wait_answer(answers))
+                if ret[0]:  # pylint: disable=maybe-no-member
+                    break
 
-        msglen = struct.unpack(">I", raw_msglen)[0]
+                show_progress_clbk(ret[1])
+        finally:
+            self._drop_request(request_id)
 
-        data = self._recv_data(msglen)
+        return ret[1]
 
-        if not data:
-            msg = _("Failed to connect to blivet-gui-daemon")
-            raise ServerConnectionError(msg)
+    def remote_do_it_cancel(self):
+        """ Ask the server to stop the running blivet_do_it before the next action
 
-        return data
+            ..note.: the server doesn't answer this message, blivet_do_it returns
+                     a result with "cancelled" set instead
+        """
 
-    def _recv_data(self, length):
-        """ Receive 'length' of data from client
+        encoded_data = protocol.encode(("cancel",))
 
-            :param length: length of data to receive
-            :type length: int
+        with self.mutex:
+            self._send(encoded_data, 0)
 
+    def quit(self):
+        """ Quit the client
         """
 
-        data = b""
-
-        while len(data) < length:
+        encoded_data = protocol.encode(("quit",))
 
+        with self.mutex:
             try:
-                packet = self.sock.recv(length - len(data))
+                self._send(encoded_data, 0)
+            except ServerConnectionError:
+                # daemon is already gone
+                pass
+            # wake up the reader thread waiting for data
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # already disconnected
+                pass
+            self.sock.close()
 
-            except (OSError, BrokenPipeError) as e:
-                msg = _("Failed to connect to blivet-gui-daemon")
-                raise ServerConnectionError(msg) from e
+    def _recv_msg(self):
+        """ Receive a message from server
 
-            if not packet:
-                return None
+            :returns: ID of the request this message answers and the decoded message
+                      (or ProtocolError if the message couldn't be decoded)
+            :rtype: tuple of (int, object)
 
-            data += packet
+        """
 
-        return data
+        try:
+            message = protocol.recv_message(self.sock, self._recv_buffer)
+        except OSError as e:
+            msg = _("Failed to connect to blivet-gui-daemon")
+            raise ServerConnectionError(msg) from e
+
+        if message is None:
+            msg = _("Failed to connect to blivet-gui-daemon")
+            raise ServerConnectionError(msg)
+
+        request_id, encoding, data, generation = message
+        self.generation = generation
+
+        # the data is only a view of the receive buffer, decode it now
+        try:
+            answer = protocol.decode(encoding, data)
+        except Exception as e:  # pylint: disable=broad-except
+            answer = ProtocolError("Failed to decode answer from blivet-gui-daemon: %s" % e)
+        finally:
+            data.release()
 
-    def _send(self, data):
-        data = struct.pack(">I", len(data)) + data
+        return request_id, answer
 
+    def _send(self, data, request_id):
         try:
-            self.sock.sendall(data)
+            protocol.send_message(self.sock, request_id, data)
 
         except (OSError, BrokenPipeError) as e:
             msg = _("Failed to connect to blivet-gui-daemon")
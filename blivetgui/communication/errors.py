@@ -28,3 +28,7 @@ class CommunicationError(Exception):
 
 class ServerConnectionError(CommunicationError):
     pass
+
+
+class ProtocolError(CommunicationError):
+    pass
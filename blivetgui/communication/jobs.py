@@ -0,0 +1,272 @@
+# jobs.py
+# Long running BlivetUtils calls running in background in blivet-gui-daemon
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+import collections
+import itertools
+import queue
+import socket
+import threading
+
+# ---------------------------------------------------------------------------- #
+
+# job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_CANCELLED = "cancelled"  # cancelled before it started
+
+# ---------------------------------------------------------------------------- #
+
+
+class Job:
+    """ A single BlivetUtils call running in background """
+
+    def __init__(self, job_id, method, args, exclusive=False, cancellable=False):
+        """
+            :param job_id: ID of the job
+            :type job_id: int
+            :param method: name of the BlivetUtils method
+            :type method: str
+            :param args: arguments for the method
+            :type args: list
+            :param exclusive: whether no other requests can be processed while the job runs
+            :type exclusive: bool
+            :param cancellable: whether the job can be cancelled while running
+            :type cancellable: bool
+
+        """
+
+        self.id = job_id
+        self.method = method
+        self.args = args
+        self.exclusive = exclusive
+        self.cancellable = cancellable
+
+        self.state = JOB_QUEUED
+        self.result = None
+
+        # progress messages not fetched by the client yet
+        self.progress = collections.deque()
+
+        # IDs of the "job_result" requests waiting for the job to finish
+        self.result_requests = []
+
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.state in (JOB_FINISHED, JOB_CANCELLED)
+
+    def report_progress(self, message):
+        """ Progress hook for the method (can be called from any thread) """
+
+        self.progress.append(message)
+
+    def take_progress(self):
+        """ Get progress messages reported since the last call """
+
+        messages = []
+        while self.progress:
+            messages.append(self.progress.popleft())
+
+        return messages
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancel_requested(self):
+        """ Cancel check for the method """
+
+        return self._cancel.is_set()
+
+
+class JobManager:
+    """ Run jobs one by one in a worker thread
+
+        The server is notified about finished jobs using a socket, this object
+        can be used with select() to wait for them. Jobs are only run here, the
+        server still encodes and sends all the answers itself.
+    """
+
+    def __init__(self, run_job, max_unfetched=16):
+        """
+            :param run_job: function running the job (in the worker thread) and
+                            returning its result
+            :type run_job: callable
+            :param max_unfetched: number of finished jobs kept for the client to
+                                  fetch their results, older ones are forgotten
+            :type max_unfetched: int
+
+        """
+
+        self._run_job = run_job
+        self.max_unfetched = max_unfetched
+
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._worker = None
+
+        # guards starting a queued job against cancelling it at the same time
+        self._lock = threading.Lock()
+
+        # all jobs the client didn't get result of yet
+        self.jobs = {}
+
+        # jobs started and not yet reported as finished by :meth:`take_finished`
+        self._unfinished = set()
+        self._finished = collections.deque()
+
+        # finished jobs nobody asked for result of yet, oldest first (values are unused)
+        self._unfetched = collections.OrderedDict()
+
+        self._read, self._write = socket.socketpair()
+
+    def fileno(self):
+        return self._read.fileno()
+
+    @property
+    def active(self):
+        """ Whether there are jobs not reported as finished yet """
+
+        return bool(self._unfinished)
+
+    @property
+    def exclusive_active(self):
+        """ Whether there is an exclusive job not reported as finished yet """
+
+        return any(self.jobs[job_id].exclusive for job_id in self._unfinished)
+
+    def reported(self, job_id):
+        """ Whether the job finished and was already returned by :meth:`take_finished` """
+
+        return job_id not in self._unfinished
+
+    def start(self, method, args, exclusive=False, cancellable=False):
+        """ Start a new job (jobs run in the order they were started)
+
+            :returns: the new job
+            :rtype: :class:`Job`
+
+        """
+
+        job = Job(next(self._ids), method, args, exclusive, cancellable)
+        self.jobs[job.id] = job
+        self._unfinished.add(job.id)
+
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+        self._queue.put(job)
+
+        return job
+
+    def cancel(self, job_id):
+        """ Cancel a job
+
+            ..note.: jobs that didn't start yet are always cancelled, running jobs
+                     only if they are cancellable (they still finish with a result)
+
+            :returns: whether the job will be cancelled
+            :rtype: bool
+
+        """
+
+        job = self.jobs[job_id]
+
+        with self._lock:
+            if job.done:
+                return False
+
+            job.cancel()
+
+            return job.state == JOB_QUEUED or job.cancellable
+
+    def take_finished(self):
+        """ Get jobs finished since the last call
+
+            :rtype: list of :class:`Job`
+
+        """
+
+        # drop notifications, all finished jobs are in the queue already
+        self._read.setblocking(False)
+        try:
+            while self._read.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            self._read.setblocking(True)
+
+        finished = []
+        while self._finished:
+            job = self._finished.popleft()
+            self._unfinished.discard(job.id)
+            if not job.result_requests:
+                self._unfetched[job.id] = None
+            finished.append(job)
+
+        while len(self._unfetched) > self.max_unfetched:
+            job_id, _none = self._unfetched.popitem(last=False)
+            del self.jobs[job_id]
+
+        return finished
+
+    def forget(self, job_id):
+        """ Forget the job after its result was sent to the client """
+
+        del self.jobs[job_id]
+        self._unfetched.pop(job_id, None)
+
+    def stop(self):
+        """ Cancel all jobs, wait for the running one to finish and forget all jobs """
+
+        for job in self.jobs.values():
+            job.cancel()
+
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+        # nobody is going to ask for the results now
+        self.jobs.clear()
+        self._unfinished.clear()
+        self._finished.clear()
+        self._unfetched.clear()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            with self._lock:
+                if job.cancel_requested():
+                    job.state = JOB_CANCELLED
+                else:
+                    job.state = JOB_RUNNING
+
+            if job.state == JOB_RUNNING:
+                job.result = self._run_job(job)
+                job.state = JOB_FINISHED
+
+            self._finished.append(job)
+            self._write.send(b"j")
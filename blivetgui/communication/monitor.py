@@ -0,0 +1,176 @@
+# monitor.py
+# Monitoring of udev events for block devices in blivet-gui-daemon
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+import collections
+import socket
+import threading
+import time
+
+from blivet import udev
+
+# ---------------------------------------------------------------------------- #
+
+# udev actions we are interested in, other actions (e.g. "bind") don't change the devicetree
+DEVICE_ACTIONS = ("add", "remove", "change")
+
+
+class LocalEvent:
+    """ Event from :class:`LocalEventSource` looking like a pyudev.Device """
+
+    def __init__(self, action, name, properties=None):
+        self.action = action
+        self.sys_name = name
+        self.sys_path = "/sys/class/block/%s" % name
+        self.properties = properties or {}
+
+
+class LocalEventSource:
+    """ Stand-in for pyudev.Monitor, events are injected using :meth:`inject`
+
+        ..note.: this is intended only for testing, it allows to "add" or
+                 "remove" devices without real hardware
+    """
+
+    def __init__(self):
+        self._read, self._write = socket.socketpair()
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        return self._read.fileno()
+
+    def inject(self, action, name, properties=None):
+        """ Inject a new event (can be called from any thread)
+
+            :param action: udev action ("add", "remove" or "change")
+            :type action: str
+            :param name: name of the device
+            :type name: str
+            :param properties: udev properties of the device
+            :type properties: dict
+
+        """
+
+        with self._lock:
+            self._events.append(LocalEvent(action, name, properties))
+            self._write.send(b"e")
+
+    def poll(self, timeout=None):
+        """ Get next event, None if there are no events """
+
+        with self._lock:
+            if not self._events:
+                return None
+
+            self._read.recv(1)
+            return self._events.popleft()
+
+    def close(self):
+        self._read.close()
+        self._write.close()
+
+
+class DeviceMonitor:
+    """ Collect udev events for block devices
+
+        Events usually come in bursts (e.g. a new disk and all its partitions),
+        they are reported only after no new event was received for `delay`
+        seconds. This object can be used with select() to wait for new events.
+    """
+
+    def __init__(self, source=None, delay=1.0):
+        """
+            :param source: source of the events (pyudev.Monitor-like object), a new
+                           pyudev.Monitor for the block subsystem is used if not specified
+            :type source: pyudev.Monitor or :class:`LocalEventSource`
+            :param delay: how long to wait for more events before reporting them (in seconds)
+            :type delay: float
+
+        """
+
+        if source is None:
+            import pyudev
+
+            source = pyudev.Monitor.from_netlink(pyudev.Context())
+            source.filter_by("block")
+            source.start()
+
+        self.source = source
+        self.delay = delay
+
+        # received events -- (action, device name)
+        self.events = []
+        self._deadline = None
+
+    def fileno(self):
+        return self.source.fileno()
+
+    def receive(self):
+        """ Receive all available events
+        """
+
+        received = False
+
+        while True:
+            device = self.source.poll(timeout=0)
+            if device is None:
+                break
+
+            if device.action not in DEVICE_ACTIONS:
+                continue
+
+            self.events.append((device.action, udev.device_get_name(udev.device_to_dict(device))))
+            received = True
+
+        if received:
+            self._deadline = time.monotonic() + self.delay
+
+    def timeout(self):
+        """ Seconds until the received events should be reported
+
+            :returns: number of seconds or None if there are no events
+            :rtype: float or None
+
+        """
+
+        if not self.events:
+            return None
+
+        return max(0, self._deadline - time.monotonic())
+
+    def take(self):
+        """ Get the received events and forget them
+
+            :returns: list of (action, device name)
+            :rtype: list of tuple
+
+        """
+
+        events = self.events
+        self.events = []
+        self._deadline = None
+
+        return events
+
+    def discard(self):
+        """ Drop all received events and events waiting to be received
+        """
+
+        self.receive()
+        self.take()
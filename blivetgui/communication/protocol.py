@@ -0,0 +1,262 @@
+# protocol.py
+# Wire format of the messages exchanged between blivet-gui and blivet-gui-daemon
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+import marshal
+import pickle
+import struct
+
+from .errors import ProtocolError
+from .proxy_utils import ProxyID, ProxyDataContainer
+
+# ---------------------------------------------------------------------------- #
+
+PROTOCOL_VERSION = 2
+
+# every message starts with a header: protocol version, payload encoding,
+# payload length, ID of the request the message belongs to and devicetree
+# generation (answers only, see BlivetUtils.generation)
+HEADER = struct.Struct(">BBIII")
+
+# payload encodings
+PICKLE = 0
+MARSHAL = 1  # only built-in types (str, int, float, bool, None, lists, tuples, dicts...)
+MARSHAL_PROXY_ID = 2  # ProxyID sent as the (marshalled) id
+MARSHAL_PROXY_REQUEST = 3  # request for a proxy object -- tuple with ProxyID as the second item
+
+# flag for answers to successful "call" requests -- ProxyDataContainer(success=True, answer=...)
+# with the answer encoded using the encoding from the remaining bits
+CALL_RESULT = 0x80
+
+MARSHAL_VERSION = 4
+
+# types worth trying to marshal (their members still might need pickling)
+MARSHAL_TYPES = (str, int, float, bool, type(None), list, tuple, dict, ProxyID)
+
+# ---------------------------------------------------------------------------- #
+
+
+def _marshal(message):
+    """ Encode the message using marshal, returns None if not possible
+    """
+
+    try:
+        if isinstance(message, ProxyID):
+            return MARSHAL_PROXY_ID, marshal.dumps(message.id, MARSHAL_VERSION)
+
+        if type(message) is tuple and len(message) > 1 and isinstance(message[1], ProxyID):
+            proxy_message = message[:1] + (message[1].id,) + message[2:]
+            return MARSHAL_PROXY_REQUEST, marshal.dumps(proxy_message, MARSHAL_VERSION)
+
+        return MARSHAL, marshal.dumps(message, MARSHAL_VERSION)
+
+    except ValueError:
+        # not only built-in types
+        return None
+
+
+def encode(message):
+    """ Encode a message
+
+        Messages (and answers) containing only built-in types are encoded using
+        marshal which is faster and more compact than pickle, everything else
+        (blivet.size.Size, exceptions, ProxyDataContainer...) is pickled.
+        Results of successful "call" requests are sent without the container
+        if the answer itself can be marshalled.
+
+        :param message: message to encode
+        :returns: payload encoding and the encoded payload
+        :rtype: tuple of (int, bytes)
+
+    """
+
+    if isinstance(message, ProxyDataContainer):
+        kwargs = message.kwargs
+        if len(kwargs) == 2 and kwargs.get("success") is True and type(kwargs.get("answer")) in MARSHAL_TYPES:
+            encoded = _marshal(kwargs["answer"])
+            if encoded:
+                return CALL_RESULT | encoded[0], encoded[1]
+
+    elif type(message) in MARSHAL_TYPES:
+        encoded = _marshal(message)
+        if encoded:
+            return encoded
+
+    return PICKLE, pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode(encoding, data):
+    """ Decode a message
+
+        :param encoding: payload encoding
+        :type encoding: int
+        :param data: encoded payload
+        :type data: bytes-like object
+
+    """
+
+    if encoding & CALL_RESULT:
+        return ProxyDataContainer(success=True, answer=decode(encoding & ~CALL_RESULT, data))
+
+    if encoding == PICKLE:
+        return pickle.loads(data)
+
+    elif encoding == MARSHAL:
+        return marshal.loads(data)
+
+    elif encoding == MARSHAL_PROXY_ID:
+        return ProxyID(marshal.loads(data))
+
+    elif encoding == MARSHAL_PROXY_REQUEST:
+        message = marshal.loads(data)
+        return message[:1] + (ProxyID(message[1]),) + message[2:]
+
+    else:
+        raise ProtocolError("Unknown message encoding %d" % encoding)
+
+
+def send_message(sock, request_id, encoded, generation=0):
+    """ Send an encoded message
+
+        :param sock: socket to send the message to
+        :type sock: socket.socket
+        :param request_id: ID of the request this message belongs to
+        :type request_id: int
+        :param encoded: encoded message (from :func:`encode`)
+        :type encoded: tuple of (int, bytes)
+        :param generation: current devicetree generation
+        :type generation: int
+
+    """
+
+    encoding, data = encoded
+    sock.sendall(HEADER.pack(PROTOCOL_VERSION, encoding, len(data), request_id, generation) + data)
+
+
+class ReceiveBuffer:
+    """ Reusable buffer for receiving messages
+
+        Data are received directly to the buffer, as much as available, so
+        multiple small messages can be received using a single syscall. The
+        buffer only grows, after receiving the first large message no new
+        allocations are needed for the following ones.
+    """
+
+    def __init__(self, size=64 * 1024):
+        self._data = bytearray(size)
+        self._view = memoryview(self._data)
+
+        self._start = 0  # start of the data not processed yet
+        self._end = 0  # end of the received data
+
+    @property
+    def pending(self):
+        """ Number of received bytes not processed yet
+        """
+
+        return self._end - self._start
+
+    def fill(self, sock, length):
+        """ Make sure at least 'length' bytes are available in the buffer,
+            returns False if the connection was closed
+        """
+
+        if self._end - self._start >= length:
+            return True
+
+        if self._start == self._end:
+            # everything processed, start from the beginning
+            self._start = self._end = 0
+
+        if self._start + length > len(self._data):
+            pending = self._end - self._start
+            if length > len(self._data):
+                # not enough space -- allocate a bigger buffer
+                data = bytearray(max(length, 2 * len(self._data)))
+                data[:pending] = self._view[self._start:self._end]
+                self._data = data
+                self._view = memoryview(self._data)
+            else:
+                # move the (usually few) pending bytes to the start, the ranges can
+                # overlap so copy them first (same length, the buffer is not resized)
+                self._data[:pending] = bytes(self._view[self._start:self._end])
+            self._start = 0
+            self._end = pending
+
+        while self._end - self._start < length:
+            size = sock.recv_into(self._view[self._end:])
+            if not size:
+                return False
+            self._end += size
+
+        return True
+
+    def take(self, length):
+        """ Get a view of next 'length' bytes in the buffer
+
+            ..note.: the view is valid only until the next :meth:`fill`
+        """
+
+        start = self._start
+        self._start = start + length
+
+        return self._view[start:self._start]
+
+    def take_header(self):
+        """ Unpack the message header from the buffer
+        """
+
+        start = self._start
+        self._start = start + HEADER.size
+
+        return HEADER.unpack_from(self._data, start)
+
+
+def recv_message(sock, buffer=None):
+    """ Receive a message
+
+        :param sock: socket to receive the message from
+        :type sock: socket.socket
+        :param buffer: buffer to receive the message to, if not specified
+                       a new one is allocated for the message
+        :type buffer: :class:`ReceiveBuffer`
+        :returns: ID of the request, payload encoding, the encoded payload and
+                  devicetree generation or None if the connection was closed
+        :rtype: tuple of (int, int, memoryview, int) or None
+
+        ..note.: the payload is a view of the buffer which is valid only until
+                 the next message is received to the same buffer -- decode it
+                 first; when reusing the buffer, all messages from the socket
+                 must be received using it
+
+    """
+
+    if buffer is None:
+        buffer = ReceiveBuffer(size=HEADER.size)
+
+    if not buffer.fill(sock, HEADER.size):
+        return None
+
+    version, encoding, length, request_id, generation = buffer.take_header()
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError("Unsupported protocol version %d (expected %d)" % (version, PROTOCOL_VERSION))
+
+    if not buffer.fill(sock, length):
+        return None
+
+    return request_id, encoding, buffer.take(length), generation
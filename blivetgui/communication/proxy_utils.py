@@ -58,8 +58,11 @@ class ProxyID:
 
     _newid_gen = functools.partial(next, itertools.count())
 
-    def __init__(self):
-        self.id = self._newid_gen()  # pylint: disable=assignment-from-no-return
+    def __init__(self, obj_id=None):
+        if obj_id is None:
+            self.id = self._newid_gen()  # pylint: disable=assignment-from-no-return
+        else:
+            self.id = obj_id
 
     def __repr__(self):
         return "'Proxy ID, %s'" % self.id
@@ -21,21 +21,30 @@
 #
 # ---------------------------------------------------------------------------- #
 
-from blivet import size
+from blivet import size, udev
 from blivet.errors import DiskLabelScanError, CorruptGPTError
 
 import traceback
 import inspect
+import logging
+import select
+import time
+import weakref
 
-import struct
+from collections.abc import Iterable, Iterator, Sized
 
 import socketserver
-import pickle
 
+from . import protocol
 from .constants import ServerInitResponse
+from .errors import ProtocolError
+from .jobs import JobManager, JOB_CANCELLED
+from .monitor import DeviceMonitor
 from .proxy_utils import ProxyID, ProxyDataContainer
 
 from ..blivet_utils import BlivetUtils
+from ..config import config
+from ..scan_cache import ScanCache, compare_snapshots
 
 # ---------------------------------------------------------------------------- #
 
@@ -48,12 +57,15 @@ class BlivetProxyObject:
     """ Class representing unpicklable objects
     """
 
-    attrs = ("blivet_object", "id")
+    attrs = ("blivet_object", "id", "refs")
 
     def __init__(self, blivet_object, obj_id):
         self.blivet_object = blivet_object
         self.id = obj_id
 
+        # how many times was the ID sent to the client and not released yet
+        self.refs = 0
+
     def __getattr__(self, name):
         if not hasattr(self.blivet_object, name):
             raise AttributeError
@@ -96,111 +108,272 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
     blivet_utils = None
     object_dict = {}
 
+    # id() of the proxied objects -> their proxy objects, so the same object is
+    # always sent with the same ProxyID (entries disappear with the proxy objects)
+    proxy_ids = weakref.WeakValueDictionary()
+
+    # total number of proxy objects released by the client
+    released_count = 0
+
+    # ID of the request currently being processed, all answers are tagged with it
+    request_id = 0
+
+    # number of (possibly) changing calls of proxy object methods, added to the devicetree
+    # generation sent with every answer, so the client knows when its cached values
+    # might not be valid anymore
+    proxy_changes = 0
+
+    # timing of the processed requests, None if not enabled (see blivet-gui-daemon --profile)
+    request_stats = None
+
+    # source of udev events for the device monitor, pyudev.Monitor is used if None
+    # (can be replaced with monitor.LocalEventSource for testing)
+    udev_source = None
+
+    # BlivetUtils methods that change block devices (or scan them) and cause udev events
+    udev_changing_methods = ("blivet_reset", "blivet_do_it", "unlock_device", "unlock_devices", "rescan_devices")
+
+    # BlivetUtils methods that change (or replace) the devicetree or update size info of
+    # the formats (like update_next_size_info requested in background), other requests
+    # are not processed while they run as jobs, other jobs run together with the requests
+    exclusive_job_methods = ("blivet_reset", "blivet_do_it", "unlock_device", "unlock_devices", "rescan_devices",
+                             "device_resizable")
+
+    # requests processed even while an exclusive job runs
+    job_messages = ("job_start", "job_status", "job_result", "job_cancel", "release", "proxy_stats", "stats")
+
+    def setup(self):
+        # requests are received to this buffer (and decoded) one by one
+        self.recv_buffer = protocol.ReceiveBuffer()
+
+        # requests received while checking for cancellation of blivet_do_it,
+        # (request ID, message) processed after it finishes
+        self.deferred_requests = []
+
+        # size of the last received request and time spent encoding and size
+        # of the answers sent for the current one, only used for request_stats
+        self.received_size = 0
+        self.encode_time = 0.0
+        self.sent_size = 0
+
+        # udev events monitor started by the "watch" request and ID of the request
+        # notifications about the devicetree changes are sent with
+        self.device_monitor = None
+        self.watch_request_id = None
+
+        # long running BlivetUtils calls and requests received while an exclusive
+        # job was running, (request ID, message) processed after it finishes
+        self.jobs = JobManager(self._run_job)
+        self.job_deferred_requests = []
+
     def handle(self):
         """ Handle request
         """
 
         while True:
-            msg = self._recv_msg()
+            if self.deferred_requests:
+                self.request_id, msg = self.deferred_requests.pop(0)
+            else:
+                msg = self._wait_msg()
 
-            if not msg:
+            if msg is None or msg[0] == "quit":
                 self.server.quit = True  # pylint: disable=no-member
+                self.jobs.stop()
+                if self.request_stats is not None:
+                    log = logging.getLogger("blivet-gui-utils")
+                    log.info("blivet-gui-daemon request statistics:\n%s", self.request_stats.report())
                 break
 
-            unpickled_msg = pickle.loads(msg)
+            if self.jobs.exclusive_active and msg[0] not in self.job_messages:
+                self.job_deferred_requests.append((self.request_id, msg))
+                continue
 
-            if unpickled_msg[0] == "quit":
-                self.server.quit = True  # pylint: disable=no-member
-                break
+            if self.request_stats is not None:
+                self._handle_msg_with_stats(msg)
+            else:
+                self._handle_msg(msg)
 
-            elif unpickled_msg[0] == "init":
-                self._blivet_utils_init(unpickled_msg)
+            if self.device_monitor is not None and msg[0] == "call" and msg[1] in self.udev_changing_methods:
+                # changes were done (or devices scanned) by us, the devicetree is up to date
+                udev.settle()
+                self.device_monitor.discard()
 
-            elif unpickled_msg[0] == "call":
-                self._call_utils_method(unpickled_msg)
+    def _handle_msg(self, msg):
+        if msg[0] == "init":
+            self._blivet_utils_init(msg)
 
-            elif unpickled_msg[0] == "param":
-                self._get_param(unpickled_msg)
+        elif msg[0] == "call":
+            self._call_utils_method(msg)
 
-            elif unpickled_msg[0] == "method":
-                self._call_method(unpickled_msg)
+        elif msg[0] == "param":
+            self._get_param(msg)
 
-            elif unpickled_msg[0] == "next":
-                self._get_next(unpickled_msg)
+        elif msg[0] == "params":
+            self._get_params(msg)
 
-            elif unpickled_msg[0] == "key":
-                self._get_key(unpickled_msg)
+        elif msg[0] == "method":
+            self._call_method(msg)
 
-    def _recv_msg(self):
-        """ Receive a message from client
+        elif msg[0] == "next":
+            self._get_next(msg)
 
-            ..note.: first four bytes represents message length
-        """
+        elif msg[0] == "key":
+            self._get_key(msg)
 
-        raw_msglen = self._recv_data(4)
+        elif msg[0] == "materialize":
+            self._get_items(msg)
 
-        if not raw_msglen:
-            return None
+        elif msg[0] == "release":
+            self._release_objects(msg)
+
+        elif msg[0] == "proxy_stats":
+            self._get_proxy_stats(msg)
+
+        elif msg[0] == "stats":
+            self._get_request_stats(msg)
+
+        elif msg[0] == "watch":
+            self._watch_devices(msg)
+
+        elif msg[0] == "job_start":
+            self._job_start(msg)
 
-        msglen = struct.unpack(">I", raw_msglen)[0]
+        elif msg[0] == "job_status":
+            self._job_status(msg)
 
-        return self._recv_data(msglen)
+        elif msg[0] == "job_result":
+            self._job_result(msg)
 
-    def _recv_data(self, length):
-        """ Receive 'length' of data from client
+        elif msg[0] == "job_cancel":
+            self._job_cancel(msg)
 
-            :param length: length of data to receive
-            :type length: int
+        elif msg[0] == "cancel":
+            # blivet_do_it already finished, nothing to cancel
+            pass
 
+    def _handle_msg_with_stats(self, msg):
+        """ Handle request and record its duration and size of the answers
         """
 
-        data = b""
+        if msg[0] == "call":
+            key = "call:%s" % msg[1]
+        elif msg[0] in ("param", "method"):
+            key = "%s:%s" % (msg[0], msg[2])
+        else:
+            key = msg[0]
+
+        received = self.received_size
+        self.encode_time = 0.0
+        self.sent_size = 0
+
+        start = time.perf_counter()
+        with self.request_stats.profile(msg[1] if msg[0] == "call" else None):
+            self._handle_msg(msg)
+        duration = time.perf_counter() - start
+
+        self.request_stats.record(key, duration, self.encode_time, received, self.sent_size)
+
+    def _wait_msg(self):
+        """ Wait for a message from client, udev events received in the meantime
+            are applied to the devicetree and results of finished jobs are sent
+        """
+
+        while not self.recv_buffer.pending:
+            waiting = [self.request]  # pylint: disable=no-member
+            timeout = None
+
+            if self.jobs.active:
+                waiting.append(self.jobs)
+            if self.device_monitor is not None:
+                waiting.append(self.device_monitor)
+                # the devicetree can't be updated while a job runs
+                if not self.jobs.active:
+                    timeout = self.device_monitor.timeout()
+
+            if len(waiting) == 1:
+                break
+
+            readable, _w, _x = select.select(waiting, [], [], timeout)
+
+            if self.request in readable:  # pylint: disable=no-member
+                break
+            elif self.jobs in readable:
+                self._finish_jobs()
+                if self.deferred_requests:
+                    self.request_id, msg = self.deferred_requests.pop(0)
+                    return msg
+            elif self.device_monitor in readable:
+                self.device_monitor.receive()
+            else:
+                # no new events for a while
+                self._apply_device_events()
+
+        return self._recv_msg()
 
-        while len(data) < length:
-            packet = self.request.recv(length - len(data))  # pylint: disable=no-member
+    def _recv_msg(self):
+        """ Receive a message from client
+
+            ..note.: requests are processed in the order they were received
+                     and the answers are tagged with the request ID
+        """
 
-            if not packet:
+        try:
+            message = protocol.recv_message(self.request, self.recv_buffer)  # pylint: disable=no-member
+            if message is None:
                 return None
 
-            data += packet
+            self.request_id, encoding, data, _generation = message
+            self.received_size = len(data)
+            try:
+                return protocol.decode(encoding, data)
+            finally:
+                data.release()
 
-        return data
+        except ProtocolError:
+            # client we can't talk to, just end the connection
+            return None
 
-    def _pickle_answer(self, answer):
-        """ Pickle the answer. If the answer is not picklable, create a BlivetProxyObject and
-            send its ProxyID instead
+    def _encode_answer(self, answer):
+        """ Encode the answer. If the answer is not picklable, create a BlivetProxyObject and
+            send its ProxyID instead (or reuse the existing one if the object was already sent)
         """
 
-        if answer is None:
-            picklable_answer = answer
+        def _convert(item):
+            # lists, dicts and our containers are sent by value with their
+            # unpicklable members replaced by ProxyIDs
+            if item is None or isinstance(item, picklable_types):
+                return item
 
-        elif isinstance(answer, BlivetProxyObject):
-            picklable_answer = answer.id
+            elif isinstance(item, BlivetProxyObject):
+                return item.id
 
-        elif isinstance(answer, (list, tuple)):
-            picklable_answer = []
+            elif isinstance(item, (list, tuple)):
+                return [_convert(i) for i in item]
 
-            for item in answer:
-                if not isinstance(item, picklable_types):
-                    new_id = ProxyID()
-                    proxy_object = BlivetProxyObject(item, new_id)
-                    self.object_dict[new_id.id] = proxy_object
-                    picklable_answer.append(new_id)
-                else:
-                    picklable_answer.append(item)
+            elif isinstance(item, ProxyDataContainer):
+                return ProxyDataContainer(**{key: _convert(item[key]) for key in item})
 
-        elif not isinstance(answer, picklable_types):
-            new_id = ProxyID()
-            proxy_object = BlivetProxyObject(answer, new_id)
-            self.object_dict[new_id.id] = proxy_object
-            picklable_answer = new_id
+            elif isinstance(item, dict) and all(isinstance(key, picklable_types) for key in item):
+                return {key: _convert(value) for key, value in item.items()}
 
-        else:
-            picklable_answer = answer
+            else:
+                # objects in object_dict are kept alive so their id() can't be reused
+                proxy_object = self.proxy_ids.get(id(item))
+                if proxy_object is None or proxy_object.blivet_object is not item:
+                    proxy_object = BlivetProxyObject(item, ProxyID())
+                    self.object_dict[proxy_object.id.id] = proxy_object
+                    self.proxy_ids[id(item)] = proxy_object
+                proxy_object.refs += 1
+                return proxy_object.id
+
+        if self.request_stats is None:
+            return protocol.encode(_convert(answer))
 
-        pickled_answer = pickle.dumps(picklable_answer)
+        start = time.perf_counter()
+        encoded = protocol.encode(_convert(answer))
+        self.encode_time += time.perf_counter() - start
 
-        return pickled_answer
+        return encoded
 
     def _get_proxy_object(self, proxy_id):
         """ Look up a proxy object by its ProxyID, raising KeyError with
@@ -226,9 +399,36 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
         except Exception as e:  # pylint: disable=broad-except
             answer = e
 
-        pickled_answer = self._pickle_answer(answer)
+        encoded_answer = self._encode_answer(answer)
+
+        self._send(encoded_answer)
+
+    def _get_params(self, data):
+        """ Get multiple params of a object at once
+
+            ..note.: dotted names (e.g. "format.type") are resolved on the server
+                     so attributes of sub-objects can be fetched in the same request
+        """
+
+        proxy_object = self._get_proxy_object(data[1])
+        param_names = data[2]
+
+        answer = []
+        for param_name in param_names:
+            obj = proxy_object
+            try:
+                for name in param_name.split("."):
+                    obj = getattr(obj, name)
+            except AttributeError:
+                obj_name = getattr(proxy_object.blivet_object, "name", repr(proxy_object.blivet_object))
+                obj = AttributeError("%s has no attribute %s" % (obj_name, param_name))
+            except Exception as e:  # pylint: disable=broad-except
+                obj = e
+            answer.append(obj)
+
+        encoded_answer = self._encode_answer(answer)
 
-        self._send(pickled_answer)
+        self._send(encoded_answer)
 
     def _get_next(self, data):
         """ Get next member of iterable object
@@ -242,9 +442,9 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
         except StopIteration as stop:
             answer = stop
 
-        pickled_answer = self._pickle_answer(answer)
+        encoded_answer = self._encode_answer(answer)
 
-        self._send(pickled_answer)
+        self._send(encoded_answer)
 
     def _get_key(self, data):
         """ Get member of iterable object
@@ -254,12 +454,235 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
         key = data[2]
 
         answer = proxy_object[key]
-        pickled_answer = self._pickle_answer(answer)
+        encoded_answer = self._encode_answer(answer)
+
+        self._send(encoded_answer)
+
+    def _get_items(self, data):
+        """ Get all members of iterable object at once
+
+            ..note.: only bounded sequences (with length, not iterators) are returned,
+                     None is sent for other objects and they must be iterated remotely
+        """
+
+        proxy_object = self._get_proxy_object(data[1])
+        obj = proxy_object.blivet_object
+
+        if isinstance(obj, Iterable) and isinstance(obj, Sized) and not isinstance(obj, Iterator):
+            try:
+                answer = list(obj)
+            except Exception as e:  # pylint: disable=broad-except
+                answer = e
+        else:
+            answer = None
+
+        encoded_answer = self._encode_answer(answer)
+
+        self._send(encoded_answer)
+
+    def _release_objects(self, data):
+        """ Drop objects released by the client
+
+            ..note.: the client doesn't wait for an answer for this message
+        """
+
+        for obj_id, received in data[1]:
+            proxy_object = self.object_dict.get(obj_id)
+            if proxy_object is None:
+                continue
+
+            # the ID might have been sent again before the client released it
+            proxy_object.refs -= received
+            if proxy_object.refs <= 0:
+                del self.object_dict[obj_id]
+                self.released_count += 1
+
+    def _get_request_stats(self, _data):
+        """ Get timing of the processed requests
+
+            ..note.: None is sent if collecting the statistics is not enabled
+        """
+
+        answer = self.request_stats.summary() if self.request_stats is not None else None
+        encoded_answer = self._encode_answer(answer)
 
-        self._send(pickled_answer)
+        self._send(encoded_answer)
+
+    def _watch_devices(self, _data):
+        """ Start monitoring udev events for block devices
+
+            ..note.: no answer is sent now, notifications are sent with ID of this
+                     request every time the devicetree is updated after udev events
+        """
+
+        if self.device_monitor is None:
+            self.device_monitor = DeviceMonitor(source=self.udev_source)
+
+        self.watch_request_id = self.request_id
+
+    def _apply_device_events(self):
+        """ Apply received udev events to the devicetree and notify the client
+        """
+
+        events = self.device_monitor.take()
+        if self.blivet_utils is None:
+            return
+
+        try:
+            applied = self.blivet_utils.apply_device_events(events)
+        except Exception as e:  # pylint: disable=broad-except
+            answer = ProxyDataContainer(applied=False, events=events, exception=e, traceback=traceback.format_exc())
+        else:
+            answer = ProxyDataContainer(applied=applied, events=events, exception=None, traceback=None)
+
+        # events caused by scanning the devices
+        udev.settle()
+        self.device_monitor.discard()
+
+        request_id = self.request_id
+        self.request_id = self.watch_request_id
+        try:
+            self._send(self._encode_answer(answer))
+        finally:
+            self.request_id = request_id
+
+    def _job_start(self, data):
+        """ Start a BlivetUtils method as a job, the answer is the job ID
+        """
+
+        method = data[1]
+        args = self._args_convert_to_objects(data[2])
+
+        job = self.jobs.start(method, args, exclusive=method in self.exclusive_job_methods,
+                              cancellable=method == "blivet_do_it")
+
+        self._send(self._encode_answer(job.id))
+
+    def _job_status(self, data):
+        """ Get state of the job and its progress messages reported since the last check
+        """
+
+        job = self.jobs.jobs.get(data[1])
+        if job is None:
+            answer = KeyError("Unknown job %s" % data[1])
+        else:
+            answer = ProxyDataContainer(state=job.state, progress=job.take_progress())
+
+        self._send(self._encode_answer(answer))
+
+    def _job_result(self, data):
+        """ Get result of the job, same as the answer to a "call" request
+
+            ..note.: the answer is sent after the job finishes and the job is
+                     forgotten after that (results of old jobs that were never
+                     fetched are forgotten too, see :class:`~.jobs.JobManager`)
+        """
+
+        job = self.jobs.jobs.get(data[1])
+        if job is None:
+            answer = ProxyDataContainer(success=False, exception=KeyError("Unknown job %s" % data[1]),
+                                        traceback="")
+            self._send(self._encode_answer(answer))
+        else:
+            job.result_requests.append(self.request_id)
+            if self.jobs.reported(job.id):
+                self._send_job_result(job)
+
+    def _job_cancel(self, data):
+        """ Cancel the job, the answer is whether the job will be cancelled
+        """
+
+        job = self.jobs.jobs.get(data[1])
+        answer = self.jobs.cancel(job.id) if job is not None else False
+
+        self._send(self._encode_answer(answer))
+
+    def _run_job(self, job):
+        """ Run the job (called from the worker thread)
+
+            ..note.: nothing can be sent to the client here, progress is
+                     reported to the job and fetched by the "job_status" requests
+        """
+
+        if self.request_stats is None:
+            return self._run_job_method(job)
+
+        # the "job_start" request only starts the job, the method itself is timed
+        # (and profiled) here in the worker thread
+        start = time.perf_counter()
+        with self.request_stats.profile(job.method):
+            result = self._run_job_method(job)
+        self.request_stats.record("job:%s" % job.method, time.perf_counter() - start)
+
+        return result
+
+    def _run_job_method(self, job):
+        args = job.args
+        if job.method == "blivet_do_it":
+            args = [job.report_progress, job.cancel_requested] + list(args)
+
+        try:
+            utils_method = getattr(self.blivet_utils, job.method)
+            ret = utils_method(*args)
+            if job.method == "blivet_do_it":
+                # (finished, result) like the answers sent to the "call" request
+                ret = ret[1]
+            return ProxyDataContainer(success=True, answer=ret)
+        except Exception as e:  # pylint: disable=broad-except
+            return ProxyDataContainer(success=False, exception=e, traceback=traceback.format_exc())
+
+    def _finish_jobs(self):
+        """ Send results of the finished jobs to the requests waiting for them
+        """
+
+        for job in self.jobs.take_finished():
+            if self.device_monitor is not None and job.method in self.udev_changing_methods:
+                # changes were done (or devices scanned) by us, the devicetree is up to date
+                udev.settle()
+                self.device_monitor.discard()
+
+            if job.result_requests:
+                self._send_job_result(job)
+
+        if not self.jobs.exclusive_active:
+            self.deferred_requests.extend(self.job_deferred_requests)
+            self.job_deferred_requests = []
+
+    def _send_job_result(self, job):
+        if job.state == JOB_CANCELLED:
+            answer = ProxyDataContainer(success=False, exception=RuntimeError("Job %d was cancelled" % job.id),
+                                        traceback="")
+        else:
+            answer = job.result
+
+        request_id = self.request_id
+        try:
+            for self.request_id in job.result_requests:
+                self._send(self._encode_answer(answer))
+        finally:
+            self.request_id = request_id
+
+        self.jobs.forget(job.id)
+
+    def _get_proxy_stats(self, _data):
+        """ Get number of proxy objects
+        """
+
+        answer = ProxyDataContainer(server_live=len(self.object_dict), server_released=self.released_count)
+        encoded_answer = self._encode_answer(answer)
+
+        self._send(encoded_answer)
 
     def _blivet_utils_init(self, data):
         """ Create BlivetUtils instance
+
+            ..note.: progress messages are sent as (False, message) answers
+                     before the result, same as for blivet_do_it
+
+            ..note.: if the client asks for the scan cache, the snapshot saved
+                     after the last scan is sent as a (False, cached) answer
+                     before scanning and the result contains the differences
+                     between the cached and the new snapshot ("cache_mismatch")
         """
 
         if self.blivet_utils:
@@ -271,8 +694,13 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
         else:
             args = self._args_convert_to_objects(data[1])
 
+            cache = ScanCache(config.scan_cache_file) if len(data) > 2 and data[2] else None
+            cached = cache.load() if cache is not None else None
+            if cached is not None:
+                self._send(self._encode_answer((False, cached)))
+
             try:
-                self.blivet_utils = BlivetUtils(*args)
+                self.blivet_utils = BlivetUtils(*args, progress_report_hook=self._progress_report_hook)
             except (DiskLabelScanError, CorruptGPTError) as e:
                 answer = ProxyDataContainer(success=False, reason=ServerInitResponse.UNUSABLE,
                                             exception=e, traceback=traceback.format_exc(),
@@ -281,11 +709,33 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
                 answer = ProxyDataContainer(success=False, reason=ServerInitResponse.EXCEPTION,
                                             exception=e, traceback=traceback.format_exc())
             else:
-                answer = ProxyDataContainer(success=True)
+                answer = ProxyDataContainer(success=True, cache_mismatch=None)
+                if cache is not None:
+                    answer["cache_mismatch"] = self._update_scan_cache(cache, cached)
+
+        encoded_answer = self._encode_answer((True, answer))
 
-        pickled_answer = self._pickle_answer(answer)
+        self._send(encoded_answer)
 
-        self._send(pickled_answer)
+    def _update_scan_cache(self, cache, cached):
+        """ Save snapshot of the new scan and compare it with the cached one
+
+            :returns: names of added, removed and changed devices, None if nothing was cached
+            :rtype: :class:`~.proxy_utils.ProxyDataContainer` or None
+
+        """
+
+        snapshot = self.blivet_utils.get_device_snapshot()
+
+        try:
+            cache.save(snapshot)
+        except OSError as e:
+            self.blivet_utils.log.warning("Failed to save the scan cache to %s: %s", cache.path, str(e))
+
+        if cached is None:
+            return None
+
+        return compare_snapshots(cached.snapshot, snapshot)
 
     def _call_method(self, data):
         """ Call blivet method
@@ -298,14 +748,17 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
 
         method = getattr(proxy_object, param_name)
 
+        if param_name not in ("__len__", "__iter__", "__str__"):
+            self.proxy_changes += 1
+
         try:
             answer = method(*args, **kwargs)
         except Exception as e:  # pylint: disable=broad-except
             answer = e
 
-        pickled_answer = self._pickle_answer(answer)
+        encoded_answer = self._encode_answer(answer)
 
-        self._send(pickled_answer)
+        self._send(encoded_answer)
 
     def _call_utils_method(self, data):
         """ Call a method from BlivetUtils
@@ -314,7 +767,7 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
         args = self._args_convert_to_objects(data[2])
 
         if data[1] == "blivet_do_it":
-            answer = self.blivet_utils.blivet_do_it(self._progress_report_hook)
+            answer = self.blivet_utils.blivet_do_it(self._progress_report_hook, self._cancel_requested, *args)
 
         else:
             try:
@@ -324,13 +777,39 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
             except Exception as e:  # pylint: disable=broad-except
                 answer = ProxyDataContainer(success=False, exception=e, traceback=traceback.format_exc())
 
-        pickled_answer = self._pickle_answer(answer)
+        encoded_answer = self._encode_answer(answer)
 
-        self._send(pickled_answer)
+        self._send(encoded_answer)
 
     def _progress_report_hook(self, message):
-        pickled_msg = self._pickle_answer((False, message))
-        self._send(pickled_msg)
+        encoded_msg = self._encode_answer((False, message))
+        self._send(encoded_msg)
+
+    def _cancel_requested(self):
+        """ Check whether the client asked to cancel the running blivet_do_it
+
+            ..note.: other requests received in the meantime are processed
+                     after blivet_do_it finishes
+        """
+
+        request_id = self.request_id
+        cancel = False
+
+        try:
+            while self.recv_buffer.pending or select.select([self.request], [], [], 0)[0]:  # pylint: disable=no-member
+                msg = self._recv_msg()
+                if msg is None:
+                    # client is gone, stop as soon as possible
+                    self.deferred_requests.append((0, None))
+                    return True
+                elif msg[0] == "cancel":
+                    cancel = True
+                else:
+                    self.deferred_requests.append((self.request_id, msg))
+        finally:
+            self.request_id = request_id
+
+        return cancel
 
     def _args_convert_to_objects(self, args):
         """ All args sent from client to server are either built-in types (int, str...) or
@@ -348,6 +827,8 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
                         arg[item] = self.object_dict[arg[item].id].blivet_object
                     elif isinstance(arg[item], (list, tuple)):
                         arg[item] = self._args_convert_to_objects(arg[item])
+                    elif isinstance(arg[item], dict):
+                        arg[item] = self._args_convert_to_objects([arg[item]])[0]
                 args_obj.append(arg)
             elif isinstance(arg, ProxyID):
                 args_obj.append(self.object_dict[arg.id].blivet_object)
@@ -355,6 +836,9 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
             elif isinstance(arg, (list, tuple)):
                 args_obj.append(self._args_convert_to_objects(arg))
 
+            elif isinstance(arg, dict):
+                args_obj.append({key: self._args_convert_to_objects([value])[0] for key, value in arg.items()})
+
             else:
                 args_obj.append(arg)
 
@@ -368,6 +852,11 @@ class BlivetUtilsServer(socketserver.BaseRequestHandler):
 
         return kwargs_obj
 
+    def _generation(self):
+        if self.blivet_utils is None:
+            return 0
+        return self.blivet_utils.generation + self.proxy_changes
+
     def _send(self, data):
-        data = struct.pack(">I", len(data)) + data
-        self.request.sendall(data)  # pylint: disable=no-member
+        self.sent_size += len(data[1])
+        protocol.send_message(self.request, self.request_id, data, self._generation())  # pylint: disable=no-member
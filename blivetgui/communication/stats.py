@@ -0,0 +1,207 @@
+# stats.py
+# Timing of the requests processed by blivet-gui-daemon
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .proxy_utils import ProxyDataContainer
+
+# ---------------------------------------------------------------------------- #
+
+
+# upper bounds of the duration histogram buckets (in seconds), from 1 us to
+# about 20 minutes, every bucket is 20 % wider than the previous one
+BUCKET_BOUNDS = tuple(1e-6 * 1.2 ** i for i in range(115))
+
+
+class DurationHistogram:
+    """ Histogram of request durations with fixed buckets
+
+        Only the bucket counts, total and maximum are kept so the memory
+        doesn't grow with the number of requests, percentiles are upper
+        bounds of the buckets they fall into (but never more than maximum).
+    """
+
+    def __init__(self):
+        # last one for durations longer than the last bound
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, percent):
+        """ Nearest-rank percentile of the durations """
+
+        rank = max(1, -(-self.count * percent // 100))
+
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        # longer than the last bound
+        return self.max
+
+
+class RequestStats:
+    """ Timing of the requests processed by the server
+
+        Requests are grouped by type and method or attribute name (e.g.
+        "call:get_disks" or "param:format.type"). For every group count,
+        total time, time spent encoding the answers and number of received
+        and sent bytes are recorded.
+
+        Optionally calls of one BlivetUtils method (or all calls if the
+        method is "*") are profiled using cProfile.
+
+        ..note.: jobs are recorded from the job worker thread so all
+                 changes are done under a lock
+    """
+
+    def __init__(self, profile_method=None):
+        """
+            :param profile_method: name of BlivetUtils method to profile
+            :type profile_method: str
+
+        """
+
+        # key -> histogram of durations of the requests
+        self.durations = defaultdict(DurationHistogram)
+
+        # key -> [total encode time, bytes received, bytes sent]
+        self.totals = defaultdict(lambda: [0.0, 0, 0])
+
+        self.profile_method = profile_method
+
+        # merged results of all profiled blocks, None if nothing was profiled yet
+        self.profile_stats = None
+
+        self._lock = threading.Lock()
+
+    def record(self, key, duration, encode_time=0.0, received=0, sent=0):
+        """ Record one processed request """
+
+        with self._lock:
+            self.durations[key].add(duration)
+
+            totals = self.totals[key]
+            totals[0] += encode_time
+            totals[1] += received
+            totals[2] += sent
+
+    @contextmanager
+    def profile(self, method):
+        """ Profile the block if the BlivetUtils method should be profiled """
+
+        if not self.profile_method or self.profile_method not in (method, "*"):
+            yield
+            return
+
+        # cProfile profiles only the thread it was enabled in and jobs run in their
+        # own thread, so every block has its own profiler merged with the others
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # newer Pythons allow only one active profiler, other block is profiled now
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._add_profile(profiler)
+
+    def _add_profile(self, profiler):
+        with self._lock:
+            try:
+                if self.profile_stats is None:
+                    self.profile_stats = pstats.Stats(profiler)
+                else:
+                    self.profile_stats.add(profiler)
+            except TypeError:
+                # nothing was profiled
+                pass
+
+    def summary(self):
+        """ Statistics of all recorded requests
+
+            :returns: key -> count, total, p50, p99, max (in seconds), encode (total
+                      encoding time), received and sent (total bytes)
+            :rtype: dict of :class:`~.proxy_utils.ProxyDataContainer`
+
+        """
+
+        summary = {}
+        with self._lock:
+            for key, durations in self.durations.items():
+                encode_time, received, sent = self.totals[key]
+                summary[key] = ProxyDataContainer(count=durations.count, total=durations.total,
+                                                  p50=durations.percentile(50), p99=durations.percentile(99),
+                                                  max=durations.max, encode=encode_time,
+                                                  received=received, sent=sent)
+
+        return summary
+
+    def report(self, limit=30):
+        """ Human readable report with the statistics and profiling results
+
+            :param limit: number of functions from the profile to show
+            :type limit: int
+            :rtype: str
+
+        """
+
+        lines = ["%-40s %8s %10s %10s %10s %10s %12s %12s" % ("request", "count", "total ms", "p50 ms", "p99 ms",
+                                                              "encode ms", "B received", "B sent")]
+
+        summary = self.summary()
+        for key in sorted(summary, key=lambda k: summary[k].total, reverse=True):
+            s = summary[key]
+            lines.append("%-40s %8d %10.1f %10.3f %10.3f %10.1f %12d %12d" % (key, s.count, s.total * 1000,
+                                                                              s.p50 * 1000, s.p99 * 1000,
+                                                                              s.encode * 1000, s.received, s.sent))
+
+        if self.profile_method:
+            stream = io.StringIO()
+            with self._lock:
+                if self.profile_stats is None:
+                    stream.write("No calls of '%s' were profiled.\n" % self.profile_method)
+                else:
+                    self.profile_stats.stream = stream
+                    self.profile_stats.sort_stats("cumulative").print_stats(limit)
+            lines.append("")
+            lines.append("Profile of '%s':" % self.profile_method)
+            lines.append(stream.getvalue())
+
+        return "\n".join(lines)
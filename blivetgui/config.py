@@ -30,6 +30,28 @@ class BlivetGUIConfig(dict):
         self["default_fstype"] = "ext4"
         self["log_dir"] = "/var/log/blivet-gui"
 
+        # getting minimal size of the devices at startup: number of devices
+        # processed in parallel and seconds to wait for a single device
+        self["size_info_workers"] = 4
+        self["size_info_timeout"] = 30
+
+        # when to get minimal size of the devices: "startup", "lazy" (only when
+        # needed for resize) or "background" (after the window is shown)
+        self["size_info_mode"] = "startup"
+
+        # create filesystems on independent disks in parallel when processing
+        # the actions and number of disks processed at once
+        self["parallel_format"] = False
+        self["parallel_format_workers"] = 8
+
+        # watch udev events and update the devicetree when block devices change
+        self["device_monitor"] = False
+
+        # show the storage configuration saved after the last scan while scanning
+        # and file (written by the daemon) the configuration is saved to
+        self["scan_cache"] = False
+        self["scan_cache_file"] = "/var/cache/blivet-gui/devicetree.cache"
+
     def __getattr__(self, name):
         if name not in self and not hasattr(self, name):
             raise AttributeError("BlivetGUIConfig has no attribute %s" % name)
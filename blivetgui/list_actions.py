@@ -123,6 +123,40 @@ class ListActions:
 
         return self.history.pop()
 
+    def remove(self, blivet_actions):
+        """ Remove actions cancelled outside of blivet-gui actions history
+            (e.g. when scanning a disk again)
+
+            :param blivet_actions: cancelled blivet actions
+            :type blivet_actions: list of blivet.DeviceAction
+            :returns: not cancelled blivet actions belonging to the removed actions
+            :rtype: list of blivet.DeviceAction
+
+        """
+
+        remaining = []
+
+        for index in reversed(range(len(self.history))):
+            if not any(action is cancelled for action in self.history[index] for cancelled in blivet_actions):
+                continue
+
+            remaining.extend(action for action in self.history[index]
+                             if not any(action is cancelled for cancelled in blivet_actions))
+
+            self.actions -= 1
+            self.actions_list.remove(self.actions_list.get_iter(index))
+            del self.history[index]
+
+        if not self.actions:
+            self.blivet_gui.activate_action_buttons(False)
+            self.blivet_gui.label_actions.set_markup(_("No pending actions"))
+        else:
+            actions_str = P_("%s pending action", "%s pending actions", self.actions) % self.actions
+            markup = "<span underline=\"single\" foreground=\"blue\">%s</span>" % actions_str
+            self.blivet_gui.label_actions.set_markup(markup)
+
+        return remaining
+
     def clear(self):
         """ Delete all actions in actions view
         """
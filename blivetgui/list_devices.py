@@ -27,6 +27,7 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk
 
 from .i18n import _
+from .communication.client import ClientProxyObject
 
 # ---------------------------------------------------------------------------- #
 
@@ -35,6 +36,12 @@ class ListDevices:
     """ List of parent devices
     """
 
+    # device types shown in the list
+    device_types = ("lvmvg", "mdarray", "btrfs volume", "stratis pool")
+
+    # record fields displayed in the list
+    shown_fields = ("name", "type", "model", "protected", "removable", "format_hidden", "is_disk")
+
     def __init__(self, blivet_gui):
         """
 
@@ -47,6 +54,8 @@ class ListDevices:
 
         self.last_iter = None  # last selected device from list
         self.selected_device = None  # currently selected device
+        self.device_ids = set()  # ids of devices in the list
+        self.snapshot = None  # devicetree snapshot, kept up to date by apply_changes
 
         self.device_list = self.blivet_gui.builder.get_object("liststore_devices")
         self.disks_view = self.blivet_gui.builder.get_object("treeview_devices")
@@ -57,23 +66,42 @@ class ListDevices:
     def load_devices(self):
         self.device_list.clear()
 
-        self.load_disks()
-        self.load_group_devices()
+        # get information about all devices at once and then ask only for
+        # the devices we are going to show
+        snapshot = self.blivet_gui.client.remote_call("get_device_snapshot")
+        device_ids = snapshot.disks + snapshot.lvm + snapshot.raid + snapshot.btrfs + snapshot.stratis
+        devices = dict(zip(device_ids, self.blivet_gui.client.remote_call("get_devices_by_id", device_ids)))
+        self.device_ids = set(device_ids)
+        self.snapshot = snapshot
+
+        # selected device is used a lot by the other views, don't ask for its
+        # name and type again until the devicetree changes
+        for device in devices.values():
+            if isinstance(device, ClientProxyObject):
+                device.cache()
+
+        self.load_disks(snapshot, devices)
+        self.load_group_devices(snapshot, devices)
 
-    def load_disks(self):
+    def load_disks(self, snapshot, devices):
         """ Load disks
+
+            :param snapshot: devicetree snapshot from :meth:`~.blivet_utils.BlivetUtils.get_device_snapshot`
+            :param devices: devices from the snapshot by their id
+            :type devices: dict
+
         """
 
         icon_theme = Gtk.IconTheme.get_default()  # pylint: disable=no-value-for-parameter
         icon_disk = Gtk.IconTheme.load_icon(icon_theme, "drive-harddisk", 32, 0)
         icon_disk_usb = Gtk.IconTheme.load_icon(icon_theme, "drive-removable-media", 32, 0)
 
-        disks = self.blivet_gui.client.remote_call("get_disks")
+        disks = [snapshot.devices[disk_id] for disk_id in snapshot.disks]
 
         if self.blivet_gui.installer_mode:
             # hide protected and hidden disks in installer mode
             # (this will hide USB drive with installation image, disks under FW RAID etc.)
-            filtered_disks = [d for d in disks if not (d.protected or d.format.hidden)]
+            filtered_disks = [d for d in disks if not (d.protected or d.format_hidden)]
         else:
             # in installer mode we want to show arrays on top of disks as disks to
             # match the storage spoke behaviour, but outside installer just show
@@ -85,62 +113,100 @@ class ListDevices:
 
         for disk in filtered_disks:
             if disk.removable:
-                self.device_list.append([disk, icon_disk_usb, str(disk.name + "\n<i><small>" +
-                                                                  str(disk.model) + "</small></i>")])
+                self.device_list.append([devices[disk.id], icon_disk_usb,
+                                         str(disk.name + "\n<i><small>" + str(disk.model) + "</small></i>")])
             elif disk.type == "mdarray":
-                self.device_list.append([disk, icon_disk, str(disk.name + "\n<i><small>%s</small></i>" % _("MDRAID set"))])
+                self.device_list.append([devices[disk.id], icon_disk,
+                                         str(disk.name + "\n<i><small>%s</small></i>" % _("MDRAID set"))])
             else:
-                self.device_list.append([disk, icon_disk, str(disk.name + "\n<i><small>" +
-                                                              str(disk.model) + "</small></i>")])
+                self.device_list.append([devices[disk.id], icon_disk,
+                                         str(disk.name + "\n<i><small>" + str(disk.model) + "</small></i>")])
 
-    def load_group_devices(self):
+    def load_group_devices(self, snapshot, devices):
         """ Load LVM2 VGs, Btrfs Volumes and MDArrays
-        """
 
-        gdevices = self.blivet_gui.client.remote_call("get_group_devices")
+            :param snapshot: devicetree snapshot from :meth:`~.blivet_utils.BlivetUtils.get_device_snapshot`
+            :param devices: devices from the snapshot by their id
+            :type devices: dict
+
+        """
 
         icon_theme = Gtk.IconTheme.get_default()  # pylint: disable=no-value-for-parameter
         icon_group = Gtk.IconTheme.load_icon(icon_theme, "folder", 32, 0)
 
         if self.blivet_gui.installer_mode:
             # in installer mode RAID devices on top of disks are shown as disks
-            raids = [r for r in gdevices["raid"] if not r.is_disk]
+            raids = [r for r in snapshot.raid if not snapshot.devices[r].is_disk]
         else:
-            raids = gdevices["raid"]
-
-        if gdevices["lvm"]:
-            self.device_list.append([None, None, "<b>%s</b>" % _("LVM")])
-            for device in gdevices["lvm"]:
-                self.device_list.append([device, icon_group,
-                                        str(device.name + "\n<i><small>%s</small></i>" % _("LVM2 VG"))])
-
-        if raids:
-            self.device_list.append([None, None, "<b>%s</b>" % _("RAID")])
-            for device in raids:
-                self.device_list.append([device, icon_group,
-                                        str(device.name + "\n<i><small>%s</small></i>" % _("MDArray"))])
-
-        if gdevices["btrfs"]:
-            self.device_list.append([None, None, "<b>%s</b>" % _("Btrfs Volumes")])
-            for device in gdevices["btrfs"]:
-                self.device_list.append([device, icon_group,
-                                        str(device.name + "\n<i><small>%s</small></i>" % _("Btrfs Volume"))])
-
-        if gdevices["stratis"]:
-            self.device_list.append([None, None, "<b>%s</b>" % _("Stratis Pools")])
-            for device in gdevices["stratis"]:
-                self.device_list.append([device, icon_group,
-                                        str(device.name + "\n<i><small>%s</small></i>" % _("Stratis Pool"))])
+            raids = snapshot.raid
+
+        groups = ((snapshot.lvm, _("LVM"), _("LVM2 VG")),
+                  (raids, _("RAID"), _("MDArray")),
+                  (snapshot.btrfs, _("Btrfs Volumes"), _("Btrfs Volume")),
+                  (snapshot.stratis, _("Stratis Pools"), _("Stratis Pool")))
+
+        for device_ids, title, description in groups:
+            if not device_ids:
+                continue
+
+            self.device_list.append([None, None, "<b>%s</b>" % title])
+            for device_id in device_ids:
+                self.device_list.append([devices[device_id], icon_group,
+                                         str(snapshot.devices[device_id].name + "\n<i><small>%s</small></i>" % description)])
+
+    def affected_by(self, changes):
+        """ Check whether devicetree changes affect this list
+
+            :param changes: changes from :meth:`~.blivet_utils.BlivetUtils.get_device_changes`
+            :returns: whether the list needs to be reloaded
+            :rtype: bool
+
+        """
+
+        if changes.full:
+            return True
+
+        if any(dev_id in self.device_ids for dev_id in changes.removed):
+            return True
+
+        if any(r.is_disk or r.type in self.device_types for r in changes.added):
+            return True
+
+        for record in changes.modified:
+            if record.id in self.device_ids and set(changes.changed[record.id]) & set(self.shown_fields):
+                return True
+
+        return False
+
+    def apply_changes(self, changes):
+        """ Update records in the devicetree snapshot with devicetree changes
+
+            Lists of disks and group devices in the snapshot are not updated,
+            changes of these always reload the whole list (see :meth:`affected_by`)
+            and fetch a new snapshot.
+
+            :param changes: changes from :meth:`~.blivet_utils.BlivetUtils.get_device_changes`
+
+        """
+
+        if self.snapshot is None or changes.full:
+            return
+
+        for dev_id in changes.removed:
+            self.snapshot.devices.pop(dev_id, None)
+
+        for record in changes.added + changes.modified:
+            self.snapshot.devices[record.id] = record
 
     def update_devices_view(self):
         """ Update device view
         """
 
-        # remember previously selected device name
+        # remember previously selected device
         selection = self.disks_view.get_selection()
         model, treeiter = selection.get_selected()
         if treeiter and model:
-            selected_device = model[treeiter][0].name
+            selected_device = model[treeiter][0]
         else:
             selected_device = None
 
@@ -153,12 +219,23 @@ class ListDevices:
         selection.handler_unblock(self.selection_signal)
 
         # if the device still exists, select it; else select first device in list
-        for idx, device in enumerate(self.device_list):
-            if device[0] and device[0].name == selected_device:
-                self.disks_view.set_cursor(idx)
-                break
-        else:
-            self.disks_view.set_cursor(1)
+        # (the server sends the same proxy for the same device so we can compare
+        # the objects directly, names are compared only for devices recreated
+        # by a reset)
+        devices = [(idx, device[0]) for idx, device in enumerate(self.device_list) if device[0]]
+        if selected_device is not None:
+            for idx, device in devices:
+                if device is selected_device:
+                    self.disks_view.set_cursor(idx)
+                    return
+
+            selected_name = selected_device.name
+            for idx, device in devices:
+                if device.name == selected_name:
+                    self.disks_view.set_cursor(idx)
+                    return
+
+        self.disks_view.set_cursor(1)
 
     def select_device_by_name(self, device_name):
         for idx, device in enumerate(self.device_list):
@@ -22,26 +22,40 @@
 # ---------------------------------------------------------------------------- #
 
 
+from .communication.client import ClientProxyObject
+
+
 class ListParents:
     """ List of parents of selected device
     """
 
+    # attributes read for every child of the root devices
+    child_attrs = ("id", "name", "type")
+
     def __init__(self, blivet_gui):
         self.blivet_gui = blivet_gui
         self.parents_list = self.blivet_gui.builder.get_object("liststore_physical")
+        self.device_ids = set()  # ids of the selected device and devices shown in the list
 
     def update_parents_list(self, selected_device):
         self.parents_list.clear()
+        self.device_ids = set()
 
         # no physical view for disks, empty list and return
         if selected_device.is_disk:
             return
 
-        parent_devices = self._get_parent_devices(selected_device)
+        snapshot = self.blivet_gui.list_devices.snapshot
+        parent_ids = self._get_parent_ids(snapshot, selected_device.id)
+        parent_devices = None
+
+        self.device_ids = {selected_device.id} | set(snapshot.devices[selected_device.id].parents) | set(parent_ids)
+
         root_devices = self.blivet_gui.client.remote_call("get_roots", selected_device)
 
         for root in root_devices:
             root_iter = self.parents_list.append(None, [root, False])
+            self.device_ids.add(root.id)
             if root.is_disk:
                 childs = self.blivet_gui.client.remote_call("get_disk_children", root).partitions
             elif root.type == "mdarray":
@@ -50,28 +64,59 @@ class ListParents:
                 childs = self.blivet_gui.client.remote_call("get_children", root)
 
             for child in childs:
+                if isinstance(child, ClientProxyObject):
+                    child.prefetch(*self.child_attrs)
+                    child.cache()
+                if child.type != "free space":
+                    self.device_ids.add(child.id)
+
                 if child.type == "btrfs volume" and root.is_disk and root.format.type == "btrfs":
                     self.parents_list.append(root_iter, [root, True])
                 elif child.type == "partition" and child.is_extended:
+                    if parent_devices is None:
+                        parent_devices = self.blivet_gui.client.remote_call("get_devices_by_id", parent_ids)
                     for parent in parent_devices:
-                        if parent.type == "partition" and parent.is_logical and parent.disk.name == child.disk.name:
+                        if parent.type == "partition" and parent.is_logical and parent.disk is child.disk:
                             self.parents_list.append(root_iter, [parent, True])
-                elif child.name in [d.name for d in parent_devices]:
+                elif child.type != "free space" and child.id in parent_ids:
                     self.parents_list.append(root_iter, [child, True])
                 else:
                     self.parents_list.append(root_iter, [child, False])
 
-    def _get_parent_devices(self, device):
-        parents = []
+    def affected_by(self, changes):
+        """ Check whether devicetree changes affect this list
+
+            :param changes: changes from :meth:`~.blivet_utils.BlivetUtils.get_device_changes`
+            :returns: whether the list needs to be reloaded
+            :rtype: bool
+
+        """
+
+        if changes.full:
+            return True
+
+        changed_ids = set(changes.removed) | {record.id for record in changes.modified}
+        if changed_ids & self.device_ids:
+            return True
+
+        return any(set(record.parents) & self.device_ids for record in changes.added)
+
+    def _get_parent_ids(self, snapshot, device_id):
+        """ Get ids of parents of the device from the devicetree snapshot
+        """
+
+        device = snapshot.devices[device_id]
+
         if device.type == "lvmvg":
-            for pv in device.pvs:
-                if pv.type == "luks/dm-crypt":
-                    parents.append(pv.raw_device)
+            parent_ids = []
+            for pv_id in device.parents:
+                pv = snapshot.devices[pv_id]
+                if pv.type == "luks/dm-crypt" and pv.parents:
+                    parent_ids.append(pv.parents[0])
                 else:
-                    parents.append(pv)
-        elif device.type in ("btrfs volume", "mdarray"):
-            return device.members
-        elif device.type == "stratis pool":
-            return device.blockdevs
+                    parent_ids.append(pv_id)
+            return parent_ids
+        elif device.type in ("btrfs volume", "mdarray", "stratis pool"):
+            return device.parents
 
-        return parents
+        return []
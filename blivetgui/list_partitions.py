@@ -23,12 +23,20 @@
 
 import blivet
 from .i18n import _
+from .communication.client import ClientProxyObject
 
 
 class ListPartitions:
     """ List of children of selected device
     """
 
+    # attributes read when adding a device to the store
+    store_attrs = ("id", "name", "type", "size", "format.type", "format.name", "format.label",
+                   "format.mountable", "format.mountpoint", "format.system_mountpoint")
+
+    # record fields that can be updated in place without reloading the list
+    patchable_fields = ("name", "format_label", "format_mountpoint")
+
     def __init__(self, blivet_gui):
 
         self.blivet_gui = blivet_gui
@@ -45,6 +53,9 @@ class ListPartitions:
 
         self.selected_partition = None
 
+        self.device_iters = {}  # tree iters of devices in the list by device id
+        self.parent_device_id = None  # id of the device whose children are listed
+
     def update_partitions_list(self, selected_device):
         """ Update partition view with selected disc children (partitions)
 
@@ -54,6 +65,8 @@ class ListPartitions:
         """
 
         self.partitions_list.clear()
+        self.device_iters = {}
+        self.parent_device_id = selected_device.id
 
         def _get_real_child(child):
             """ When adding a child device, we actually might want to add one
@@ -125,6 +138,38 @@ class ListPartitions:
 
         return False
 
+    def apply_changes(self, changes):
+        """ Update rows of the list with devicetree changes
+
+            :param changes: changes from :meth:`~.blivet_utils.BlivetUtils.get_device_changes`
+            :returns: whether the changes were applied (False means the list must be reloaded)
+            :rtype: bool
+
+        """
+
+        if changes.full:
+            return False
+
+        shown = set(self.device_iters) | {self.parent_device_id}
+
+        if shown & set(changes.removed):
+            return False
+
+        if any(shown & set(record.parents) for record in changes.added):
+            return False
+
+        modified = [record.id for record in changes.modified if record.id in shown]
+        for dev_id in modified:
+            if dev_id not in self.device_iters or not set(changes.changed[dev_id]) <= set(self.patchable_fields):
+                return False
+
+        for dev_id in modified:
+            device_iter = self.device_iters[dev_id]
+            device = self.partitions_list[device_iter][0]
+            self.partitions_list.set_row(device_iter, self._get_row(device))
+
+        return True
+
     def _add_to_store(self, device, parent_iter=None):
         """ Add new device to partitions list
 
@@ -134,6 +179,23 @@ class ListPartitions:
             :type parent_iter: Gtk.TreeIter or None
         """
 
+        device_iter = self.partitions_list.append(parent_iter, self._get_row(device))
+
+        # free space "devices" are not part of the devicetree
+        if device.type != "free space":
+            self.device_iters[device.id] = device_iter
+
+        return device_iter
+
+    def _get_row(self, device):
+        """ Get partitions list row for the device
+        """
+
+        # fetch all attributes we need for the row at once instead of one by one
+        if isinstance(device, ClientProxyObject):
+            device.prefetch(*self.store_attrs)
+            device.cache()
+
         devtype = "lvm" if device.type == "lvmvg" else "raid" if device.type == "mdarray" else device.type
 
         if device.format.type:
@@ -167,9 +229,7 @@ class ListPartitions:
         else:
             devsize = str(device.size)
 
-        device_iter = self.partitions_list.append(parent_iter, [device, device.name, devtype, fmt, devsize, label, mnt])
-
-        return device_iter
+        return [device, device.name, devtype, fmt, devsize, label, mnt]
 
     def _allow_recursive_delete_device(self, device):
         if device.type not in ("btrfs volume", "mdarray", "lvmvg", "stratis pool"):
@@ -355,6 +415,10 @@ class ListPartitions:
             elif device.format.mountable and device.format.system_mountpoint:
                 self.blivet_gui.activate_device_actions(["unmount"])
 
+        disk = self.blivet_gui.list_devices.selected_device
+        if not self.installer_mode and disk is not None and disk.is_disk:
+            self.blivet_gui.activate_device_actions(["reload_disk"])
+
     def select_device(self, device):
         """ Select device from list """
 
@@ -49,6 +49,10 @@ class LoadingWindow(Gtk.Dialog):
         self.set_border_width(8)
         self.set_position(Gtk.WindowPosition.CENTER_ON_PARENT)
 
+        # the window is closed by stop() when the work is done, not by the user
+        self.set_deletable(False)
+        self.connect("delete-event", lambda *_args: True)
+
         self.grid = Gtk.Grid(column_homogeneous=False, row_spacing=10, column_spacing=5)
         self.grid.set_margin_bottom(12)
 
@@ -73,6 +77,63 @@ class LoadingWindow(Gtk.Dialog):
         self.set_resizable(False)
         self.show_all()
 
+    def progress_msg(self, message):
+        """ Show a progress message from the daemon
+        """
+
+        self.label.set_text(message)
+
+    def show_cached(self, cached):
+        """ Show storage configuration saved after the last scan (read-only)
+
+            :param cached: cached configuration (see :meth:`~.scan_cache.ScanCache.load`)
+
+        """
+
+        snapshot = cached.snapshot
+
+        if cached.outdated:
+            text = _("Block devices changed since the last scan, the following storage "
+                     "configuration is outdated:")
+        else:
+            text = _("Storage configuration from the last scan (editing will be possible "
+                     "after the scan finishes):")
+
+        label = Gtk.Label(label=text, xalign=0)
+        label.set_line_wrap(True)
+        label.set_max_width_chars(50)
+        self.grid.attach(label, 0, 2, 3, 1)
+
+        store = Gtk.TreeStore(str, str, str, str)
+
+        # group devices are shown only on the top level, not under their parents
+        groups = snapshot.lvm + snapshot.raid + snapshot.btrfs + snapshot.stratis
+
+        def _add_device(device_id, parent_iter):
+            record = snapshot.devices[device_id]
+            treeiter = store.append(parent_iter, [record.name, record.type, str(record.size),
+                                                  record.format_type or ""])
+            for child_id in record.children:
+                if child_id in snapshot.devices and child_id not in groups:
+                    _add_device(child_id, treeiter)
+
+        for device_id in snapshot.disks + groups:
+            _add_device(device_id, None)
+
+        treeview = Gtk.TreeView(model=store)
+        for column, title in enumerate((_("Device"), _("Type"), _("Size"), _("Format"))):
+            treeview.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=column))
+        treeview.expand_all()
+        treeview.set_sensitive(False)
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_size_request(-1, 250)
+        scrolled.add(treeview)
+        self.grid.attach(scrolled, 0, 3, 3, 1)
+
+        self.set_resizable(True)
+        self.show_all()
+
     def stop(self):
         self.pulse = False
         GLib.source_remove(self.timeout_id)
@@ -83,7 +144,10 @@ class LoadingWindow(Gtk.Dialog):
         """
 
         self.progressbar.set_fraction(0)
-        self.run()
+
+        # run() also ends on Esc, keep running until stop() is called
+        while self.pulse:
+            self.run()
         self.destroy()
 
     def on_timeout(self, _user_data):
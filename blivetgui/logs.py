@@ -22,6 +22,7 @@
 # ---------------------------------------------------------------------------- #
 
 import os
+import re
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -119,3 +120,61 @@ def log_utils_call(log, message, user_input):
         log.debug("Logging failed: %s", str(e))
     else:
         log.debug(message)
+
+
+class ProgramTimer(logging.Handler):
+    """ Logging handler measuring wall time of external programs
+
+        Both blivet and libblockdev log start and end of every external program
+        they run to the "program" logger, this handler pairs these messages and
+        remembers command and duration of the finished programs.
+    """
+
+    # libblockdev: "Running [5] mkfs.ext4 -F /dev/sda1 ..." and "...done [5] (exit code: 0)"
+    # blivet: "Running... mdadm --create ..." and "Return code: 0"
+    _start_re = (re.compile(r"^Running \[(\d+)\] (.+) \.\.\.$"), re.compile(r"^Running\.\.\. (.+)$"))
+    _end_re = (re.compile(r"^\.\.\.done \[(\d+)\]"), re.compile(r"^Return code: "))
+
+    def __init__(self):
+        super().__init__()
+
+        self.running = {}
+        self.finished = []
+
+    def emit(self, record):
+        msg = record.getMessage()
+
+        for source, regex in enumerate(self._start_re):
+            match = regex.match(msg)
+            if match:
+                # blivet doesn't have task IDs, it runs the programs one by one in a thread
+                key = (source, match.group(1) if source == 0 else record.thread)
+                self.running[key] = (match.groups()[-1], record.created)
+                return
+
+        for source, regex in enumerate(self._end_re):
+            match = regex.match(msg)
+            if match:
+                key = (source, match.group(1) if source == 0 else record.thread)
+                if key in self.running:
+                    command, start = self.running.pop(key)
+                    self.finished.append((record.thread, ProxyDataContainer(command=command, start=start,
+                                                                            duration=record.created - start)))
+                return
+
+    def take(self, thread=None):
+        """ Return the programs finished since the last call and forget them
+
+            :param thread: take only programs run from this thread (identifier)
+            :type thread: int
+
+        """
+
+        self.acquire()
+        try:
+            taken = [program for program in self.finished if thread is None or program[0] == thread]
+            self.finished = [program for program in self.finished if thread is not None and program[0] != thread]
+        finally:
+            self.release()
+
+        return [program for _thread, program in taken]
@@ -56,6 +56,7 @@ class BlivetUtilsAnaconda(BlivetUtils):
         # pylint: disable=super-init-not-called
 
         self._resizable_filesystems = None
+        self._init_change_tracking()
 
         self._storage = None
         _log_file, self.log = set_logging(component="blivet-gui-utils")
@@ -268,6 +269,10 @@ class BlivetGUIAnaconda(BlivetGUI):
         action_str = _("actions configured by installer")
         self.list_actions.append("misc", action_str, blivet_actions)
 
+    def _run_job(self, method, *args, message=None):
+        # there is no daemon, just call the method
+        return self.client.remote_call(method, *args)
+
     def _handle_user_change(self):
         # user changed something blivet-gui -- blivet-gui spoke needs to clear
         # existing errors and run checks again to see if this change fixed that
@@ -24,9 +24,10 @@
 import gi
 gi.require_version("Gtk", "3.0")
 gi.require_version("GdkPixbuf", "2.0")
+gi.require_version("GLib", "2.0")
 gi.require_version("Pango", "1.0")
 
-from gi.repository import Gtk, GdkPixbuf, Pango
+from gi.repository import Gtk, GdkPixbuf, GLib, Pango
 
 from .i18n import _
 
@@ -41,26 +42,38 @@ class ProcessingActions(Gtk.Dialog):
         """
             :param blivet-gui: BlivetGUI instance
             :type blivet-gui: :class:`~.blivetgui.BlivetGUI`
-            :param actions: number of actions to process
-            :type actions: int
+            :param actions: actions to process
+            :type actions: list of blivet.deviceaction.DeviceAction
 
         """
 
         self.blivet_gui = blivet_gui
         self.actions = actions
 
+        # rows of the actions in the actions list, blivet executes the actions
+        # in a different order than they were scheduled
+        self.action_rows = {action.id: row for row, action in enumerate(self.actions)}
+
         self.finished_actions = 0
+        self.total_actions = len(self.actions)
+        self.start_time = None  # time when the first action started
+        self.running = True
+        self.cancelled = False
+        self.job_id = None  # ID of the blivet_do_it job in the daemon
 
         Gtk.Dialog.__init__(self)
 
         self.set_transient_for(self.blivet_gui.main_window)
         self.set_title(_("Processing"))
-        self.add_buttons(Gtk.STOCK_OK, Gtk.ResponseType.OK)
+        self.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                         Gtk.STOCK_OK, Gtk.ResponseType.OK)
 
         self.set_border_width(8)
         self.set_position(Gtk.WindowPosition.CENTER_ON_PARENT)
         self.set_response_sensitive(Gtk.ResponseType.OK, False)
 
+        self.connect("response", self._on_response)
+
         self.grid = Gtk.Grid(column_homogeneous=False, row_spacing=10, column_spacing=5)
         self.grid.set_margin_bottom(12)
 
@@ -76,7 +89,7 @@ class ProcessingActions(Gtk.Dialog):
 
         self.grid.attach(self.label, 0, 0, 3, 1)
 
-        self.progressbar = Gtk.ProgressBar()
+        self.progressbar = Gtk.ProgressBar(show_text=True)
         self.grid.attach(self.progressbar, 0, 1, 3, 1)
 
         self.expander = Gtk.Expander(label=_("Show actions"), expanded=False)
@@ -96,20 +109,22 @@ class ProcessingActions(Gtk.Dialog):
         icon_delete = Gtk.IconTheme.load_icon(icon_theme, "edit-delete-symbolic", 16, 0)
         icon_edit = Gtk.IconTheme.load_icon(icon_theme, "edit-select-all-symbolic", 16, 0)
 
-        actions_list = Gtk.ListStore(GdkPixbuf.Pixbuf, str, GdkPixbuf.Pixbuf)
+        # icon, action, applied icon, duration, tooltip (programs run by the action)
+        actions_list = Gtk.ListStore(GdkPixbuf.Pixbuf, str, GdkPixbuf.Pixbuf, str, str)
 
         for action in self.actions:
             if action.is_destroy or action.is_remove:
-                actions_list.append([icon_delete, str(action), None])
+                actions_list.append([icon_delete, str(action), None, "", None])
             elif action.is_add or action.is_create:
-                actions_list.append([icon_add, str(action), None])
+                actions_list.append([icon_add, str(action), None, "", None])
             else:
-                actions_list.append([icon_edit, str(action), None])
+                actions_list.append([icon_edit, str(action), None, "", None])
 
         actions_view = Gtk.TreeView(model=actions_list)
         actions_view.set_headers_visible(False)
         actions_view.set_vexpand(True)
         actions_view.set_hexpand(True)
+        actions_view.set_tooltip_column(4)
 
         renderer_pixbuf = Gtk.CellRendererPixbuf()
         column_pixbuf = Gtk.TreeViewColumn(None, renderer_pixbuf, pixbuf=0)
@@ -123,10 +138,26 @@ class ProcessingActions(Gtk.Dialog):
         column_pixbuf = Gtk.TreeViewColumn(None, renderer_pixbuf, pixbuf=2)
         actions_view.append_column(column_pixbuf)
 
+        renderer_text = Gtk.CellRendererText(xalign=1.0)
+        column_text = Gtk.TreeViewColumn(None, renderer_text, text=3)
+        actions_view.append_column(column_text)
+
         self.expander.add(actions_view)
 
         return actions_view, actions_list
 
+    def _on_response(self, _dialog, response):
+        if self.running and response in (Gtk.ResponseType.CANCEL, Gtk.ResponseType.DELETE_EVENT):
+            # actions can't be stopped in the middle, only before the next one
+            # starts so keep the dialog running until the daemon stops
+            self.stop_emission_by_name("response")
+
+            if not self.cancelled:
+                self.cancelled = True
+                self.set_response_sensitive(Gtk.ResponseType.CANCEL, False)
+                self.label.set_markup("<b>%s</b>" % _("Cancelling, waiting for the current action to finish..."))
+                self.blivet_gui.client.job_cancel(self.job_id)
+
     def _set_applied_icon(self, position):
         icon_theme = Gtk.IconTheme.get_default()  # pylint: disable=no-value-for-parameter
         icon_applied = Gtk.IconTheme.lookup_icon(icon_theme, "emblem-ok-symbolic", 16,
@@ -148,34 +179,100 @@ class ProcessingActions(Gtk.Dialog):
         self.run()
         self.destroy()
 
-    def stop(self):
+    def _set_duration(self, position, duration, programs=None):
+        treeiter = self.actions_list.get_iter(Gtk.TreePath(position))
+        self.actions_list.set_value(treeiter, 3, _("{duration:.1f} s").format(duration=duration))
+
+        if programs:
+            lines = ["%s (%s)" % (GLib.markup_escape_text(p.command), _("{duration:.1f} s").format(duration=p.duration))
+                     for p in programs]
+            self.actions_list.set_value(treeiter, 4, "\n".join(lines))
+
+    def stop(self, cancelled=False, timings=None):
         """ End the thread
+
+            :param cancelled: whether processing of the actions was cancelled
+            :type cancelled: bool
+            :param timings: timings of the executed actions (see :meth:`~.blivet_utils.BlivetUtils.blivet_do_it`)
+            :type timings: list of :class:`~.communication.proxy_utils.ProxyDataContainer`
+
         """
 
-        self.progressbar.set_fraction(1)
+        self.running = False
+
+        if not cancelled:
+            self.progressbar.set_fraction(1)
+        self.progressbar.set_show_text(False)
         self.set_response_sensitive(Gtk.ResponseType.OK, True)
-        self.label.set_markup("<b>%s</b>" % _("All queued actions have been processed."))
+        self.get_widget_for_response(Gtk.ResponseType.CANCEL).hide()
 
-        # it is possible that there are no finished actions -- e.g. when adding
-        # and removing the same partition -- blivet-gui scheduled 2 actions but
-        # blivet actually won't create and destroy the partition, it will just
-        # delete both actions
-        # TODO: actually update 'blivet-gui actions' before running do_it and
-        # update number of scheduled actions to match 'blivet actions'
-        if self.finished_actions:
-            self._set_applied_icon(self.finished_actions - 1)
+        if cancelled:
+            msg = _("Processing was cancelled, {done} of {total} actions have been processed.")
+            self.label.set_markup("<b>%s</b>" % msg.format(done=self.finished_actions, total=self.total_actions))
+        else:
+            self.label.set_markup("<b>%s</b>" % _("All queued actions have been processed."))
+
+        for timing in timings or []:
+            if timing.action_id in self.action_rows:
+                self._set_duration(self.action_rows[timing.action_id], timing.duration, timing.programs)
 
         # now set resizable to False, so the dialog's size automatically adjusts
         self.set_resizable(False)
 
-    def progress_msg(self, message):
-        self.label.set_markup(_("<b>Processing action {num} of {total}</b>:"
-                                "\n<i>{action}</i>").format(num=self.finished_actions,
-                                                            total=len(self.actions),
-                                                            action=message))
+    def _format_eta(self, now):
+        if not self.finished_actions or self.start_time is None:
+            return None
+
+        # estimate based on the average time of the finished actions
+        per_action = (now - self.start_time) / self.finished_actions
+        remaining = int(per_action * (self.total_actions - self.finished_actions))
 
-        if self.finished_actions:
-            self._set_applied_icon(self.finished_actions - 1)
+        minutes, seconds = divmod(remaining, 60)
+        return _("about {min}:{sec:02d} remaining").format(min=minutes, sec=seconds)
+
+    def progress_msg(self, event):
+        """ Show a progress event from the daemon
+
+            :param event: progress event (see :meth:`~.blivet_utils.BlivetUtils.blivet_do_it`)
+            :type event: :class:`~.communication.proxy_utils.ProxyDataContainer`
+
+        """
 
-        self.progressbar.set_fraction(self.finished_actions / len(self.actions))
-        self.finished_actions += 1
+        # it is possible that blivet will execute less actions than were scheduled
+        # -- e.g. when adding and removing the same partition blivet-gui scheduled
+        # 2 actions but blivet actually won't create and destroy the partition, it
+        # will just delete both actions, so use the total reported by the daemon
+        self.total_actions = event.total
+
+        if event.event == "action_started":
+            if self.start_time is None:
+                self.start_time = event.time
+
+            if not self.cancelled:
+                self.label.set_markup(_("<b>Processing action {num} of {total}</b>:"
+                                        "\n<i>{action}</i>").format(num=event.index + 1,
+                                                                    total=event.total,
+                                                                    action=event.message))
+
+        elif event.event == "group_started":
+            if not self.cancelled:
+                self.label.set_markup(_("<b>Creating file systems ({num} of {total})</b>:"
+                                        "\n<i>{message}</i>").format(num=event.group + 1,
+                                                                     total=event.groups,
+                                                                     message=event.message))
+
+        elif event.event == "action_finished":
+            # file systems can be created in parallel, actions don't finish in order
+            self.finished_actions += 1
+            if event.action_id in self.action_rows:
+                self._set_applied_icon(self.action_rows[event.action_id])
+                self._set_duration(self.action_rows[event.action_id], event.duration)
+
+        if event.bytes_total:
+            fraction = (self.finished_actions + event.bytes_done / event.bytes_total) / event.total
+        else:
+            fraction = self.finished_actions / event.total
+        self.progressbar.set_fraction(fraction)
+
+        eta = self._format_eta(event.time)
+        self.progressbar.set_text("%d/%d" % (self.finished_actions, event.total) + (", %s" % eta if eta else ""))
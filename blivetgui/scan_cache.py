@@ -0,0 +1,183 @@
+# scan_cache.py
+# Snapshot of the last storage scan saved on disk
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# ---------------------------------------------------------------------------- #
+
+import os
+import pickle
+
+from blivet import udev
+
+from .communication.proxy_utils import ProxyDataContainer
+
+# ---------------------------------------------------------------------------- #
+
+# bump when the format of the saved snapshot changes
+CACHE_VERSION = 2
+
+# record fields compared between the cached and the live snapshot
+COMPARED_FIELDS = ("type", "size", "format_type", "format_uuid", "format_label", "parents")
+
+# ---------------------------------------------------------------------------- #
+
+
+def udev_seqnum():
+    """ Get the current udev (kernel uevent) sequence number, None if not available
+    """
+
+    try:
+        with open("/sys/kernel/uevent_seqnum") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def boot_id():
+    """ Get ID of the current boot, None if not available
+
+        ..note.: the udev sequence number starts from zero after every boot
+                 so it can be compared only together with this
+    """
+
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _sysfs_size(info):
+    try:
+        with open(os.path.join(udev.device_get_sysfs_path(info), "size")) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def block_devices_fingerprint():
+    """ Get names, sizes (in sectors) and UUIDs of all block devices known to udev
+
+        :returns: sorted list of (name, size, uuid)
+        :rtype: list of tuple
+
+    """
+
+    return sorted((udev.device_get_name(info), _sysfs_size(info), udev.device_get_uuid(info))
+                  for info in udev.get_devices())
+
+
+def _by_name(snapshot):
+    """ Records from the snapshot by device name with parents as names
+        (device ids are not the same after a new scan)
+    """
+
+    records = {}
+    for record in snapshot.devices.values():
+        fields = {field: record[field] for field in COMPARED_FIELDS}
+        fields["parents"] = sorted(snapshot.devices[parent].name for parent in record.parents
+                                   if parent in snapshot.devices)
+        records[record.name] = fields
+
+    return records
+
+
+def compare_snapshots(cached, live):
+    """ Compare the cached snapshot with the result of a new scan
+
+        :param cached: snapshot loaded from the cache
+        :param live: snapshot of the current devicetree
+        :returns: names of devices added, removed and changed since the cached scan
+        :rtype: :class:`~.communication.proxy_utils.ProxyDataContainer`
+
+    """
+
+    cached_records = _by_name(cached)
+    live_records = _by_name(live)
+
+    return ProxyDataContainer(added=sorted(name for name in live_records if name not in cached_records),
+                              removed=sorted(name for name in cached_records if name not in live_records),
+                              changed=sorted(name for name, record in live_records.items()
+                                             if name in cached_records and cached_records[name] != record))
+
+
+class ScanCache:
+    """ Snapshot of the last storage scan (see :meth:`~.blivet_utils.BlivetUtils.get_device_snapshot`)
+        saved together with the udev sequence number and fingerprint of the block
+        devices present during the scan
+
+        ..note.: the snapshot is only a list of device records for showing the last known
+                 configuration while the real scan is running, the devicetree itself
+                 can't be restored from it
+    """
+
+    def __init__(self, path):
+        """
+            :param path: path of the cache file (the directory is created if needed)
+            :type path: str
+
+        """
+
+        self.path = path
+
+    def load(self):
+        """ Load the saved snapshot
+
+            :returns: the snapshot ("snapshot"), whether block devices changed since it was
+                      saved ("outdated") and whether no udev event was received since then
+                      ("exact"), None if there is no (usable) saved snapshot
+            :rtype: :class:`~.communication.proxy_utils.ProxyDataContainer` or None
+
+        """
+
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except Exception:  # pylint: disable=broad-except
+            # missing or corrupted cache is not an error, we will just scan
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return None
+
+        # sequence number is valid only in the same boot, otherwise compare the block devices
+        exact = (data["seqnum"] is not None and data["boot_id"] is not None and
+                 data["boot_id"] == boot_id() and data["seqnum"] == udev_seqnum())
+        outdated = not exact and data["fingerprint"] != block_devices_fingerprint()
+
+        return ProxyDataContainer(snapshot=data["snapshot"], outdated=outdated, exact=exact)
+
+    def save(self, snapshot):
+        """ Save the snapshot of the current devicetree
+
+            :param snapshot: result of :meth:`~.blivet_utils.BlivetUtils.get_device_snapshot`
+
+        """
+
+        data = {"version": CACHE_VERSION,
+                "boot_id": boot_id(),
+                "seqnum": udev_seqnum(),
+                "fingerprint": block_devices_fingerprint(),
+                "snapshot": snapshot}
+
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+
+        # write the new snapshot first so an interrupted write doesn't corrupt the old one
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
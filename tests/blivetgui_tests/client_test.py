@@ -1,7 +1,12 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, patch, call
+
+import gc
+import socket
 
 from blivetgui.communication.client import BlivetGUIClient, ClientProxyObject
+from blivetgui.communication import protocol
+from blivetgui.communication.errors import ServerConnectionError, ProtocolError
 from blivetgui.communication.proxy_utils import ProxyID, ProxyDataContainer
 
 from blivet.size import Size
@@ -27,6 +32,208 @@ class BlivetGUIClientTest(unittest.TestCase):
         self.assertTrue(isinstance(converted_answer, ClientProxyObject))
         self.assertEqual(converted_answer.proxy_id, msg)  # pylint: disable=no-member
 
+        # ProxyDataContainer with a ProxyID inside
+        test_dict = {}
+        client = MagicMock(id_dict=test_dict)
+        client._answer_convert_to_object = lambda answer: BlivetGUIClient._answer_convert_to_object(client, answer)
+        msg = ProxyDataContainer(success=True, answer=[ProxyID(), "abcdef"], info={"a": ProxyID()})
+        converted_answer = client._answer_convert_to_object(msg)
+        self.assertTrue(isinstance(converted_answer, ProxyDataContainer))
+        self.assertTrue(converted_answer.success)
+        self.assertTrue(isinstance(converted_answer.answer[0], ClientProxyObject))
+        self.assertEqual(converted_answer.answer[0].proxy_id, msg.answer[0])
+        self.assertEqual(converted_answer.answer[1], "abcdef")
+        self.assertTrue(isinstance(converted_answer.info["a"], ClientProxyObject))
+
+    def test_release_proxies(self):
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client._recv_msg = MagicMock()
+        with patch("blivetgui.communication.client.Thread"):
+            client._start_reader()
+        client._init_proxy_tracking()
+        client._send = MagicMock()
+        client.mutex = MagicMock()
+
+        proxy_id = ProxyID()
+        proxy = client._answer_convert_to_object(proxy_id)
+        self.assertIs(client._answer_convert_to_object(proxy_id), proxy)
+        self.assertEqual(len(client.id_dict), 1)
+
+        # proxy object is garbage collected -- its ID (received twice) is released
+        del proxy
+        gc.collect()
+        self.assertEqual(len(client.id_dict), 0)
+        self.assertEqual(list(client.released_ids), [(proxy_id.id, 2)])
+
+        # released IDs are sent in batches together with the next request
+        client.release_batch = 2
+        client._send_request(b"data", MagicMock())
+        client._send.assert_called_once_with(b"data", 1)
+
+        proxy_id2 = ProxyID()
+        client._answer_convert_to_object(proxy_id2)
+        gc.collect()
+        client._send.reset_mock()
+        client._send_request(b"data", MagicMock())
+        self.assertEqual(client._send.call_count, 2)
+        release_msg = protocol.decode(*client._send.call_args_list[0][0][0])
+        self.assertEqual(release_msg, ("release", [(proxy_id.id, 2), (proxy_id2.id, 1)]))
+        self.assertEqual(len(client.released_ids), 0)
+
+    def test_release_proxy_received_again(self):
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client._init_proxy_tracking()
+
+        proxy_id = ProxyID()
+        proxy = client._answer_convert_to_object(proxy_id)
+        key = client._proxy_keys[proxy_id.id]
+
+        # the proxy is dead (it's not returned for its ID anymore), but not finalized
+        # yet when the same ID is received again -- new proxy object is created
+        del client.id_dict[proxy_id.id]
+        proxy2 = client._answer_convert_to_object(proxy_id)
+        self.assertIsNot(proxy2, proxy)
+
+        # the old proxy releases only the ID received for it, the new one is still alive
+        client._proxy_released(proxy_id.id, key)
+        self.assertEqual(list(client.released_ids), [(proxy_id.id, 1)])
+        self.assertIs(client._answer_convert_to_object(proxy_id), proxy2)
+
+        del proxy2
+        gc.collect()
+        self.assertEqual(list(client.released_ids), [(proxy_id.id, 1), (proxy_id.id, 2)])
+
+        # proxy tracking is not shared between clients
+        client2 = BlivetGUIClient.__new__(BlivetGUIClient)
+        client2._init_proxy_tracking()
+        self.assertEqual(len(client2.released_ids), 0)
+
+    def test_recv_msg(self):
+        sock1, sock2 = socket.socketpair()
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client.sock = sock2
+        client._recv_buffer = protocol.ReceiveBuffer()
+
+        # answers are decoded right away, the buffer is reused for the next one
+        protocol.send_message(sock1, 42, protocol.encode(["abcdef", Size("8 GiB")]))
+        self.assertEqual(client._recv_msg(), (42, ["abcdef", Size("8 GiB")]))
+
+        # answer we can't decode
+        sock1.sendall(protocol.HEADER.pack(protocol.PROTOCOL_VERSION, 127, 0, 43, 0))
+        request_id, answer = client._recv_msg()
+        self.assertEqual(request_id, 43)
+        self.assertTrue(isinstance(answer, ProtocolError))
+
+        sock1.close()
+        with self.assertRaises(ServerConnectionError):
+            client._recv_msg()
+        sock2.close()
+
+    def test_read_answers(self):
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client._recv_msg = MagicMock()
+        with patch("blivetgui.communication.client.Thread"):
+            client._start_reader()
+
+        handler1 = MagicMock()
+        handler2 = MagicMock()
+        handler3 = MagicMock()
+        handler4 = MagicMock(side_effect=RuntimeError("failed to handle the answer"))
+        client._requests = {1: (handler1, False), 2: (handler2, True), 3: (handler3, False),
+                            5: (handler4, False)}
+
+        # answers are dispatched by request ID, not by order, failing handler
+        # doesn't stop the dispatching
+        error = ServerConnectionError("connection closed")
+        client._recv_msg.side_effect = [(2, b"progress"), (5, b"answer"), (1, b"answer"), (2, b"result"),
+                                        (4, b"unknown"), error]
+        with patch("blivetgui.communication.client.traceback"):
+            client._read_answers()
+
+        handler1.assert_called_once_with(b"answer")
+        self.assertEqual(handler2.call_args_list, [call(b"progress"), call(b"result"), call(error)])
+
+        # requests still waiting for an answer are notified about the closed connection
+        handler3.assert_called_once_with(error)
+        self.assertEqual(client._requests, {})
+
+        with self.assertRaises(ServerConnectionError):
+            client._send_request(b"data", MagicMock())
+
+        # quit with already broken connection
+        client.sock = MagicMock()
+        client.sock.sendall.side_effect = BrokenPipeError()
+        client.sock.shutdown.side_effect = OSError()
+        client.mutex = MagicMock()
+        client.quit()
+        client.sock.close.assert_called_once()
+
+    def test_remote_init(self):
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client._send_request = MagicMock(return_value=1)
+        client._drop_request = MagicMock()
+        self.assertFalse(client.init_pending)
+
+        client.remote_init_start([], ["sda"], {}, "startup")
+        self.assertTrue(client.init_pending)
+        data, handler = client._send_request.call_args[0]
+        self.assertEqual(protocol.decode(*data), ("init", ([], ["sda"], {}, "startup")))
+
+        # answers received before we started waiting for them are not lost
+        handler((False, "Scanning storage configuration..."))
+        handler((True, ProxyDataContainer(success=True)))
+
+        progress = MagicMock()
+        ret = client.remote_init_wait(progress)
+        self.assertTrue(ret.success)
+        progress.assert_called_once_with("Scanning storage configuration...")
+        client._drop_request.assert_called_once_with(1)
+        self.assertFalse(client.init_pending)
+
+        # cached configuration is sent before the progress messages
+        client.remote_init_start([], ["sda"], {}, "startup", scan_cache=True)
+        data, handler = client._send_request.call_args[0]
+        self.assertEqual(protocol.decode(*data), ("init", ([], ["sda"], {}, "startup"), True))
+
+        cached = ProxyDataContainer(snapshot=None, outdated=False, exact=True)
+        handler((False, cached))
+        handler((False, "Scanning storage configuration..."))
+        handler((True, ProxyDataContainer(success=True)))
+
+        progress = MagicMock()
+        show_cached = MagicMock()
+        client.remote_init_wait(progress, show_cached)
+        show_cached.assert_called_once()
+        self.assertTrue(show_cached.call_args[0][0].exact)
+        progress.assert_called_once_with("Scanning storage configuration...")
+
+    def test_jobs(self):
+        client = BlivetGUIClient.__new__(BlivetGUIClient)
+        client._request = MagicMock(return_value=1)
+
+        proxy = ClientProxyObject(client, ProxyID(7))
+        self.assertEqual(client.start_job("device_resizable", proxy), 1)
+        msg = protocol.decode(*client._request.call_args[0][0])
+        self.assertEqual(msg[:2], ("job_start", "device_resizable"))
+        self.assertEqual(msg[2][0].id, 7)
+
+        client._request.return_value = ProxyDataContainer(state="running", progress=["event"])
+        self.assertEqual(client.job_status(1).progress, ["event"])
+
+        # unknown job
+        client._request.return_value = KeyError("Unknown job 2")
+        with self.assertRaises(KeyError):
+            client.job_status(2)
+
+        # result is the same as for remote_call
+        client._request.return_value = ProxyDataContainer(success=True, answer=True)
+        self.assertTrue(client.job_result(1))
+        self.assertEqual(protocol.decode(*client._request.call_args[0][0]), ("job_result", 1))
+
+        client._request.return_value = ProxyDataContainer(success=False, exception=RuntimeError("failed"), traceback="")
+        with self.assertRaises(RuntimeError):
+            client.job_result(1)
+
     @patch("blivetgui.communication.client.BlivetGUIClient.__init__", lambda a, b: None)
     def test_convert_args(self):
         client = BlivetGUIClient(MagicMock())
@@ -60,6 +267,88 @@ class BlivetGUIClientTest(unittest.TestCase):
         self.assertTrue(isinstance(converted_args[0].data3.dataB, ProxyID))
         self.assertEqual(converted_args[0].data3.dataB, args[0].data3.dataB.proxy_id)
 
+        # dict (as an argument and inside ProxyDataContainer)
+        proxy = ClientProxyObject(MagicMock(), ProxyID())
+        args = [{"a": proxy, "b": "abcdef"}, ProxyDataContainer(data={1: proxy})]
+        converted_args = client._args_convert_to_id(args)
+        self.assertEqual(converted_args[0], {"a": proxy.proxy_id, "b": "abcdef"})
+        self.assertEqual(converted_args[1].data, {1: proxy.proxy_id})
+
+
+class ClientProxyObjectTest(unittest.TestCase):
+
+    def test_prefetch(self):
+        client = MagicMock()
+        fmt = ClientProxyObject(client, ProxyID())
+        client.remote_params.return_value = ["sda1", fmt, "ext4", AttributeError("no label")]
+
+        device = ClientProxyObject(client, ProxyID())
+        device.prefetch("name", "format.type", "format.label")
+
+        # sub-object should be requested automatically before its attributes
+        client.remote_params.assert_called_once_with(device.proxy_id, ["name", "format", "format.type", "format.label"])
+
+        # prefetched values are served without contacting the server
+        self.assertEqual(device.name, "sda1")
+        self.assertEqual(device.format, fmt)
+        self.assertEqual(device.format.type, "ext4")
+        with self.assertRaises(AttributeError):
+            device.format.label  # pylint: disable=W0104
+        client.remote_param.assert_not_called()
+
+        # not prefetched attribute
+        client.remote_param.return_value = "disk"
+        self.assertEqual(device.type, "disk")
+        client.remote_param.assert_called_once_with(device.proxy_id, "type")
+
+        # setting an attribute drops the prefetched value
+        device.name = "sda2"
+        client.remote_param.return_value = "sda2"
+        self.assertEqual(device.name, "sda2")
+
+    def test_iter(self):
+        client = MagicMock()
+        device = ClientProxyObject(client, ProxyID())
+
+        # all members in one request
+        client.remote_materialize.return_value = ["sda1", "sda2"]
+        self.assertEqual([member for member in device], ["sda1", "sda2"])
+        client.remote_method.assert_not_called()
+
+        # unbounded iterable -- iterate remotely
+        client.remote_materialize.return_value = None
+        self.assertEqual(iter(device), client.remote_method.return_value)
+        client.remote_method.assert_called_once_with(device.proxy_id, "__iter__", (), {})
+
+    def test_cache(self):
+        client = MagicMock(generation=1)
+        device = ClientProxyObject(client, ProxyID())
+        device.cache()
+
+        # cached attributes are fetched only once
+        client.remote_param.return_value = "sda"
+        self.assertEqual(device.name, "sda")
+        self.assertEqual(device.name, "sda")
+        client.remote_param.assert_called_once_with(device.proxy_id, "name")
+
+        # not cached attribute
+        client.remote_param.reset_mock()
+        client.remote_param.return_value = 0
+        self.assertEqual(device.size, 0)
+        self.assertEqual(device.size, 0)
+        self.assertEqual(client.remote_param.call_count, 2)
+
+        # devicetree changed -- cached (and prefetched) values are dropped
+        client.remote_params.return_value = ["disk"]
+        device.prefetch("type")
+        client.generation = 2
+        client.remote_param.reset_mock()
+        client.remote_param.return_value = "sdb"
+        self.assertEqual(device.name, "sdb")
+        client.remote_param.return_value = "partition"
+        self.assertEqual(device.type, "partition")
+        self.assertEqual(client.remote_param.call_count, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,147 @@
+import select
+import threading
+import unittest
+
+from blivetgui.communication.jobs import JobManager, JOB_QUEUED, JOB_FINISHED, JOB_CANCELLED
+
+
+class JobManagerTest(unittest.TestCase):
+
+    def _wait_finished(self, manager):
+        # the manager is used with select() by the server
+        self.assertTrue(select.select([manager], [], [], 5)[0])
+        return manager.take_finished()
+
+    def test_run_jobs(self):
+        def _run_job(job):
+            job.report_progress("running %s" % job.method)
+            return job.args[0] * 2
+
+        manager = JobManager(_run_job)
+        self.assertFalse(manager.active)
+
+        job = manager.start("method", [21], exclusive=True)
+        self.assertTrue(manager.active)
+        self.assertTrue(manager.exclusive_active)
+        self.assertFalse(manager.reported(job.id))
+
+        finished = self._wait_finished(manager)
+        self.assertEqual(finished, [job])
+        self.assertEqual(job.state, JOB_FINISHED)
+        self.assertEqual(job.result, 42)
+        self.assertEqual(job.take_progress(), ["running method"])
+        self.assertEqual(job.take_progress(), [])
+        self.assertFalse(manager.active)
+        self.assertTrue(manager.reported(job.id))
+
+        manager.stop()
+
+    def test_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def _run_job(job):
+            started.set()
+            release.wait(5)
+            return job.cancel_requested()
+
+        manager = JobManager(_run_job)
+
+        # running job can be cancelled only if cancellable
+        job1 = manager.start("method", [])
+        self.assertTrue(started.wait(5))
+        self.assertFalse(manager.cancel(job1.id))
+
+        job2 = manager.start("blivet_do_it", [], cancellable=True)
+        job3 = manager.start("method", [])
+
+        # queued job is never started
+        self.assertEqual(job3.state, JOB_QUEUED)
+        self.assertTrue(manager.cancel(job3.id))
+
+        release.set()
+
+        finished = []
+        while len(finished) < 3:
+            finished.extend(self._wait_finished(manager))
+
+        self.assertEqual(finished, [job1, job2, job3])
+        self.assertTrue(job1.result)  # cancel was requested, but the job couldn't stop
+        self.assertFalse(job2.result)
+        self.assertEqual(job3.state, JOB_CANCELLED)
+        self.assertIsNone(job3.result)
+
+        # finished jobs can't be cancelled
+        self.assertFalse(manager.cancel(job1.id))
+
+        manager.stop()
+
+    def test_cancel_starting(self):
+        release = threading.Event()
+
+        def _run_job(job):
+            release.wait(5)
+            return job.method
+
+        manager = JobManager(_run_job)
+
+        # keep the second job queued until its cancel check is replaced
+        job1 = manager.start("method", [])
+        job2 = manager.start("method", [])
+
+        cancelled = []
+        threads = []
+        cancel_requested = job2.cancel_requested
+
+        def _cancel_requested():
+            # cancel the job while the worker is deciding whether to start it
+            thread = threading.Thread(target=lambda: cancelled.append(manager.cancel(job2.id)))
+            thread.start()
+            threads.append(thread)
+            thread.join(0.1)
+            return cancel_requested()
+
+        job2.cancel_requested = _cancel_requested
+        release.set()
+
+        finished = []
+        while len(finished) < 2:
+            finished.extend(self._wait_finished(manager))
+        threads[0].join(5)
+
+        # the job was already starting, so it can't be cancelled
+        self.assertEqual(cancelled, [False])
+        self.assertEqual(job2.state, JOB_FINISHED)
+        self.assertEqual(job2.result, "method")
+
+        manager.stop()
+
+    def test_unfetched_results(self):
+        manager = JobManager(lambda job: job.method, max_unfetched=2)
+
+        jobs = [manager.start("method%d" % i, []) for i in range(4)]
+        jobs[1].result_requests.append(1)
+
+        finished = []
+        while len(finished) < 4:
+            finished.extend(self._wait_finished(manager))
+
+        # only the two last results nobody asked for are kept
+        self.assertEqual(sorted(manager.jobs), [jobs[1].id, jobs[2].id, jobs[3].id])
+
+        # fetched results are forgotten
+        manager.forget(jobs[1].id)
+        manager.forget(jobs[2].id)
+        self.assertEqual(list(manager.jobs), [jobs[3].id])
+
+        job = manager.start("method", [])
+        self._wait_finished(manager)
+        self.assertEqual(sorted(manager.jobs), [jobs[3].id, job.id])
+
+        # nobody is going to fetch the results after the client disconnects
+        manager.stop()
+        self.assertEqual(manager.jobs, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
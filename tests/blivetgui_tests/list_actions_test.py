@@ -68,6 +68,27 @@ class ListActionsTest(unittest.TestCase):
         self.assertFalse(self.buttons_state)
         self.assertIn(_("No pending actions"), self.actions_label)
 
+    def test_remove(self):
+        action1 = MagicMock()
+        self.actions_list.append(action_type="add", action_desc="add", blivet_actions=[action1])
+        action2 = MagicMock()
+        action3 = MagicMock()
+        self.actions_list.append(action_type="add", action_desc="add", blivet_actions=[action2, action3])
+
+        # action2 was cancelled -- the whole blivet-gui action is removed
+        remaining = self.actions_list.remove([action2])
+        self.assertEqual(remaining, [action3])
+        self.assertEqual(self.actions_list.actions, 1)
+        self.assertEqual(self.actions_list.history, [[action1]])
+        self.assertTrue(self.buttons_state)
+        self.assertIn(P_("%s pending action", "%s pending actions", 1) % 1, self.actions_label)
+
+        remaining = self.actions_list.remove([action1])
+        self.assertEqual(remaining, [])
+        self.assertEqual(self.actions_list.actions, 0)
+        self.assertFalse(self.buttons_state)
+        self.assertIn(_("No pending actions"), self.actions_label)
+
     def test_clear(self):
         action1 = MagicMock()
         self.actions_list.append(action_type="add", action_desc="add", blivet_actions=[action1])
@@ -326,6 +326,42 @@ class ListPartitionsTest(unittest.TestCase):
         self.assertEqual(self.list_partitions.partitions_list.get_value(it, 5), "")
         self.assertIsNone(self.list_partitions.partitions_list.get_value(it, 6))
 
+    def test_apply_changes(self):
+        self.list_partitions.device_iters = {}
+        self.list_partitions.parent_device_id = 1
+
+        device = MagicMock(id=2, type="partition", size=Size("1 GiB"), path="/dev/vda1",
+                           format=MagicMock(type="ext4", mountable=True, label="aaaaa", system_mountpoint=None))
+        device.configure_mock(name="vda1")
+        it = self.list_partitions._add_to_store(device)
+        self.assertEqual(self.list_partitions.device_iters[2], it)
+
+        # full change -- reload needed
+        changes = MagicMock(full=True, added=[], removed=[], modified=[], changed={})
+        self.assertFalse(self.list_partitions.apply_changes(changes))
+
+        # change of a device that is not shown -- nothing to do
+        changes = MagicMock(full=False, added=[], removed=[], modified=[MagicMock(id=3)],
+                            changed={3: ["size"]})
+        self.assertTrue(self.list_partitions.apply_changes(changes))
+
+        # new child of the listed device -- reload needed
+        changes = MagicMock(full=False, added=[MagicMock(id=4, parents=[1])], removed=[], modified=[],
+                            changed={})
+        self.assertFalse(self.list_partitions.apply_changes(changes))
+
+        # resized partition -- reload needed
+        changes = MagicMock(full=False, added=[], removed=[], modified=[MagicMock(id=2)],
+                            changed={2: ["size"]})
+        self.assertFalse(self.list_partitions.apply_changes(changes))
+
+        # relabeled partition -- the row is updated in place
+        device.format.label = "bbbbb"
+        changes = MagicMock(full=False, added=[], removed=[], modified=[MagicMock(id=2)],
+                            changed={2: ["format_label"]})
+        self.assertTrue(self.list_partitions.apply_changes(changes))
+        self.assertEqual(self.list_partitions.partitions_list.get_value(it, 5), "bbbbb")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+from unittest.mock import MagicMock
+
+import socket
+
+from blivetgui.communication import protocol
+from blivetgui.communication.errors import ProtocolError
+from blivetgui.communication.proxy_utils import ProxyID, ProxyDataContainer
+
+from blivet.size import Size
+
+
+def _fake_recv_into(packets):
+    """ socket.recv_into returning the given packets (split if they don't fit into the buffer) """
+
+    def _recv_into(view):
+        packet = packets.pop(0)
+        if len(packet) > len(view):
+            packets.insert(0, packet[len(view):])
+            packet = packet[:len(view)]
+        view[:len(packet)] = packet
+        return len(packet)
+
+    return _recv_into
+
+
+class ProtocolTest(unittest.TestCase):
+
+    def test_encode(self):
+        # built-in types only -- marshal
+        for msg in ("abcdef", 1, 1.01, True, None, ["abcdef", 1, (None, False)], {"a": [1, 2]}):
+            encoding, data = protocol.encode(msg)
+            self.assertEqual(encoding, protocol.MARSHAL)
+            self.assertEqual(protocol.decode(encoding, data), msg)
+
+        # ProxyID
+        msg = ProxyID()
+        encoding, data = protocol.encode(msg)
+        self.assertEqual(encoding, protocol.MARSHAL_PROXY_ID)
+        decoded = protocol.decode(encoding, data)
+        self.assertTrue(isinstance(decoded, ProxyID))
+        self.assertEqual(decoded.id, msg.id)
+
+        # request for a proxy object
+        msg = ("method", ProxyID(), "method_name", ("abcdef", 1), {"arg": True})
+        encoding, data = protocol.encode(msg)
+        self.assertEqual(encoding, protocol.MARSHAL_PROXY_REQUEST)
+        decoded = protocol.decode(encoding, data)
+        self.assertEqual(decoded[1].id, msg[1].id)
+        self.assertEqual(decoded[:1] + decoded[2:], msg[:1] + msg[2:])
+
+        # other types -- pickle
+        for msg in (Size("8 GiB"), ["abcdef", Size("8 GiB")], ("call", "method", [ProxyID()]),
+                    ProxyDataContainer(success=False, answer="abcdef"), ValueError("error")):
+            encoding, data = protocol.encode(msg)
+            self.assertEqual(encoding, protocol.PICKLE)
+            self.assertEqual(type(protocol.decode(encoding, data)), type(msg))
+
+        # successful call results are sent without the container
+        for answer in ("abcdef", ["abcdef", 1], ProxyID()):
+            msg = ProxyDataContainer(success=True, answer=answer)
+            encoding, data = protocol.encode(msg)
+            self.assertTrue(encoding & protocol.CALL_RESULT)
+            decoded = protocol.decode(encoding, data)
+            self.assertTrue(isinstance(decoded, ProxyDataContainer))
+            self.assertTrue(decoded.success)
+            self.assertEqual(type(decoded.answer), type(answer))
+
+        # ...but only if the answer doesn't need pickling
+        msg = ProxyDataContainer(success=True, answer=Size("8 GiB"))
+        encoding, data = protocol.encode(msg)
+        self.assertEqual(encoding, protocol.PICKLE)
+        self.assertEqual(protocol.decode(encoding, data).answer, Size("8 GiB"))
+
+        with self.assertRaises(ProtocolError):
+            protocol.decode(127, b"")
+
+    def test_send_recv(self):
+        sock1, sock2 = socket.socketpair()
+
+        msg = ["abcdef" * 1000, Size("8 GiB")]
+        protocol.send_message(sock1, 42, protocol.encode(msg), generation=7)
+
+        request_id, encoding, data, generation = protocol.recv_message(sock2)
+        self.assertEqual(request_id, 42)
+        self.assertEqual(generation, 7)
+        self.assertEqual(protocol.decode(encoding, data), msg)
+
+        # wrong protocol version
+        sock1.sendall(protocol.HEADER.pack(protocol.PROTOCOL_VERSION + 1, protocol.MARSHAL, 0, 1, 0))
+        with self.assertRaises(ProtocolError):
+            protocol.recv_message(sock2)
+
+        # closed connection
+        sock1.close()
+        self.assertIsNone(protocol.recv_message(sock2))
+        sock2.close()
+
+        # message split into multiple packets
+        sock = MagicMock()
+        encoded = protocol.encode("abcdef")
+        raw = protocol.HEADER.pack(protocol.PROTOCOL_VERSION, encoded[0], len(encoded[1]), 1, 0) + encoded[1]
+        packets = [raw[:3], raw[3:10], raw[10:12], raw[12:]]
+
+        sock.recv_into.side_effect = _fake_recv_into(packets)
+        request_id, encoding, data, _generation = protocol.recv_message(sock)
+        self.assertEqual(protocol.decode(encoding, data), "abcdef")
+
+    def test_recv_buffer(self):
+        sock1, sock2 = socket.socketpair()
+        buf = protocol.ReceiveBuffer(size=64)
+
+        # multiple small messages received at once
+        for request_id in (1, 2, 3):
+            protocol.send_message(sock1, request_id, protocol.encode("abcdef"))
+        for request_id in (1, 2, 3):
+            msg = protocol.recv_message(sock2, buf)
+            self.assertEqual(msg[0], request_id)
+            self.assertEqual(protocol.decode(msg[1], msg[2]), "abcdef")
+        self.assertEqual(len(buf._data), 64)
+
+        # buffer grows for a larger message...
+        msg = ["abcdef" * 1000, Size("8 GiB")]
+        protocol.send_message(sock1, 4, protocol.encode(msg))
+        _request_id, encoding, data, _generation = protocol.recv_message(sock2, buf)
+        self.assertEqual(protocol.decode(encoding, data), msg)
+        data.release()
+        size = len(buf._data)
+        self.assertGreaterEqual(size, len(protocol.encode(msg)[1]))
+
+        # ...and is reused for the next ones
+        protocol.send_message(sock1, 5, protocol.encode("abcdef"))
+        _request_id, encoding, data, _generation = protocol.recv_message(sock2, buf)
+        self.assertEqual(protocol.decode(encoding, data), "abcdef")
+        self.assertEqual(len(buf._data), size)
+        data.release()
+
+        sock1.close()
+        self.assertIsNone(protocol.recv_message(sock2, buf))
+        sock2.close()
+
+        # message split into multiple packets, last one with a start of the next message
+        sock = MagicMock()
+        buf = protocol.ReceiveBuffer(size=16)
+        raw = b""
+        for request_id, msg in ((1, "abcdef" * 10), (2, "abcdef")):
+            encoded = protocol.encode(msg)
+            raw += protocol.HEADER.pack(protocol.PROTOCOL_VERSION, encoded[0], len(encoded[1]), request_id, 0) + encoded[1]
+        packets = [raw[:3], raw[3:10], raw[10:20], raw[20:80], raw[80:]]
+
+        sock.recv_into.side_effect = _fake_recv_into(packets)
+        request_id, encoding, data, _generation = protocol.recv_message(sock, buf)
+        self.assertEqual((request_id, protocol.decode(encoding, data)), (1, "abcdef" * 10))
+        request_id, encoding, data, _generation = protocol.recv_message(sock, buf)
+        self.assertEqual((request_id, protocol.decode(encoding, data)), (2, "abcdef"))
+
+    def test_recv_buffer_compaction(self):
+        # short message and start of the next one fill the buffer, rest of the next
+        # message doesn't fit, so its pending part is moved over itself to the start
+        sock = MagicMock()
+        buf = protocol.ReceiveBuffer(size=64)
+        payload1 = b"ab"
+        payload2 = bytes(range(48))
+        raw = b""
+        for request_id, payload in ((1, payload1), (2, payload2)):
+            raw += protocol.HEADER.pack(protocol.PROTOCOL_VERSION, 0, len(payload), request_id, 0) + payload
+        sock.recv_into.side_effect = _fake_recv_into([raw[:64], raw[64:]])
+
+        request_id, _encoding, data, _generation = protocol.recv_message(sock, buf)
+        self.assertEqual((request_id, bytes(data)), (1, payload1))
+        self.assertLess(buf._start + protocol.HEADER.size, buf.pending - protocol.HEADER.size)
+
+        # view of the previous message still exists, the buffer must not be resized
+        request_id, _encoding, data, _generation = protocol.recv_message(sock, buf)
+        self.assertEqual((request_id, bytes(data)), (2, payload2))
+        self.assertEqual(len(buf._data), 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from blivetgui.communication.proxy_utils import ProxyDataContainer
+from blivetgui.scan_cache import ScanCache, compare_snapshots
+
+from blivet.size import Size
+
+
+def _record(dev_id, name, dev_type, size, parents=None, children=None, format_type=None, format_uuid=None):
+    return ProxyDataContainer(id=dev_id, name=name, type=dev_type, size=Size(size), format_type=format_type,
+                              format_uuid=format_uuid, format_label=None, parents=parents or [],
+                              children=children or [])
+
+
+def _snapshot(*records, disks=None):
+    return ProxyDataContainer(devices={r.id: r for r in records}, disks=disks or [], lvm=[], raid=[],
+                              btrfs=[], stratis=[])
+
+
+class ScanCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, "cache", "devicetree.cache")
+
+    def test_save_load(self):
+        snapshot = _snapshot(_record(1, "sda", "disk", "8 GiB", children=[2]),
+                             _record(2, "sda1", "partition", "1 GiB", parents=[1], format_type="ext4"),
+                             disks=[1])
+        cache = ScanCache(self.path)
+
+        # nothing saved yet
+        self.assertIsNone(cache.load())
+
+        with patch("blivetgui.scan_cache.udev_seqnum", return_value=10), \
+             patch("blivetgui.scan_cache.boot_id", return_value="boot1"), \
+             patch("blivetgui.scan_cache.block_devices_fingerprint", return_value=[("sda", 100, None)]):
+            cache.save(snapshot)
+
+            # nothing happened since the scan
+            cached = cache.load()
+            self.assertTrue(cached.exact)
+            self.assertFalse(cached.outdated)
+            self.assertEqual(cached.snapshot.devices[2].name, "sda1")
+            self.assertEqual(cached.snapshot.devices[2].size, Size("1 GiB"))
+
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+        # same sequence number after a reboot, block devices must be compared
+        with patch("blivetgui.scan_cache.udev_seqnum", return_value=10), \
+             patch("blivetgui.scan_cache.boot_id", return_value="boot2"), \
+             patch("blivetgui.scan_cache.block_devices_fingerprint", return_value=[("sdb", 50, None)]):
+            cached = cache.load()
+            self.assertFalse(cached.exact)
+            self.assertTrue(cached.outdated)
+
+        # boot ID not available -- the sequence number can't be trusted
+        with patch("blivetgui.scan_cache.udev_seqnum", return_value=10), \
+             patch("blivetgui.scan_cache.boot_id", return_value=None), \
+             patch("blivetgui.scan_cache.block_devices_fingerprint", return_value=[("sda", 100, None)]):
+            cached = cache.load()
+            self.assertFalse(cached.exact)
+            self.assertFalse(cached.outdated)
+
+        # some udev events but the same block devices
+        with patch("blivetgui.scan_cache.udev_seqnum", return_value=15), \
+             patch("blivetgui.scan_cache.block_devices_fingerprint", return_value=[("sda", 100, None)]):
+            cached = cache.load()
+            self.assertFalse(cached.exact)
+            self.assertFalse(cached.outdated)
+
+        # new block device
+        with patch("blivetgui.scan_cache.udev_seqnum", return_value=20), \
+             patch("blivetgui.scan_cache.block_devices_fingerprint", return_value=[("sda", 100, None), ("sdb", 50, None)]):
+            self.assertTrue(cache.load().outdated)
+
+        # corrupted cache is ignored
+        with open(self.path, "wb") as f:
+            f.write(b"garbage")
+        self.assertIsNone(cache.load())
+
+    def test_compare_snapshots(self):
+        cached = _snapshot(_record(1, "sda", "disk", "8 GiB", children=[2, 3]),
+                           _record(2, "sda1", "partition", "1 GiB", parents=[1], format_type="ext4"),
+                           _record(3, "sda2", "partition", "1 GiB", parents=[1], format_type="xfs"),
+                           disks=[1])
+
+        # device ids are different after a new scan, devices are compared by name
+        live = _snapshot(_record(11, "sda", "disk", "8 GiB", children=[12, 13]),
+                         _record(12, "sda1", "partition", "1 GiB", parents=[11], format_type="ext4"),
+                         _record(13, "sda2", "partition", "1 GiB", parents=[11], format_type="swap"),
+                         _record(14, "sdb", "disk", "8 GiB"),
+                         disks=[11, 14])
+
+        mismatch = compare_snapshots(cached, live)
+        self.assertEqual(mismatch.added, ["sdb"])
+        self.assertEqual(mismatch.removed, [])
+        self.assertEqual(mismatch.changed, ["sda2"])
+
+        mismatch = compare_snapshots(live, live)
+        self.assertFalse(mismatch.added or mismatch.removed or mismatch.changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
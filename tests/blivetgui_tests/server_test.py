@@ -1,9 +1,15 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-import pickle
+import select
+import socket
+import weakref
 
+from blivetgui.communication import protocol
 from blivetgui.communication.server import BlivetUtilsServer, BlivetProxyObject
+from blivetgui.communication.stats import RequestStats
+from blivetgui.communication.jobs import JobManager, JOB_FINISHED
+from blivetgui.communication.monitor import DeviceMonitor, LocalEventSource
 from blivetgui.communication.proxy_utils import ProxyID, ProxyDataContainer
 
 from blivet.size import Size
@@ -11,56 +17,423 @@ from blivet.size import Size
 
 class BlivetUtilsServerTest(unittest.TestCase):
 
-    def test_pickle_answer(self):
+    def test_encode_answer(self):
         # string
         msg = "abcdef"
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(), msg)
-        self.assertEqual(msg, pickle.loads(pickled_msg))
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(), msg)
+        self.assertEqual(msg, protocol.decode(*encoded_msg))
 
         # None
         msg = None
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(), msg)
-        self.assertEqual(msg, pickle.loads(pickled_msg))
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(), msg)
+        self.assertEqual(msg, protocol.decode(*encoded_msg))
 
         # blivet.size.Size
         msg = Size("8 GiB")
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(), msg)
-        self.assertEqual(msg, pickle.loads(pickled_msg))
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(), msg)
+        self.assertEqual(msg, protocol.decode(*encoded_msg))
 
         # list of multiple types
         msg = ["abcdef", 1, 1.01, True]
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(), msg)
-        self.assertEqual(msg, pickle.loads(pickled_msg))
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(), msg)
+        self.assertEqual(msg, protocol.decode(*encoded_msg))
 
         # BlivetProxyObject
         msg = BlivetProxyObject(MagicMock(), ProxyID())
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(), msg)
-        # BlivetProxyObject is not pickled, instead of it we pickle its id (ProxyID object)
-        # we compare the id (int) of this id (ProxyID) with id of unpickled object
-        self.assertEqual(msg.id.id, pickle.loads(pickled_msg).id)
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(), msg)
+        # BlivetProxyObject is not pickled, instead of it we send its id (ProxyID object)
+        # we compare the id (int) of this id (ProxyID) with id of decoded object
+        self.assertEqual(msg.id.id, protocol.decode(*encoded_msg).id)
 
         # unpicklable object
         test_dict = {}
 
         msg = MagicMock()  # MagicMock is definitely not in picklable_types
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(object_dict=test_dict), msg)
-        unpickled_msg = pickle.loads(pickled_msg)
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(object_dict=test_dict, proxy_ids=weakref.WeakValueDictionary()), msg)
+        unencoded_msg = protocol.decode(*encoded_msg)
         # unpicklable objects are not pickled, instead a BlivetProxyObject is created
         # and its ProxyID is pickled; test we really have a ProxyID object and test
         # that original object was placed in the dict with proxied-object
-        self.assertTrue(isinstance(unpickled_msg, ProxyID))
-        self.assertEqual(test_dict[unpickled_msg.id].blivet_object, msg)
+        self.assertTrue(isinstance(unencoded_msg, ProxyID))
+        self.assertEqual(test_dict[unencoded_msg.id].blivet_object, msg)
 
         # unpicklable objects in list
         test_dict = {}
 
         msg = [MagicMock(), "abcdef"]
-        pickled_msg = BlivetUtilsServer._pickle_answer(MagicMock(object_dict=test_dict), msg)
-        unpickled_msg = pickle.loads(pickled_msg)
-        self.assertTrue(isinstance(unpickled_msg, list))
-        self.assertTrue(isinstance(unpickled_msg[0], ProxyID))
-        self.assertEqual(test_dict[unpickled_msg[0].id].blivet_object, msg[0])
-        self.assertEqual(unpickled_msg[1], msg[1])
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(object_dict=test_dict, proxy_ids=weakref.WeakValueDictionary()), msg)
+        unencoded_msg = protocol.decode(*encoded_msg)
+        self.assertTrue(isinstance(unencoded_msg, list))
+        self.assertTrue(isinstance(unencoded_msg[0], ProxyID))
+        self.assertEqual(test_dict[unencoded_msg[0].id].blivet_object, msg[0])
+        self.assertEqual(unencoded_msg[1], msg[1])
+
+        # ProxyDataContainer and dict are sent by value, only unpicklable members are proxied
+        test_dict = {}
+
+        msg = ProxyDataContainer(success=True, answer=[MagicMock(), None], info={1: "abcdef"})
+        encoded_msg = BlivetUtilsServer._encode_answer(MagicMock(object_dict=test_dict, proxy_ids=weakref.WeakValueDictionary()), msg)
+        unencoded_msg = protocol.decode(*encoded_msg)
+        self.assertTrue(isinstance(unencoded_msg, ProxyDataContainer))
+        self.assertTrue(unencoded_msg.success)
+        self.assertTrue(isinstance(unencoded_msg.answer[0], ProxyID))
+        self.assertEqual(test_dict[unencoded_msg.answer[0].id].blivet_object, msg.answer[0])
+        self.assertIsNone(unencoded_msg.answer[1])
+        self.assertEqual(unencoded_msg.info, {1: "abcdef"})
+
+    def test_encode_answer_same_object(self):
+        server_mock = MagicMock(object_dict={}, proxy_ids=weakref.WeakValueDictionary())
+        disk = MagicMock()
+
+        # the same object is always sent with the same ProxyID
+        first = protocol.decode(*BlivetUtilsServer._encode_answer(server_mock, disk))
+        second = protocol.decode(*BlivetUtilsServer._encode_answer(server_mock, [disk, MagicMock()]))
+        self.assertEqual(first.id, second[0].id)
+        self.assertNotEqual(second[0].id, second[1].id)
+        self.assertEqual(server_mock.object_dict[first.id].refs, 2)
+        self.assertEqual(len(server_mock.object_dict), 2)
+
+        # released object gets a new ID next time
+        server_mock.released_count = 0
+        BlivetUtilsServer._release_objects(server_mock, ("release", [(first.id, 2)]))
+        self.assertNotIn(first.id, server_mock.object_dict)
+        third = protocol.decode(*BlivetUtilsServer._encode_answer(server_mock, disk))
+        self.assertNotEqual(first.id, third.id)
+        self.assertEqual(server_mock.object_dict[third.id].blivet_object, disk)
+
+    def test_release_objects(self):
+        obj1 = BlivetProxyObject(MagicMock(), ProxyID())
+        obj1.refs = 1
+        obj2 = BlivetProxyObject(MagicMock(), ProxyID())
+        obj2.refs = 2
+        server_mock = MagicMock(object_dict={obj1.id.id: obj1, obj2.id.id: obj2}, released_count=0)
+
+        # obj2 was sent to the client again after it released it
+        BlivetUtilsServer._release_objects(server_mock, ("release", [(obj1.id.id, 1), (obj2.id.id, 1), (-1, 1)]))
+        self.assertEqual(server_mock.object_dict, {obj2.id.id: obj2})
+        self.assertEqual(obj2.refs, 1)
+        self.assertEqual(server_mock.released_count, 1)
+        server_mock._send.assert_not_called()
+
+        BlivetUtilsServer._release_objects(server_mock, ("release", [(obj2.id.id, 1)]))
+        self.assertEqual(server_mock.object_dict, {})
+        self.assertEqual(server_mock.released_count, 2)
+
+    def test_get_items(self):
+        class Members:
+            def __init__(self, items):
+                self.items = items
+
+            def __len__(self):
+                return len(self.items)
+
+            def __iter__(self):
+                return iter(self.items)
+
+        member = MagicMock()
+        server_mock = MagicMock()
+
+        # bounded sequence -- all members at once
+        server_mock._get_proxy_object.return_value = BlivetProxyObject(Members([member, "abcdef"]), ProxyID())
+        BlivetUtilsServer._get_items(server_mock, ("materialize", ProxyID()))
+        server_mock._encode_answer.assert_called_once_with([member, "abcdef"])
+
+        # iterator (or generator) -- must be iterated remotely
+        server_mock.reset_mock()
+        server_mock._get_proxy_object.return_value = BlivetProxyObject(iter([member]), ProxyID())
+        BlivetUtilsServer._get_items(server_mock, ("materialize", ProxyID()))
+        server_mock._encode_answer.assert_called_once_with(None)
+
+    def test_generation(self):
+        # not initialized yet
+        self.assertEqual(BlivetUtilsServer._generation(MagicMock(blivet_utils=None)), 0)
+
+        # devicetree changes and calls of proxy object methods
+        server_mock = MagicMock(blivet_utils=MagicMock(generation=3), proxy_changes=0)
+        proxy_object = BlivetProxyObject(MagicMock(), ProxyID())
+        server_mock._get_proxy_object.return_value = proxy_object
+        server_mock._args_convert_to_objects.return_value = []
+        server_mock._kwargs_convert_to_objects.return_value = {}
+
+        BlivetUtilsServer._call_method(server_mock, ("method", proxy_object.id, "__str__", (), {}))
+        self.assertEqual(BlivetUtilsServer._generation(server_mock), 3)
+        BlivetUtilsServer._call_method(server_mock, ("method", proxy_object.id, "__setattr__", ("name", "sdb"), {}))
+        self.assertEqual(BlivetUtilsServer._generation(server_mock), 4)
+
+    def test_blivet_utils_init(self):
+        server_mock = MagicMock(blivet_utils=None, server=MagicMock(other_running=False))
+        server_mock._args_convert_to_objects.side_effect = lambda args: args
+
+        def _blivet_utils(*_args, progress_report_hook):
+            progress_report_hook("Scanning storage configuration...")
+            return MagicMock()
+
+        # progress is reported before the result
+        with patch("blivetgui.communication.server.BlivetUtils", side_effect=_blivet_utils) as utils:
+            BlivetUtilsServer._blivet_utils_init(server_mock, ("init", ([], ["sda"], {}, "startup")))
+        utils.assert_called_once_with([], ["sda"], {}, "startup", progress_report_hook=server_mock._progress_report_hook)
+        server_mock._progress_report_hook.assert_called_once_with("Scanning storage configuration...")
+        finished, answer = server_mock._encode_answer.call_args[0][0]
+        self.assertTrue(finished)
+        self.assertTrue(answer.success)
+
+    def test_blivet_utils_init_scan_cache(self):
+        server_mock = MagicMock(blivet_utils=None, server=MagicMock(other_running=False))
+        server_mock._args_convert_to_objects.side_effect = lambda args: args
+        server_mock._update_scan_cache.return_value = ProxyDataContainer(added=["sdb"], removed=[], changed=[])
+
+        cached = ProxyDataContainer(snapshot=MagicMock(), outdated=True, exact=False)
+
+        # cached snapshot is sent before scanning, differences with the result
+        with patch("blivetgui.communication.server.BlivetUtils"), \
+             patch("blivetgui.communication.server.ScanCache") as cache:
+            cache.return_value.load.return_value = cached
+            BlivetUtilsServer._blivet_utils_init(server_mock, ("init", ([], [], {}, "startup"), True))
+
+        self.assertEqual(server_mock._encode_answer.call_args_list[0][0][0], (False, cached))
+        server_mock._update_scan_cache.assert_called_once_with(cache.return_value, cached)
+        finished, answer = server_mock._encode_answer.call_args[0][0]
+        self.assertTrue(finished)
+        self.assertEqual(answer.cache_mismatch.added, ["sdb"])
+
+        # no cache requested
+        server_mock = MagicMock(blivet_utils=None, server=MagicMock(other_running=False))
+        server_mock._args_convert_to_objects.side_effect = lambda args: args
+        with patch("blivetgui.communication.server.BlivetUtils"), \
+             patch("blivetgui.communication.server.ScanCache") as cache:
+            BlivetUtilsServer._blivet_utils_init(server_mock, ("init", ([], [], {}, "startup")))
+        cache.assert_not_called()
+        _finished, answer = server_mock._encode_answer.call_args[0][0]
+        self.assertIsNone(answer.cache_mismatch)
+
+    def test_recv_msg(self):
+        sock1, sock2 = socket.socketpair()
+        server_mock = MagicMock(request=sock2, recv_buffer=protocol.ReceiveBuffer())
+
+        protocol.send_message(sock1, 42, protocol.encode(("call", "method", [])))
+        self.assertEqual(BlivetUtilsServer._recv_msg(server_mock), ("call", "method", []))
+        self.assertEqual(server_mock.request_id, 42)
+
+        # message we can't decode -- connection is closed
+        sock1.sendall(protocol.HEADER.pack(protocol.PROTOCOL_VERSION, 127, 0, 43, 0))
+        self.assertIsNone(BlivetUtilsServer._recv_msg(server_mock))
+
+        sock1.close()
+        sock2.close()
+
+    def test_cancel_requested(self):
+        sock1, sock2 = socket.socketpair()
+        server_mock = MagicMock(request=sock2, recv_buffer=protocol.ReceiveBuffer(), request_id=1,
+                                deferred_requests=[])
+        server_mock._recv_msg.side_effect = lambda: BlivetUtilsServer._recv_msg(server_mock)
+
+        # nothing received
+        self.assertFalse(BlivetUtilsServer._cancel_requested(server_mock))
+
+        # other requests are deferred, request ID of blivet_do_it is kept
+        protocol.send_message(sock1, 2, protocol.encode(("key", 5, "name")))
+        protocol.send_message(sock1, 0, protocol.encode(("cancel",)))
+        self.assertTrue(BlivetUtilsServer._cancel_requested(server_mock))
+        self.assertEqual(server_mock.deferred_requests, [(2, ("key", 5, "name"))])
+        self.assertEqual(server_mock.request_id, 1)
+
+        # client disconnected
+        sock1.close()
+        self.assertTrue(BlivetUtilsServer._cancel_requested(server_mock))
+        self.assertEqual(server_mock.deferred_requests[-1], (0, None))
+
+        sock2.close()
+
+    def test_request_stats(self):
+        stats = RequestStats(profile_method="get_disks")
+        server_mock = MagicMock(request_stats=stats, received_size=10)
+
+        def _handle_msg(_msg):
+            server_mock.encode_time += 0.5
+            server_mock.sent_size += 100
+
+        server_mock._handle_msg.side_effect = _handle_msg
+
+        # requests are grouped by type and method/attribute name
+        BlivetUtilsServer._handle_msg_with_stats(server_mock, ("call", "get_disks", []))
+        BlivetUtilsServer._handle_msg_with_stats(server_mock, ("call", "get_disks", []))
+        BlivetUtilsServer._handle_msg_with_stats(server_mock, ("param", ProxyID(), "name"))
+        BlivetUtilsServer._handle_msg_with_stats(server_mock, ("next", ProxyID()))
+
+        summary = stats.summary()
+        self.assertCountEqual(summary.keys(), ["call:get_disks", "param:name", "next"])
+        self.assertEqual(summary["call:get_disks"].count, 2)
+        self.assertEqual(summary["call:get_disks"].received, 20)
+        self.assertEqual(summary["call:get_disks"].sent, 200)
+        self.assertEqual(summary["call:get_disks"].encode, 1.0)
+        self.assertLessEqual(summary["call:get_disks"].p50, summary["call:get_disks"].p99)
+
+        # only the selected method is profiled
+        report = stats.report()
+        self.assertIn("call:get_disks", report)
+        self.assertIn("Profile of 'get_disks'", report)
+
+        # statistics are not collected by default
+        server_mock = MagicMock(request_stats=None)
+        BlivetUtilsServer._get_request_stats(server_mock, ("stats",))
+        server_mock._encode_answer.assert_called_once_with(None)
+
+    def test_job_stats(self):
+        stats = RequestStats(profile_method="blivet_reset")
+        server_mock = MagicMock(request_stats=stats)
+        server_mock._run_job_method.side_effect = lambda job: BlivetUtilsServer._run_job_method(server_mock, job)
+
+        # jobs are timed and profiled in the worker thread
+        manager = JobManager(lambda job: BlivetUtilsServer._run_job(server_mock, job))
+        job = manager.start("blivet_reset", [])
+        self.assertTrue(select.select([manager], [], [], 5)[0])
+        manager.take_finished()
+        manager.stop()
+
+        self.assertTrue(job.result.success)
+        server_mock.blivet_utils.blivet_reset.assert_called_once_with()
+
+        summary = stats.summary()
+        self.assertEqual(list(summary.keys()), ["job:blivet_reset"])
+        self.assertEqual(summary["job:blivet_reset"].count, 1)
+
+        report = stats.report()
+        self.assertIn("Profile of 'blivet_reset'", report)
+        self.assertNotIn("No calls of 'blivet_reset' were profiled", report)
+
+    def test_device_events(self):
+        source = LocalEventSource()
+        monitor = DeviceMonitor(source=source, delay=0)
+
+        def _apply_device_events(_events):
+            # the update causes more udev events
+            source.inject("change", "sdb")
+            return True
+
+        blivet_utils = MagicMock()
+        blivet_utils.apply_device_events.side_effect = _apply_device_events
+        server_mock = MagicMock(device_monitor=monitor, blivet_utils=blivet_utils,
+                                request_id=3, watch_request_id=1)
+
+        def _send(_data):
+            self.assertEqual(server_mock.request_id, 1)
+
+        server_mock._send.side_effect = _send
+
+        with patch("blivetgui.communication.monitor.udev.device_get_name", side_effect=lambda info: info["name"]), \
+             patch("blivetgui.communication.monitor.udev.device_to_dict", side_effect=lambda dev: {"name": dev.sys_name}), \
+             patch("blivetgui.communication.server.udev.settle"):
+            source.inject("add", "sdb")
+            source.inject("bind", "sdb")
+            source.inject("change", "sda1")
+            monitor.receive()
+            self.assertEqual(monitor.timeout(), 0)
+
+            BlivetUtilsServer._apply_device_events(server_mock)
+
+            # events caused by the update are dropped
+            monitor.receive()
+            self.assertEqual(monitor.events, [])
+
+        source.close()
+
+        # "bind" doesn't change the devicetree
+        blivet_utils.apply_device_events.assert_called_once_with([("add", "sdb"), ("change", "sda1")])
+
+        # notification is sent with ID of the "watch" request
+        server_mock._send.assert_called_once()
+        answer = server_mock._encode_answer.call_args[0][0]
+        self.assertTrue(answer.applied)
+        self.assertIsNone(answer.exception)
+        self.assertEqual(server_mock.request_id, 3)
+        self.assertIsNone(monitor.timeout())
+
+    def test_jobs(self):
+        server_mock = MagicMock(request_id=1, device_monitor=None, deferred_requests=[], job_deferred_requests=[],
+                                exclusive_job_methods=BlivetUtilsServer.exclusive_job_methods, request_stats=None)
+        server_mock._args_convert_to_objects.side_effect = lambda args: args
+        server_mock._run_job.side_effect = lambda job: BlivetUtilsServer._run_job(server_mock, job)
+        server_mock._run_job_method.side_effect = lambda job: BlivetUtilsServer._run_job_method(server_mock, job)
+        server_mock._send_job_result.side_effect = lambda job: BlivetUtilsServer._send_job_result(server_mock, job)
+        server_mock.jobs = JobManager(server_mock._run_job)
+        server_mock.blivet_utils.blivet_reset.return_value = None
+
+        sent = []
+        server_mock._send.side_effect = lambda _data: sent.append((server_mock.request_id, server_mock._encode_answer.call_args[0][0]))
+
+        # the job ID is sent right away
+        BlivetUtilsServer._job_start(server_mock, ("job_start", "blivet_reset", []))
+        job_id = sent[-1][1]
+        self.assertTrue(server_mock.jobs.exclusive_active)
+
+        # the result is sent with ID of the "job_result" request when the job finishes
+        server_mock.request_id = 2
+        BlivetUtilsServer._job_result(server_mock, ("job_result", job_id))
+
+        # requests deferred while the job was running are processed after it finishes
+        server_mock.job_deferred_requests.append((3, ("call", "get_disks", [])))
+
+        self.assertTrue(select.select([server_mock.jobs], [], [], 5)[0])
+        BlivetUtilsServer._finish_jobs(server_mock)
+        server_mock.blivet_utils.blivet_reset.assert_called_once_with()
+
+        request_id, answer = sent[-1]
+        self.assertEqual(request_id, 2)
+        self.assertTrue(answer.success)
+        self.assertEqual(server_mock.request_id, 2)
+        self.assertEqual(server_mock.deferred_requests, [(3, ("call", "get_disks", []))])
+        self.assertFalse(server_mock.jobs.exclusive_active)
+
+        # the job is forgotten after its result was sent
+        server_mock.request_id = 4
+        BlivetUtilsServer._job_status(server_mock, ("job_status", job_id))
+        self.assertIsInstance(sent[-1][1], KeyError)
+
+        # blivet_do_it gets progress hook and cancel check from the job
+        def _do_it(progress_report_hook, cancel_check, parallel):
+            progress_report_hook("event")
+            return (True, ProxyDataContainer(success=True, cancelled=cancel_check(), parallel=parallel))
+
+        server_mock.blivet_utils.blivet_do_it.side_effect = _do_it
+        BlivetUtilsServer._job_start(server_mock, ("job_start", "blivet_do_it", [True]))
+        job_id = sent[-1][1]
+
+        self.assertTrue(select.select([server_mock.jobs], [], [], 5)[0])
+        BlivetUtilsServer._finish_jobs(server_mock)
+
+        server_mock.request_id = 5
+        BlivetUtilsServer._job_status(server_mock, ("job_status", job_id))
+        self.assertEqual(sent[-1][1].state, JOB_FINISHED)
+        self.assertEqual(sent[-1][1].progress, ["event"])
+
+        # result of an already finished job is sent right away
+        server_mock.request_id = 6
+        BlivetUtilsServer._job_result(server_mock, ("job_result", job_id))
+        request_id, answer = sent[-1]
+        self.assertEqual(request_id, 6)
+        self.assertTrue(answer.answer.parallel)
+        self.assertFalse(answer.answer.cancelled)
+
+        # size info isn't updated by other requests while device_resizable runs
+        BlivetUtilsServer._job_start(server_mock, ("job_start", "device_resizable", [MagicMock()]))
+        self.assertTrue(server_mock.jobs.exclusive_active)
+
+        server_mock.jobs.stop()
+
+    def test_get_params(self):
+        blivet_object = MagicMock(name="sda1", format=MagicMock(type="ext4"))
+        blivet_object.configure_mock(name="sda1")
+        del blivet_object.non_existing  # mock non-existing attribute
+        proxy_id = ProxyID()
+
+        server_mock = MagicMock(_get_proxy_object=lambda _id: BlivetProxyObject(blivet_object, proxy_id))
+        BlivetUtilsServer._get_params(server_mock, ("params", proxy_id, ["name", "format.type", "non_existing"]))
+
+        answer = server_mock._encode_answer.call_args[0][0]
+        self.assertEqual(answer[0], "sda1")
+        self.assertEqual(answer[1], "ext4")
+        self.assertTrue(isinstance(answer[2], AttributeError))
+        server_mock._send.assert_called_once_with(server_mock._encode_answer.return_value)
 
     def test_convert_args(self):
         # 'normal' arguments
@@ -94,6 +467,15 @@ class BlivetUtilsServerTest(unittest.TestCase):
         self.assertEqual(converted_args[0]["data2"], 1)
         self.assertEqual(converted_args[0]["data3"], arg3_obj.blivet_object)
 
+        # dict as an argument (and in a ProxyDataContainer)
+        server_mock = MagicMock(object_dict=test_dict)
+        server_mock._args_convert_to_objects.side_effect = lambda a: BlivetUtilsServer._args_convert_to_objects(server_mock, a)
+
+        args = [{"a": arg3, "b": "abcdef"}, ProxyDataContainer(data={1: arg3})]
+        converted_args = BlivetUtilsServer._args_convert_to_objects(server_mock, args)
+        self.assertEqual(converted_args[0], {"a": arg3_obj.blivet_object, "b": "abcdef"})
+        self.assertEqual(converted_args[1].data, {1: arg3_obj.blivet_object})
+
     def test_convert_kwargs(self):
         test_dict = {}
 
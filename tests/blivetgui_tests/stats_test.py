@@ -0,0 +1,46 @@
+import unittest
+
+from blivetgui.communication.stats import DurationHistogram, RequestStats, BUCKET_BOUNDS
+
+
+class DurationHistogramTest(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = DurationHistogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+        for _i in range(98):
+            histogram.add(0.001)
+        histogram.add(0.5)
+        histogram.add(5000)  # longer than the last bucket
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.total, 5000.598)
+        self.assertEqual(histogram.max, 5000)
+
+        # percentiles are upper bounds of the buckets, at most 20 % more than the duration
+        self.assertGreaterEqual(histogram.percentile(50), 0.001)
+        self.assertLessEqual(histogram.percentile(50), 0.0012)
+        self.assertGreaterEqual(histogram.percentile(99), 0.5)
+        self.assertLessEqual(histogram.percentile(99), 0.6)
+        self.assertEqual(histogram.percentile(100), 5000)
+
+        # memory doesn't grow with the number of durations
+        self.assertEqual(len(histogram.buckets), len(BUCKET_BOUNDS) + 1)
+
+    def test_summary(self):
+        stats = RequestStats()
+        for _i in range(1000):
+            stats.record("call:get_disks", 0.01)
+        stats.record("call:get_disks", 0.002)
+
+        summary = stats.summary()["call:get_disks"]
+        self.assertEqual(summary.count, 1001)
+        self.assertAlmostEqual(summary.total, 10.002)
+        self.assertLessEqual(summary.p50, summary.p99)
+        self.assertLessEqual(summary.p99, summary.max)
+        self.assertEqual(summary.max, 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
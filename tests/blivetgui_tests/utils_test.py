@@ -1,10 +1,18 @@
+import copy
+import functools
+import logging
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
-from blivetgui.blivet_utils import BlivetUtils, FreeSpaceDevice
+from blivetgui.blivet_utils import BlivetUtils, FreeSpaceDevice, DeferredTask, devicetree_change
 from blivetgui.i18n import _
+from blivetgui.logs import ProgramTimer
 
 from blivet.size import Size
+from blivet.errors import FSError, LUKSError
+from blivet.formats.fs import Ext4FS
 from blivet.formats.fslib import FSResize
 
 
@@ -66,6 +74,455 @@ class FreeSpaceDeviceTest(unittest.TestCase):
 
 class BlivetUtilsTest(unittest.TestCase):
 
+    def test_device_snapshot(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        disk = MagicMock(id=1, size=Size("8 GiB"), is_disk=True, parents=[], format=MagicMock(type="disklabel"))
+        disk.configure_mock(name="sda", type="disk")
+        part = MagicMock(id=2, size=Size("1 GiB"), is_disk=False, parents=[disk], children=[],
+                         format=MagicMock(type="ext4", label="root"))
+        part.configure_mock(name="sda1", type="partition")
+        disk.children = [part]
+
+        storage.storage = MagicMock(devices=[disk, part], disks=[disk], vgs=[], mdarrays=[],
+                                    btrfs_volumes=[], stratis_pools=[])
+
+        snapshot = storage.get_device_snapshot()
+        self.assertEqual(snapshot.disks, [1])
+        self.assertEqual(snapshot.lvm + snapshot.raid + snapshot.btrfs + snapshot.stratis, [])
+        self.assertEqual(snapshot.devices[1].name, "sda")
+        self.assertEqual(snapshot.devices[1].children, [2])
+        self.assertEqual(snapshot.devices[2].type, "partition")
+        self.assertEqual(snapshot.devices[2].size, Size("1 GiB"))
+        self.assertEqual(snapshot.devices[2].format_type, "ext4")
+        self.assertEqual(snapshot.devices[2].format_label, "root")
+        self.assertEqual(snapshot.devices[2].parents, [1])
+
+    def test_device_changes(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        disk = MagicMock(id=1, size=Size("8 GiB"), is_disk=True, parents=[], children=[],
+                         format=MagicMock(type="disklabel"))
+        disk.configure_mock(name="sda", type="disk")
+        storage.storage = MagicMock(devices=[disk])
+
+        # first call -- everything is new
+        changes = storage.get_device_changes(None)
+        self.assertTrue(changes.full)
+        generation = changes.generation
+
+        # nothing changed
+        changes = storage.get_device_changes(generation)
+        self.assertFalse(changes.full)
+        self.assertEqual(changes.generation, generation)
+        self.assertEqual(changes.added + changes.removed + changes.modified, [])
+
+        # new partition
+        part = MagicMock(id=2, size=Size("1 GiB"), is_disk=False, parents=[disk], children=[],
+                         format=MagicMock(type="ext4", label="root"))
+        part.configure_mock(name="sda1", type="partition")
+        disk.children = [part]
+        storage.storage.devices = [disk, part]
+
+        changes = storage.get_device_changes(generation)
+        self.assertFalse(changes.full)
+        self.assertGreater(changes.generation, generation)
+        self.assertEqual([r.id for r in changes.added], [2])
+        self.assertEqual([r.id for r in changes.modified], [1])
+        self.assertEqual(changes.changed[1], ["children"])
+
+        # relabel the partition -- only the label changed since the last generation
+        part.format.label = "data"
+        changes2 = storage.get_device_changes(changes.generation)
+        self.assertEqual(changes2.added, [])
+        self.assertEqual([r.id for r in changes2.modified], [2])
+        self.assertEqual(changes2.changed[2], ["format_label"])
+        self.assertEqual(changes2.modified[0].format_label, "data")
+
+        # remove the partition -- added and removed since the first generation cancel out
+        disk.children = []
+        storage.storage.devices = [disk]
+        changes3 = storage.get_device_changes(generation)
+        self.assertEqual(changes3.added + changes3.removed, [])
+        self.assertEqual([r.id for r in changes3.modified], [1])
+        changes3 = storage.get_device_changes(changes2.generation)
+        self.assertEqual(changes3.removed, [2])
+        self.assertEqual([r.id for r in changes3.modified], [1])
+
+        # unknown generation or reset -- full reload
+        self.assertTrue(storage.get_device_changes(-1).full)
+        storage.blivet_reset()
+        self.assertTrue(storage.get_device_changes(changes3.generation).full)
+
+    def test_free_regions_cache(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        disk1 = MagicMock(id=1)
+        disk2 = MagicMock(id=2)
+
+        with patch("blivetgui.blivet_utils.blivet.partitioning.get_free_regions") as get_free_regions:
+            get_free_regions.side_effect = lambda disks, align: [disks[0].id]
+
+            # computed only once per disk
+            self.assertEqual(storage._get_free_regions(disk1), [1])
+            self.assertEqual(storage._get_free_regions(disk1), [1])
+            self.assertEqual(storage._get_free_regions(disk2), [2])
+            self.assertEqual(get_free_regions.call_count, 2)
+
+            # changes not touching partitions don't invalidate the cache
+            devicetree_change()(lambda _self: None)(storage)
+            self.assertEqual(storage._get_free_regions(disk1), [1])
+            self.assertEqual(get_free_regions.call_count, 2)
+
+            # ...but changes of partitions (and reset) do
+            devicetree_change(partitions=True)(lambda _self: None)(storage)
+            self.assertEqual(storage._get_free_regions(disk1), [1])
+            self.assertEqual(get_free_regions.call_count, 3)
+
+            devicetree_change(full=True)(lambda _self: None)(storage)
+            self.assertEqual(storage._get_free_regions(disk2), [2])
+            self.assertEqual(get_free_regions.call_count, 4)
+
+    def test_update_min_sizes_info(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        def _device(dev_id, duration=0, dev_type="partition", system_mountpoint=None):
+            fmt = MagicMock(type="ext4", system_mountpoint=system_mountpoint)
+            fmt.update_size_info.side_effect = lambda: time.sleep(duration)
+            device = MagicMock(id=dev_id, type=dev_type, format=fmt)
+            device.configure_mock(name="dev%d" % dev_id)
+            return device
+
+        # all devices are processed in parallel
+        devices = [_device(i, 0.2) for i in range(4)] + [_device(4, dev_type="disk"), _device(5, system_mountpoint="/")]
+        storage.storage = MagicMock(devices=devices)
+        progress = MagicMock()
+        with patch("blivetgui.blivet_utils.config", MagicMock(size_info_workers=4, size_info_timeout=10)):
+            start = time.monotonic()
+            storage._update_min_sizes_info(progress)
+            self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(progress.call_count, 4)
+        for device in devices[:4]:
+            device.format.update_size_info.assert_called_once()
+        for device in devices[4:]:
+            device.format.update_size_info.assert_not_called()
+
+        # we don't wait for devices that take too long
+        devices = [_device(0, 5), _device(1), _device(2)]
+        storage.storage = MagicMock(devices=devices)
+        with patch("blivetgui.blivet_utils.config", MagicMock(size_info_workers=2, size_info_timeout=0.2)):
+            start = time.monotonic()
+            storage._update_min_sizes_info()
+            self.assertLess(time.monotonic() - start, 1)
+        for device in devices:
+            device.format.update_size_info.assert_called_once()
+
+        # blivet runs methods of the formats under its global lock, it isn't held
+        # while the tools run, so the devices are really processed at once
+        blivet_lock = threading.RLock()
+        barrier = threading.Barrier(3, timeout=2)
+        locked = []
+
+        def _exclusive(method):
+            @functools.wraps(method)
+            def run_with_lock(*args, **kwargs):
+                with blivet_lock:
+                    locked.append(args[0].id)
+                    return method(*args, **kwargs)
+            return run_with_lock
+
+        class _Format:
+            type = "ext4"
+            system_mountpoint = None
+
+            def __init__(self, fmt_id):
+                self.id = fmt_id
+                self.updated = False
+
+            @_exclusive
+            def update_size_info(self):
+                if self.id < 200:
+                    barrier.wait()
+                self.updated = True
+
+        devices = [MagicMock(id=i, type="partition", format=_Format(100 + i)) for i in range(3)]
+        storage.storage = MagicMock(devices=devices)
+        with patch("blivetgui.blivet_utils.config", MagicMock(size_info_workers=3, size_info_timeout=5)):
+            storage._update_min_sizes_info()
+        self.assertTrue(all(device.format.updated for device in devices))
+        self.assertEqual(locked, [])
+
+        # other callers still take the lock
+        fmt = _Format(200)
+        storage._update_size_info(fmt)
+        self.assertTrue(fmt.updated)
+        self.assertEqual(locked, [200])
+
+    def test_update_next_size_info(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True), \
+             patch("blivetgui.blivet_utils.BlivetUtils._update_min_sizes_info") as update:
+            storage = BlivetUtils(size_info_mode="lazy")
+            update.assert_not_called()
+
+        devices = [MagicMock(type="partition", format=MagicMock(id=i, type="ext4", system_mountpoint=None)) for i in range(3)]
+        devices[1].format.update_size_info.side_effect = FSError("error")
+        storage.storage = MagicMock(devices=devices)
+
+        # one device at a time, failed devices are not tried again
+        self.assertTrue(storage.update_next_size_info())
+        self.assertTrue(storage.update_next_size_info())
+        self.assertFalse(storage.update_next_size_info())
+        self.assertFalse(storage.update_next_size_info())
+        for device in devices:
+            device.format.update_size_info.assert_called_once()
+
+        # device_resizable tries the failed device again
+        storage._resizable_filesystems = ["ext4"]
+        for device in devices:
+            device.configure_mock(protected=False, format_immutable=False, children=[])
+
+        resizable = storage.device_resizable(devices[1])
+        self.assertFalse(resizable.resizable)
+        self.assertEqual(devices[1].format.update_size_info.call_count, 2)
+
+        devices[1].format.update_size_info.side_effect = None
+        storage.device_resizable(devices[1])
+        self.assertEqual(devices[1].format.update_size_info.call_count, 3)
+        self.assertIn(devices[1].format.id, storage._size_info_updated)
+
+        # but successful devices are not updated again
+        storage.device_resizable(devices[0])
+        devices[0].format.update_size_info.assert_called_once()
+
+        # size information is already known -- not updated again...
+        storage._update_size_info(devices[0].format)
+        devices[0].format.update_size_info.assert_called_once()
+
+        # ...until the devicetree changes
+        devicetree_change(full=True)(lambda _self: None)(storage)
+        storage._update_size_info(devices[0].format)
+        self.assertEqual(devices[0].format.update_size_info.call_count, 2)
+
+    def test_unlock_devices(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils(size_info_mode="lazy")
+
+        def _device(name, fmt_type=None):
+            device = MagicMock(format=MagicMock(type=fmt_type))
+            device.configure_mock(name=name)
+            return device
+
+        luks1 = _device("sda1", "luks")
+        luks2 = _device("sdb1", "luks")
+        luks2.format.setup.side_effect = LUKSError("wrong passphrase")
+        storage.storage = MagicMock()
+        storage.storage.devicetree.devices = [_device("sda"), luks1, _device("sdb"), luks2]
+        storage.storage.devicetree._hidden = [_device("sdc")]
+
+        # udev "device" is just its name, the mapping and VG on it appear one by one
+        udev_devices = [["sda", "sda1", "sdb", "sdb1", "sdc", "luks-sda1"],
+                        ["sda", "sda1", "sdb", "sdb1", "sdc", "luks-sda1", "vg-lv"]]
+
+        with patch("blivetgui.blivet_utils.blivet.udev.settle"), \
+             patch("blivetgui.blivet_utils.blivet.udev.get_devices", side_effect=lambda: udev_devices[min(1, handle.call_count)]), \
+             patch("blivetgui.blivet_utils.blivet.udev.device_get_name", side_effect=lambda info: info), \
+             patch("blivetgui.blivet_utils.parted"), \
+             patch("blivetgui.blivet_utils.lvm.lvm_dbusd_refresh") as lvm_refresh, \
+             patch.object(storage.storage.devicetree, "handle_device") as handle:
+            # devices are unlocked first and only the new ones are scanned
+            self.assertEqual(storage.unlock_devices([(luks1, "aaaa"), (luks2, "bbbb")]), [True, False])
+
+        self.assertEqual(luks1.format.passphrase, "aaaa")
+        self.assertEqual([call[0][0] for call in handle.call_args_list], ["luks-sda1", "vg-lv"])
+        storage.storage.devicetree.populate.assert_not_called()
+
+        # same steps as after a full scan -- ignored disks are hidden
+        lvm_refresh.assert_called_once_with()
+        storage.storage.devicetree._handle_inconsistencies.assert_called_once_with()
+        storage.storage.devicetree._hide_ignored_disks.assert_called_once_with()
+
+        # nothing unlocked -- no scan
+        storage.storage.devicetree.drop_device_info_cache.reset_mock()
+        self.assertEqual(storage.unlock_devices([(luks2, "bbbb")]), [False])
+        storage.storage.devicetree.drop_device_info_cache.assert_not_called()
+
+    def test_rescan_devices(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils(size_info_mode="lazy")
+
+        def _device(name, disk=None):
+            device = MagicMock()
+            device.configure_mock(name=name)
+            device.depends_on.side_effect = lambda dep: dep is disk
+            return device
+
+        sda = _device("sda")
+        sdb = _device("sdb")
+        actions = [MagicMock(device=sda), MagicMock(device=_device("sda1", sda)), MagicMock(device=_device("sdb1", sdb))]
+
+        storage.storage = MagicMock(disks=[sda, sdb])
+        devicetree = storage.storage.devicetree
+        devicetree.actions.find.return_value = actions
+
+        with patch("blivetgui.blivet_utils.BlivetUtils._populate_new_devices") as populate:
+            cancelled = storage.rescan_devices(["sda", "sdc"])
+
+        # only actions on the selected disk are cancelled (in reverse order)
+        self.assertEqual(cancelled, actions[:2])
+        self.assertEqual([call[0][0] for call in devicetree.actions.remove.call_args_list], [actions[1], actions[0]])
+
+        # only the selected disk is removed and scanned again
+        devicetree.recursive_remove.assert_called_once_with(sda, actions=False)
+        devicetree._remove_device.assert_called_once_with(sda)
+        populate.assert_called_once()
+        devicetree.populate.assert_not_called()
+        storage.storage.reset.assert_not_called()
+
+    def test_apply_device_events(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils(size_info_mode="lazy")
+
+        sda = MagicMock()
+        sda.configure_mock(name="sda")
+        sda1 = MagicMock(disks=[sda])
+
+        storage.storage = MagicMock()
+        devicetree = storage.storage.devicetree
+        devicetree.get_device_by_name.side_effect = lambda name: {"sda1": sda1}.get(name)
+
+        # scheduled actions -- nothing is done
+        devicetree.actions.find.return_value = [MagicMock()]
+        with patch("blivetgui.blivet_utils.BlivetUtils._rescan_disks") as rescan, \
+             patch("blivetgui.blivet_utils.BlivetUtils._populate_new_devices") as populate:
+            self.assertFalse(storage.apply_device_events([("remove", "sda1")]))
+            rescan.assert_not_called()
+            populate.assert_not_called()
+
+        devicetree.actions.find.return_value = []
+
+        # known device changed -- its disk is scanned again
+        with patch("blivetgui.blivet_utils.BlivetUtils._rescan_disks") as rescan, \
+             patch("blivetgui.blivet_utils.BlivetUtils._populate_new_devices") as populate:
+            self.assertTrue(storage.apply_device_events([("remove", "sda1"), ("add", "sdb")]))
+            rescan.assert_called_once_with({"sda"})
+            populate.assert_not_called()
+
+        # only new devices -- no rescan needed
+        with patch("blivetgui.blivet_utils.BlivetUtils._rescan_disks") as rescan, \
+             patch("blivetgui.blivet_utils.BlivetUtils._populate_new_devices") as populate:
+            self.assertTrue(storage.apply_device_events([("add", "sdb")]))
+            rescan.assert_not_called()
+            populate.assert_called_once()
+
+    def test_storage_injection(self):
+        storage = MagicMock(devices=[])
+
+        # injected storage is used as is, without creating a new one or scanning
+        with patch("blivetgui.blivet_utils.blivet.Blivet") as blivet_cls, \
+             patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset") as reset:
+            utils = BlivetUtils(storage=storage)
+            blivet_cls.assert_not_called()
+            reset.assert_not_called()
+            storage.reset.assert_not_called()
+        self.assertIs(utils.storage, storage)
+
+    def test_parallel_format_actions(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        disks = [MagicMock(id=100 + i) for i in range(3)]
+
+        def _action(device_id, device_disks, fmt_type="ext4", create=True, format_action=True):
+            fmt = MagicMock(spec=Ext4FS, type=fmt_type, formattable=True)
+            device = MagicMock(id=device_id, disks=device_disks)
+            return MagicMock(device=device, format=fmt, is_create=create, is_destroy=not create,
+                             is_format=format_action, is_device=not format_action)
+
+        # partitions on the same disk and LV on two disks are in one group
+        part1 = _action(1, [disks[0]])
+        part2 = _action(2, [disks[0]])
+        part3 = _action(3, [disks[2]])
+        lv = _action(4, [disks[0], disks[1]])
+        # partition created in the same batch, old format removed first
+        part5 = _action(5, [disks[2]])
+        other = [_action(5, [disks[2]], format_action=False), _action(5, [disks[2]], create=False)]
+        # not a filesystem
+        luks = _action(6, [disks[1]], fmt_type="luks")
+        luks.format = MagicMock(type="luks")
+        # btrfs is created by the volume
+        btrfs = _action(7, [disks[1]], fmt_type="btrfs")
+        # something else done with the device after creating the filesystem
+        part8 = _action(8, [disks[2]])
+        resize = _action(8, [disks[2]], create=False, format_action=False)
+        resize.configure_mock(is_create=False, is_destroy=False, is_resize=True)
+
+        actions = [part1, part2, part3, lv, part5, luks, btrfs, part8, resize] + other
+        storage.storage = MagicMock(devicetree=MagicMock(actions=actions))
+
+        groups = storage._parallel_format_actions()
+        self.assertEqual(len(groups), 2)
+        self.assertCountEqual(groups[0], [part1, part2, lv])
+        self.assertCountEqual(groups[1], [part3, part5])
+
+    def test_do_it_cancel_parallel(self):
+        with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
+            storage = BlivetUtils()
+
+        def _action(action_id):
+            action = MagicMock(id=action_id, format=MagicMock(_mkfs=MagicMock(), _writelabel=MagicMock(),
+                                                              _writeuuid=MagicMock()))
+            action.device.disks = [MagicMock()]
+            return action
+
+        group = [_action(1), _action(2), _action(3)]
+        mkfs = [action.format._mkfs for action in group]
+        actions = list(group)
+        storage.storage = MagicMock(devicetree=MagicMock(actions=actions))
+
+        def _do_it(callbacks):
+            for action in list(group):
+                # the third action is cancelled before it starts
+                callbacks.report_progress(MagicMock(msg=str(action)))
+                action.format._mkfs.do_task(action.device.path)
+                actions.remove(action)
+                blivet_callbacks.callbacks.action_executed.add.call_args[0][0](action)
+
+        storage.storage.do_it.side_effect = _do_it
+
+        with patch("blivetgui.blivet_utils.BlivetUtils._parallel_format_actions", return_value=[group]), \
+             patch("blivetgui.blivet_utils.blivet.callbacks") as blivet_callbacks, \
+             patch("blivetgui.blivet_utils.blivet.udev"), \
+             patch("blivetgui.blivet_utils.copy"):
+            blivet_callbacks.create_new_callbacks_register.side_effect = lambda **kwargs: MagicMock(**kwargs)
+            _finished, result = storage.blivet_do_it(MagicMock(), cancel_check=lambda: len(actions) == 1, parallel=True)
+
+        self.assertTrue(result.cancelled)
+        self.assertIn("2 of 3", str(result.exception))
+
+        # file systems of the executed actions were created, the real tasks are back
+        mkfs[0].do_task.assert_called_once_with(group[0].device.path)
+        mkfs[1].do_task.assert_called_once_with(group[1].device.path)
+        mkfs[2].do_task.assert_not_called()
+        self.assertEqual([timing.action_id for timing in result.timings], [1, 2])
+        self.assertEqual([action.format._mkfs for action in group], mkfs)
+
+    def test_deferred_task(self):
+        task = MagicMock(available=True)
+        calls = []
+        deferred = DeferredTask(task, calls)
+
+        self.assertTrue(deferred.available)
+        deferred.do_task(options=["-F"], label=True)
+        task.do_task.assert_not_called()
+        self.assertEqual(calls, [(task, (), {"options": ["-F"], "label": True})])
+
+        # formats with the deferred tasks are copied by blivet
+        copy.deepcopy(deferred)
+
     def test_resizable(self):
         with patch("blivetgui.blivet_utils.BlivetUtils.blivet_reset", lambda _: True):
             storage = BlivetUtils()
@@ -137,5 +594,40 @@ class BlivetUtilsTest(unittest.TestCase):
         self.assertEqual(res.max_size, Size("1 GiB"))
 
 
+class ProgramTimerTest(unittest.TestCase):
+
+    def test_program_timer(self):
+        log = logging.getLogger("blivet-gui-test-program")
+        log.setLevel(logging.DEBUG)
+        timer = ProgramTimer()
+        log.addHandler(timer)
+
+        try:
+            # libblockdev, programs can run in parallel
+            log.info("Running [3] mkfs.ext4 -F /dev/sda1 ...")
+            log.info("Running [4] mkfs.xfs -f /dev/sdb1 ...")
+            log.info("stdout[3]: something")
+            log.info("...done [4] (exit code: 0)")
+            log.info("...done [3] (exit code: 0)")
+
+            # blivet
+            log.info("Running... mdadm --create /dev/md/raid")
+            log.debug("Return code: 0")
+        finally:
+            log.removeHandler(timer)
+
+        # programs from other threads
+        self.assertEqual(timer.take(threading.get_ident() + 1), [])
+
+        finished = timer.take(threading.get_ident())
+        self.assertEqual([p.command for p in finished],
+                         ["mkfs.xfs -f /dev/sdb1", "mkfs.ext4 -F /dev/sda1", "mdadm --create /dev/md/raid"])
+        self.assertTrue(all(p.duration >= 0 for p in finished))
+
+        # already taken programs are forgotten
+        self.assertEqual(timer.take(), [])
+        self.assertEqual(timer.running, {})
+
+
 if __name__ == "__main__":
     unittest.main()
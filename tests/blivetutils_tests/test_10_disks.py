@@ -64,6 +64,24 @@ class BlivetUtilsDisksTest(BlivetUtilsTestCase, DisksTestToolkit):
             self.assertEqual(len(children.partitions[0].parents), 1)
             self.assertEqual(children.partitions[0].parents[0], disk_device)
 
+    def test_15_device_snapshot(self):
+        snapshot = self.blivet_utils.get_device_snapshot()
+        self.assertEqual(snapshot.lvm + snapshot.raid + snapshot.btrfs + snapshot.stratis, [])
+
+        disks = [snapshot.devices[disk_id] for disk_id in snapshot.disks]
+        self.assertCountEqual(self.vdevs, [d.name for d in disks])
+
+        for disk in disks:
+            disk_device = self.get_blivet_device(disk.name)
+            self.assertEqual(disk.id, disk_device.id)
+            self.assertEqual(disk.size, disk_device.size)
+            self.assertTrue(disk.is_disk)
+            self.assertIsNone(disk.format_type)
+            self.assertEqual(disk.children, [])
+
+        devices = self.blivet_utils.get_devices_by_id(snapshot.disks)
+        self.assertEqual([d.name for d in devices], [d.name for d in disks])
+
     def test_20_partition_table(self):
         blivet_disk = self.get_blivet_device(self.vdevs[0])
         label = "msdos"